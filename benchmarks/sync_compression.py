@@ -0,0 +1,87 @@
+"""
+Measure the tar stream compressions used by sync and the data store on a local tree.
+
+For each of 'none', 'gzip' and 'xz' this packs the tree once into a byte counter and reports the
+packing throughput (one core), the ratio, and the time a sync would take at the given link speeds
+(compression and sending overlap, so the slower of the two wins). With --ssh the tree is also sent
+to a stand-in SSH server on localhost (tests/ssh_server.py), once per file over SFTP (sftp_upload, the
+path used before the tar stream) and once through tar_upload per mode, reporting files/s and MB/s.
+
+    python benchmarks/sync_compression.py path/to/project --links 100 1000 10000
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flowkestra.sync import TAR_MODES, choose_compression, sample_files, sftp_upload, tar_stream, tar_upload
+
+
+class _Counter:
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return len(data)
+
+
+def pack(origin_dir: Path, rel_paths, compression):
+    counter = _Counter()
+    start = time.perf_counter()
+    with tar_stream(counter, compression) as archive:
+        for rel_path in rel_paths:
+            archive.add(str(origin_dir / rel_path), arcname=rel_path)
+    return counter.bytes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("origin_dir", type=Path)
+    parser.add_argument("--links", type=float, nargs="+", default=[100, 1000, 10000], help="link speeds in Mbit/s")
+    parser.add_argument("--ssh", action="store_true", help="also upload to a local stand-in SSH server")
+    args = parser.parse_args()
+
+    origin_dir = args.origin_dir
+    rel_paths = [p.relative_to(origin_dir).as_posix() for p in sorted(origin_dir.glob("**/*")) if p.is_file()]
+    total = sum((origin_dir / p).stat().st_size for p in rel_paths)
+    auto = choose_compression(total, "auto", sample_files(origin_dir / p for p in rel_paths))
+    print(f"{len(rel_paths)} files, {total / 1e6:.1f} MB; auto -> {auto}")
+
+    header = f"{'mode':6} {'MB/s':>8} {'ratio':>6} " + " ".join(f"{f'{link:g} Mbit':>11}" for link in args.links)
+    print(header)
+    for compression in TAR_MODES:
+        packed, seconds = pack(origin_dir, rel_paths, compression)
+        sends = [max(seconds, packed * 8 / (link * 1e6)) for link in args.links]
+        print(f"{compression:6} {total / 1e6 / seconds:8.1f} {packed / total:6.2f} "
+              + " ".join(f"{s:10.2f}s" for s in sends))
+
+    if args.ssh:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "tests"))
+        from ssh_server import LocalSSHServer
+        from flowkestra.utils import SSHClient
+
+        server = LocalSSHServer()
+        client = SSHClient(server.ssh_config)
+        uploads = [("sftp", lambda workdir: sftp_upload(client, origin_dir, workdir, rel_paths))]
+        uploads += [
+            (f"tar {compression}", lambda workdir, c=compression: tar_upload(client, origin_dir, workdir, rel_paths, c))
+            for compression in TAR_MODES
+        ]
+        print(f"{'upload':10} {'seconds':>8} {'files/s':>9} {'MB/s':>8}")
+        try:
+            for name, upload in uploads:
+                with tempfile.TemporaryDirectory() as workdir:
+                    start = time.perf_counter()
+                    upload(Path(workdir))
+                    seconds = time.perf_counter() - start
+                print(f"{name:10} {seconds:8.2f} {len(rel_paths) / seconds:9.1f} {total / 1e6 / seconds:8.1f}")
+        finally:
+            client.close()
+            server.stop()
+
+if __name__ == "__main__":
+    main()
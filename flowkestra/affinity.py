@@ -0,0 +1,151 @@
+import os
+import math
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# Thread-pool sizes read by the common numeric runtimes (OpenMP, MKL, OpenBLAS, numexpr, Accelerate).
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+]
+
+
+def parse_cpu_list(value: Union[str, List[int], None]) -> List[int]:
+    """Parse a Linux cpulist ('0-3,8,10-11') or a list of ints into a sorted list of core ids."""
+    if value is None:
+        return []
+    if not isinstance(value, str):
+        return sorted({int(c) for c in value})
+    cores = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            cores.update(range(int(low), int(high) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def available_cores() -> List[int]:
+    """Cores this process may run on (respects cgroup/taskset restrictions where supported)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes() -> List[List[int]]:
+    """Core ids per NUMA node, from sysfs. A single node holding every core when unknown."""
+    nodes = []
+    for node_dir in sorted(Path("/sys/devices/system/node").glob("node[0-9]*")):
+        try:
+            cores = parse_cpu_list((node_dir / "cpulist").read_text())
+        except OSError:
+            continue
+        if cores:
+            nodes.append(cores)
+    return nodes or [available_cores()]
+
+
+def thread_env(cores: List[int]) -> Dict[str, str]:
+    """Environment capping the numeric runtimes' thread pools to the number of pinned cores."""
+    return {name: str(len(cores)) for name in THREAD_ENV_VARS}
+
+
+def pin_process(pid: int, cores: List[int]) -> bool:
+    """Restrict a running process to cores. Returns False where affinity is unsupported."""
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(pid, cores)
+        return True
+    except (ProcessLookupError, OSError):
+        # The process may already have exited, or the cores are outside our cgroup.
+        return False
+
+
+class CpuAllocator:
+    """
+    Partitions the host's cores among the local instances that are running at the same time.
+
+    Layouts:
+        even: an instance gets its share of the cores in proportion to its ``resources.cpus``
+            out of the scheduler's ``cpu_slots``, as contiguous free cores.
+        explicit: an instance pinned with ``resources.cores`` gets exactly those cores; others
+            fall back to 'even'.
+        numa: like 'even', but an instance's cores come from a single NUMA node when one has
+            enough free cores, so its memory stays local.
+    """
+
+    def __init__(self, layout: str = "even", cores: Union[str, List[int], None] = None, cpu_slots: Optional[float] = None):
+        """
+        Args:
+            layout (str): 'even', 'explicit' or 'numa'
+            cores (str or list, optional): cores to partition (default: every core available)
+            cpu_slots (float, optional): scheduler capacity that ``resources.cpus`` is measured against
+        """
+        self.layout = layout
+        self.cores = parse_cpu_list(cores) or available_cores()
+        self.cpu_slots = cpu_slots or len(self.cores)
+        allowed = set(self.cores)
+        self.nodes = [[c for c in node if c in allowed] for node in numa_nodes()] if layout == "numa" else [self.cores]
+        self.nodes = [node for node in self.nodes if node] or [self.cores]
+        self.assigned: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _share(self, cpus: float) -> int:
+        return max(1, min(len(self.cores), math.ceil(len(self.cores) * cpus / self.cpu_slots)))
+
+    def _free(self, cores: List[int]) -> List[int]:
+        taken = {c for assigned in self.assigned.values() for c in assigned}
+        return [c for c in cores if c not in taken]
+
+    def allocate(self, worker_id: str, cpus: float = 1, cores: Union[str, List[int], None] = None) -> List[int]:
+        """
+        Reserve cores for an instance and return them.
+
+        Args:
+            worker_id (str): instance id (the same id releases them)
+            cpus (float): the instance's ``resources.cpus``
+            cores (str or list, optional): the instance's explicit ``resources.cores``
+        """
+        with self._lock:
+            explicit = parse_cpu_list(cores)
+            if explicit and self.layout == "explicit":
+                self.assigned[worker_id] = explicit
+                return explicit
+
+            wanted = self._share(cpus)
+            # Prefer one node that fits the whole share, then spill over the freest nodes.
+            nodes = sorted(self.nodes, key=lambda node: len(self._free(node)), reverse=True)
+            fitting = [node for node in nodes if len(self._free(node)) >= wanted]
+            candidates = self._free(fitting[0]) if fitting else [c for node in nodes for c in self._free(node)]
+            chosen = candidates[:wanted]
+            if not chosen:
+                # Everything is taken (an oversized instance admitted on an idle scheduler, or
+                # explicit pins covering the host): share the least loaded cores instead.
+                load = {c: 0 for c in self.cores}
+                for assigned in self.assigned.values():
+                    for c in assigned:
+                        if c in load:
+                            load[c] += 1
+                chosen = sorted(sorted(self.cores, key=lambda c: load[c])[:wanted])
+            self.assigned[worker_id] = chosen
+            return chosen
+
+    def release(self, worker_id: str):
+        with self._lock:
+            self.assigned.pop(worker_id, None)
+
+
+def build_cpu_allocator(config: Optional[dict], cpu_slots: Optional[float] = None) -> Optional[CpuAllocator]:
+    """Create a CpuAllocator from the ``affinity`` config section, or None when disabled."""
+    if not config or config.get('layout', 'none') == 'none':
+        return None
+    return CpuAllocator(layout=config['layout'], cores=config.get('cores'), cpu_slots=cpu_slots)
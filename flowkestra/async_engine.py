@@ -0,0 +1,138 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from flowkestra.utils import ssh_pool
+
+
+class AsyncEngine:
+    """
+    Runs every instance of a Supervisor in one asyncio event loop instead of a thread or
+    process per instance.
+
+    Local steps are asyncio subprocesses, and so are the polls of detached remote steps. Other
+    remote steps block on an SSH channel for their whole run, so each host gets a thread pool
+    as large as the channels its steps may hold; short blocking work (step cache, cleanup) has
+    a small pool of its own and never queues behind them. Instance setup runs in a bounded pool,
+    and each instance is admitted as soon as its setup is done. Admission, status draining,
+    the monitor, step timeouts and cancellation (Ctrl-C kills the running local scripts) are
+    all handled by the loop, which keeps the per-instance overhead low for large fan-outs.
+    """
+
+    def __init__(self, supervisor, blocking_threads: int = 4):
+        """
+        Args:
+            supervisor (Supervisor): the supervisor whose instances are set up and run
+            blocking_threads (int): threads for short blocking work (step cache, cleanup)
+        """
+        self.supervisor = supervisor
+        self.blocking_threads = blocking_threads
+        self.remote_executors: Dict[Tuple[str, int, str], ThreadPoolExecutor] = {}
+
+    def _remote_executor(self, worker) -> Optional[ThreadPoolExecutor]:
+        """The thread pool of the worker's host, sized to the channels steps may hold there."""
+        ssh_client = worker.runner.ssh_client
+        if ssh_client is None:
+            return None
+        key = (ssh_client.config.hostname, ssh_client.config.port, ssh_client.config.username)
+        if key not in self.remote_executors:
+            self.remote_executors[key] = ThreadPoolExecutor(
+                max_workers=max(1, ssh_pool.max_channels_per_host - ssh_pool.control_channels),
+                thread_name_prefix=f"flowkestra-{ssh_client.config.hostname}"
+            )
+        return self.remote_executors[key]
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except KeyboardInterrupt:
+            print("\nInterrupted: running steps were cancelled.")
+
+    async def _main(self):
+        supervisor = self.supervisor
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.blocking_threads, thread_name_prefix="flowkestra-async")
+        setup_pool = ThreadPoolExecutor(max_workers=supervisor.max_concurrent_setups, thread_name_prefix="flowkestra-setup")
+        monitor = asyncio.create_task(self._monitor())
+        queue = supervisor._admission_order()
+        # Setup is blocking I/O (sync, pip); each instance starts as soon as its own setup is done.
+        setups: Dict[str, asyncio.Future] = {}
+        running: Dict[asyncio.Task, str] = {}
+
+        def submit(worker_id):
+            return loop.run_in_executor(setup_pool, supervisor._setup_instance, worker_id)
+
+        try:
+            while queue or running:
+                supervisor.status_channel.drain()
+                supervisor._dispatch_setups(queue, setups, submit)
+                for worker_id in list(queue):
+                    setup = setups.get(worker_id)
+                    if setup is None or not setup.done():
+                        continue
+                    if setup.exception():
+                        del setups[worker_id]
+                        if not supervisor._setup_failed(worker_id, setup.exception()):
+                            queue.remove(worker_id)
+                    elif supervisor._acquire(worker_id):
+                        queue.remove(worker_id)
+                        supervisor._set_phase(worker_id, 'running')
+                        worker = supervisor.workers[worker_id]
+                        task = asyncio.create_task(worker.run_async(executor, self._remote_executor(worker)))
+                        running[task] = worker_id
+
+                supervisor._apply_early_stopping()
+                # Nothing to poll: wake up exactly when a setup or an instance finishes (or, with
+                # early stopping on or pooled instances not placed yet, at least every admission
+                # interval to apply the rules / retry hosts that were down).
+                unplaced = any(worker_id not in setups for worker_id in queue)
+                waiting = set(running) | {setups[wid] for wid in queue if wid in setups and not setups[wid].done()}
+                if not waiting:
+                    if unplaced:
+                        await asyncio.sleep(supervisor._admission_interval)
+                    continue
+                finished, _ = await asyncio.wait(
+                    waiting,
+                    timeout=supervisor._admission_interval if supervisor.early_stopper or unplaced else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    if task not in running:
+                        continue
+                    worker_id = running.pop(task)
+                    if task.exception():
+                        supervisor.status_channel.reporter(worker_id).status(f"error: {task.exception()}")
+                    supervisor._release(worker_id)
+                    supervisor._set_phase(worker_id, 'done')
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            monitor.cancel()
+            await asyncio.gather(monitor, return_exceptions=True)
+            # A setup already in progress can't be interrupted; queued ones are dropped.
+            setup_pool.shutdown(wait=False, cancel_futures=True)
+            for remote_executor in self.remote_executors.values():
+                remote_executor.shutdown(wait=True, cancel_futures=True)
+            executor.shutdown(wait=True, cancel_futures=True)
+            supervisor.status_channel.drain()
+
+        if supervisor.visualize_progress:
+            if supervisor.clear_screen_on_update:
+                supervisor.clear_screen()
+            supervisor.print_status_table("Final State (All Workers Finished)")
+
+    async def _monitor(self):
+        supervisor = self.supervisor
+        while True:
+            await asyncio.sleep(supervisor._print_timing)
+            supervisor.status_channel.drain()
+            if supervisor.visualize_progress:
+                if supervisor.clear_screen_on_update:
+                    supervisor.clear_screen()
+                supervisor.print_status_table(f"Worker Monitor ({supervisor.experiment_name})")
+                print("", end="", flush=True)
+            else:
+                # Nothing to draw, but stragglers are still reported (to the events file).
+                supervisor._check_stragglers()
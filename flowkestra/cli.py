@@ -19,9 +19,39 @@ def main():
         help="Enable debug mode: shows all output, disables screen clearing, and preserves work directories."
     )
 
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Run every pipeline step, ignoring (and not updating) the step result cache."
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        default=None,
+        help="Execution engine: a thread/process per instance (default), or one asyncio event loop for large fan-outs."
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last run of this config from its journal: skip finished instances and steps, reuse intact workdirs and environments."
+    )
+
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print the schedule and makespan predicted from past run durations, without running anything."
+    )
+
     args = parser.parse_args()
 
     config_path = args.file
+    use_step_cache = False if args.no_cache else None
+
+    if args.plan:
+        Supervisor(config_path=config_path, engine=args.engine, dry_run=True).plan()
+        return
     
     if args.debug:
         print("--- Debug mode enabled ---")
@@ -30,9 +60,12 @@ def main():
             visualize_progress=True,
             clear_screen_on_update=False,
             clean_workdir_after_run=False,
-            suppress_runner_output=False
+            suppress_runner_output=False,
+            use_step_cache=use_step_cache,
+            engine=args.engine,
+            resume=args.resume
         )
     else:
-        supervisor = Supervisor(config_path=config_path)
+        supervisor = Supervisor(config_path=config_path, use_step_cache=use_step_cache, engine=args.engine, resume=args.resume)
     
     supervisor.run_all()
\ No newline at end of file
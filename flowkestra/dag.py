@@ -0,0 +1,64 @@
+from typing import Dict, List, Optional
+
+
+def resolve_dependencies(pipelines: Dict[str, dict]) -> Dict[str, List[str]]:
+    """
+    Return ``{step: [steps it depends on]}`` for an instance's pipelines.
+
+    If no step declares ``depends_on``, steps keep their historical behaviour of running
+    one after another in config order, i.e. each step depends on the previous one.
+    """
+    declared = {name: list(cfg.get('depends_on') or []) for name, cfg in pipelines.items()}
+    if any(declared.values()):
+        return declared
+
+    deps = {}
+    previous = None
+    for name in pipelines:
+        deps[name] = [previous] if previous else []
+        previous = name
+    return deps
+
+
+def find_cycle(deps: Dict[str, List[str]]) -> Optional[List[str]]:
+    """Return one dependency cycle as a list of step names, or None if the graph is acyclic."""
+    WHITE, GREY, BLACK = 0, 1, 2
+    color = {name: WHITE for name in deps}
+    stack: List[str] = []
+
+    def visit(name) -> Optional[List[str]]:
+        color[name] = GREY
+        stack.append(name)
+        for dep in deps.get(name, []):
+            if color.get(dep) == GREY:
+                return stack[stack.index(dep):] + [dep]
+            if color.get(dep) == WHITE:
+                cycle = visit(dep)
+                if cycle:
+                    return cycle
+        stack.pop()
+        color[name] = BLACK
+        return None
+
+    for name in deps:
+        if color[name] == WHITE:
+            cycle = visit(name)
+            if cycle:
+                return cycle
+    return None
+
+
+def downstream_of(deps: Dict[str, List[str]], step: str) -> List[str]:
+    """Return every step that directly or transitively depends on ``step``."""
+    dependents = {name: [] for name in deps}
+    for name, parents in deps.items():
+        for parent in parents:
+            dependents[parent].append(name)
+
+    found, todo = [], list(dependents[step])
+    while todo:
+        name = todo.pop()
+        if name not in found:
+            found.append(name)
+            todo.extend(dependents[name])
+    return found
@@ -0,0 +1,347 @@
+import os
+import json
+import uuid
+import shlex
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from flowkestra.utils import SSHClient, quote_path
+from flowkestra.sync import file_digest, reflink_or_copy, choose_compression, remote_has_tar, sample_files, tar_stream, TAR_MODES
+from flowkestra.venv_cache import hold_lock
+
+BLOBS_DIR = "blobs"
+REFS_DIR = "refs"
+INCOMING_DIR = "incoming"
+# Supervisor-side cache of source file digests, so unchanged datasets are only stat'ed.
+DIGESTS_DIR = "digests"
+LOCK_NAME = ".lock"
+
+
+class DataStore:
+    """
+    Host-level content-addressed store for large input files.
+
+    Every file of an instance's source tree of at least ``min_size_bytes`` is keyed by its
+    sha256 and transferred to a host at most once, into ``<store_dir>/blobs/<ab>/<sha256>``.
+    Workdirs then get a hardlink (or symlink) to the blob instead of their own copy, so N
+    instances sharing a dataset on one host cost one transfer and one copy on disk.
+
+    Each workdir holds a reference (``refs/<id>``: the blobs it links), dropped when the
+    workdir is cleaned. Once the store exceeds ``max_size_gb``, unreferenced blobs that no
+    workdir still links to are collected, oldest first. Checking, uploading, linking and
+    collecting all happen under the store's ``mkdir`` lock, so concurrent workers never upload
+    the same blob twice nor collect one that is being linked.
+
+    Blobs are read-only: a step may replace a linked input file but not modify it in place.
+    """
+
+    def __init__(self, store_dir, ssh_client: SSHClient = None, min_size_bytes=1024 * 1024, link_mode="hardlink",
+                 max_size_gb=None, lock_timeout=1800, transfer="auto", compression="auto", suppress_output=True):
+        """
+        Args:
+            store_dir (str): store root on each host (``~`` is expanded)
+            ssh_client (SSHClient, optional): if provided, the store lives on the remote host
+            min_size_bytes (int): files at least this large go through the store
+            link_mode (str): 'hardlink' or 'symlink'; hardlinks fall back to copies across filesystems
+            max_size_gb (float, optional): collect unreferenced blobs beyond this size (None: never)
+            lock_timeout (int): seconds after its holder's last heartbeat before the store lock is taken over
+            transfer (str): 'auto', 'tar' or 'sftp' for remote uploads
+            compression (str): compression of the remote tar stream ('auto', 'none', 'gzip', 'xz')
+            suppress_output (bool): If True, do not print store details.
+        """
+        self.ssh_client = ssh_client
+        self.store_dir = Path(store_dir) if ssh_client else Path(store_dir).expanduser()
+        self.digest_dir = Path(store_dir).expanduser() / DIGESTS_DIR
+        self.min_size_bytes = min_size_bytes
+        self.link_mode = link_mode
+        self.max_size_gb = max_size_gb
+        self.lock_timeout = lock_timeout
+        self.transfer = transfer
+        self.compression = compression
+        self.suppress_output = suppress_output
+        # Absolute remote store path, resolved on first contact so it can be quoted safely.
+        self._root = None
+
+    @staticmethod
+    def blob_path(sha256: str) -> str:
+        return f"{sha256[:2]}/{sha256}"
+
+    @staticmethod
+    def ref_id(workdir) -> str:
+        return hashlib.sha256(str(workdir).encode()).hexdigest()[:16]
+
+    def _log(self, message):
+        if not self.suppress_output:
+            print(message)
+
+    # ---------- selection ----------
+    def select(self, origin_dir) -> Dict[str, dict]:
+        """
+        Return the files of origin_dir that go through the store, as
+        ``{rel_path: {size, mtime, sha256}}``. Digests of unchanged files are reused.
+        """
+        origin_dir = Path(origin_dir)
+        cache_path = self.digest_dir / f"{hashlib.sha256(str(origin_dir.resolve()).encode()).hexdigest()[:16]}.json"
+        try:
+            previous = json.loads(cache_path.read_text())
+        except (OSError, ValueError):
+            previous = {}
+
+        entries = {}
+        for src_path in origin_dir.glob("**/*"):
+            if not src_path.is_file():
+                continue
+            st = src_path.stat()
+            if st.st_size < self.min_size_bytes:
+                continue
+            rel_path = src_path.relative_to(origin_dir).as_posix()
+            entry = {'size': st.st_size, 'mtime': int(st.st_mtime)}
+            old = previous.get(rel_path)
+            if old and old['size'] == entry['size'] and old['mtime'] == entry['mtime']:
+                entry['sha256'] = old['sha256']
+            else:
+                entry['sha256'] = file_digest(src_path)
+            entries[rel_path] = entry
+
+        if entries != previous:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex[:8]}")
+            tmp_path.write_text(json.dumps(entries))
+            os.replace(tmp_path, cache_path)
+        return entries
+
+    # ---------- entry points ----------
+    def stage(self, origin_dir, workdir, entries: Dict[str, dict]) -> dict:
+        """
+        Make sure every entry's blob is on the host, link the entries into workdir and record
+        workdir's reference. Returns counters of what was done.
+
+        Args:
+            origin_dir (str or Path): local source tree the entries are relative to
+            workdir (str or Path): target workdir (local or remote)
+            entries (dict): the result of select()
+        """
+        origin_dir = Path(origin_dir)
+        workdir = Path(workdir)
+        # One source file per distinct content is enough.
+        sources = {entry['sha256']: rel_path for rel_path, entry in entries.items()}
+        with hold_lock(self.store_dir / LOCK_NAME, self.ssh_client, self.lock_timeout, poll_interval=0.5):
+            missing = self._missing(sorted(sources))
+            if missing:
+                self._upload(origin_dir, {sha256: sources[sha256] for sha256 in missing})
+            self._link(workdir, entries)
+            if self.max_size_gb is not None:
+                self._collect()
+
+        stats = {
+            'files': len(entries),
+            'bytes': sum(entry['size'] for entry in entries.values()),
+            'uploaded': len(missing),
+            'uploaded_bytes': sum(entries[sources[sha256]]['size'] for sha256 in missing),
+        }
+        self._log(f"Data store {self.store_dir}: linked {stats['files']} files into {workdir}, "
+                  f"uploaded {stats['uploaded']} new blobs ({stats['uploaded_bytes']} bytes)")
+        return stats
+
+    def release(self, workdir):
+        """Drop workdir's reference, making its blobs collectable (once nothing links to them)."""
+        ref = f"{REFS_DIR}/{self.ref_id(Path(workdir))}"
+        if self.ssh_client:
+            self.ssh_client.execute(f"rm -f {quote_path(self.store_dir)}/{ref}", suppress_output=True)
+        else:
+            try:
+                (self.store_dir / ref).unlink()
+            except FileNotFoundError:
+                pass
+
+    def collect(self):
+        """Garbage-collect unreferenced blobs down to max_size_gb."""
+        if self.max_size_gb is None:
+            return
+        with hold_lock(self.store_dir / LOCK_NAME, self.ssh_client, self.lock_timeout, poll_interval=0.5):
+            self._collect()
+
+    # ---------- local/remote primitives (store lock held) ----------
+    def _missing(self, hashes: List[str]) -> List[str]:
+        if not self.ssh_client:
+            return [h for h in hashes if not (self.store_dir / BLOBS_DIR / self.blob_path(h)).exists()]
+
+        store = quote_path(self.store_dir)
+        out, err, exit_status = self.ssh_client.pipe(
+            f"mkdir -p {store}/{BLOBS_DIR} {store}/{REFS_DIR} && cd {store} && pwd "
+            f"&& cd {BLOBS_DIR} && while read -r p; do [ -f \"$p\" ] || echo \"$p\"; done",
+            lambda stdin: stdin.write("".join(f"{self.blob_path(h)}\n" for h in hashes))
+        )
+        if exit_status != 0:
+            raise RuntimeError(f"Data store {self.store_dir} on {self.ssh_client.config.hostname} failed: {err}")
+        lines = out.splitlines()
+        self._root = lines[0]
+        return [line.rsplit("/", 1)[-1] for line in lines[1:] if line]
+
+    def _upload(self, origin_dir: Path, sources: Dict[str, str]):
+        """Copy one source file per missing blob into the store, atomically per blob."""
+        if not self.ssh_client:
+            for sha256, rel_path in sources.items():
+                blob = self.store_dir / BLOBS_DIR / self.blob_path(sha256)
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = blob.with_name(f".{sha256}.{uuid.uuid4().hex[:8]}")
+                reflink_or_copy(origin_dir / rel_path, tmp_path)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, blob)
+            return
+
+        root = shlex.quote(self._root)
+        incoming = f"{INCOMING_DIR}/{uuid.uuid4().hex}"
+        blob_paths = {sha256: self.blob_path(sha256) for sha256 in sources}
+        transfer = self.transfer
+        if transfer == "auto":
+            transfer = "tar" if remote_has_tar(self.ssh_client) else "sftp"
+
+        if transfer == "tar":
+            total_bytes = sum((origin_dir / rel_path).stat().st_size for rel_path in sources.values())
+            sample = sample_files(origin_dir / rel_path for rel_path in sources.values()) if self.compression == "auto" else None
+            compression = choose_compression(total_bytes, self.compression, sample)
+            tar_flag = TAR_MODES[compression][1]
+
+            def write_archive(stdin):
+                with tar_stream(stdin, compression) as archive:
+                    for sha256, rel_path in sources.items():
+                        archive.add(str(origin_dir / rel_path), arcname=blob_paths[sha256], recursive=False)
+
+            _, err, exit_status = self.ssh_client.pipe(
+                f"mkdir -p {root}/{incoming} && cd {root}/{incoming} && tar -x{tar_flag}f -", write_archive
+            )
+            if exit_status != 0:
+                raise RuntimeError(f"Uploading blobs to {self._root} failed: {err}")
+        else:
+            shards = sorted({path.split("/")[0] for path in blob_paths.values()})
+            self.ssh_client.execute(
+                "mkdir -p " + " ".join(f"{root}/{incoming}/{shard}" for shard in shards), suppress_output=True
+            )
+            for sha256, rel_path in sources.items():
+                self.ssh_client.upload(str(origin_dir / rel_path), f"{self._root}/{incoming}/{blob_paths[sha256]}")
+
+        # Blobs only appear under blobs/ once complete; an interrupted upload leaves incoming/ debris.
+        self.ssh_client.run_batch([
+            f"cd {root}/{incoming} && chmod a-w */* && for d in *; do "
+            f"mkdir -p ../../{BLOBS_DIR}/$d && mv -f $d/* ../../{BLOBS_DIR}/$d/ || exit 1; done",
+            f"rm -rf {root}/{INCOMING_DIR}",
+        ]).raise_for_status()
+
+    def _link(self, workdir: Path, entries: Dict[str, dict]):
+        """Link every entry into workdir and write workdir's reference."""
+        blob_paths = sorted({self.blob_path(entry['sha256']) for entry in entries.values()})
+        ref = f"{REFS_DIR}/{self.ref_id(workdir)}"
+
+        if not self.ssh_client:
+            for rel_path, entry in entries.items():
+                blob = self.store_dir / BLOBS_DIR / self.blob_path(entry['sha256'])
+                dest = workdir / rel_path
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                if dest.exists() or dest.is_symlink():
+                    dest.unlink()
+                if self.link_mode == "symlink":
+                    os.symlink(blob, dest)
+                    continue
+                try:
+                    os.link(blob, dest)
+                except OSError:
+                    # Workdir on another filesystem than the store.
+                    shutil.copy2(blob, dest)
+            (self.store_dir / REFS_DIR).mkdir(parents=True, exist_ok=True)
+            (self.store_dir / ref).write_text("".join(f"{path}\n" for path in blob_paths))
+            return
+
+        root = shlex.quote(self._root)
+        link = "ln -s" if self.link_mode == "symlink" else "ln"
+        parents = sorted({Path(rel_path).parent.as_posix() for rel_path in entries} - {"."})
+        mkdirs = "".join(f" && mkdir -p {shlex.quote(p)}" for p in parents)
+        # The reference lists what was actually linked.
+        script = (
+            f"mkdir -p {quote_path(workdir)} && cd {quote_path(workdir)}{mkdirs} && "
+            f"while IFS=\"$(printf '\\t')\" read -r b p; do "
+            f"rm -f \"$p\" && {{ {link} {root}/{BLOBS_DIR}/\"$b\" \"$p\" 2>/dev/null "
+            f"|| cp {root}/{BLOBS_DIR}/\"$b\" \"$p\"; }} || exit 1; echo \"$b\"; "
+            f"done > {root}/{ref}.tmp && sort -u {root}/{ref}.tmp > {root}/{ref} && rm -f {root}/{ref}.tmp"
+        )
+        _, err, exit_status = self.ssh_client.pipe(
+            script,
+            lambda stdin: stdin.write("".join(
+                f"{self.blob_path(entry['sha256'])}\t{rel_path}\n" for rel_path, entry in entries.items()
+            ))
+        )
+        if exit_status != 0:
+            raise RuntimeError(f"Linking data store files into {workdir} failed: {err}")
+
+    def _collect(self):
+        """Delete unreferenced, unlinked blobs, oldest first, until the store fits max_size_gb."""
+        limit = self.max_size_gb * 1024 ** 3
+        if not self.ssh_client:
+            referenced = set()
+            for ref in (self.store_dir / REFS_DIR).glob("*"):
+                if ref.suffix != ".tmp":
+                    referenced.update(ref.read_text().split())
+            blobs = []
+            for blob in (self.store_dir / BLOBS_DIR).glob("*/*"):
+                st = blob.stat()
+                blobs.append((st.st_mtime, st.st_size, st.st_nlink, blob))
+            total = sum(size for _, size, _, _ in blobs)
+            doomed = []
+            for _, size, nlink, blob in sorted(blobs):
+                if total <= limit:
+                    break
+                if nlink == 1 and f"{blob.parent.name}/{blob.name}" not in referenced:
+                    doomed.append(blob)
+                    total -= size
+            for blob in doomed:
+                blob.unlink()
+            return
+
+        # `ls -lntr`: link count in field 2, size in field 5, oldest first.
+        out, _ = self.ssh_client.execute(
+            f"cd {quote_path(self.store_dir)} && find {BLOBS_DIR} -type f -exec ls -lntrd {{}} + ; "
+            f"echo ---refs---; cat {REFS_DIR}/* 2>/dev/null",
+            suppress_output=True
+        )
+        listing, _, refs = out.partition("---refs---")
+        referenced = set(refs.split())
+        blobs = []
+        for line in listing.splitlines():
+            fields = line.split()
+            if len(fields) >= 7 and fields[4].isdigit():
+                blobs.append((int(fields[1]), int(fields[4]), fields[-1]))
+        total = sum(size for _, size, _ in blobs)
+        doomed = []
+        for nlink, size, path in blobs:
+            if total <= limit:
+                break
+            if nlink == 1 and path.split("/", 1)[-1] not in referenced:
+                doomed.append(path)
+                total -= size
+        if doomed:
+            self.ssh_client.pipe(
+                f"cd {quote_path(self.store_dir)} && xargs rm -f",
+                lambda stdin: stdin.write("".join(f"{path}\n" for path in doomed))
+            )
+            self._log(f"Data store {self.store_dir}: collected {len(doomed)} unreferenced blobs")
+
+
+def build_data_store(config: Optional[dict], ssh_client: SSHClient = None, sync_config: Optional[dict] = None,
+                     suppress_output=True) -> Optional[DataStore]:
+    """Create a DataStore from the ``data_store`` config section, or None when disabled."""
+    if not config or not config.get('enabled'):
+        return None
+    sync_config = sync_config or {}
+    return DataStore(
+        store_dir=config['store_dir'],
+        ssh_client=ssh_client,
+        min_size_bytes=int(config.get('min_size_kb', 1024) * 1024),
+        link_mode=config.get('link_mode', 'hardlink'),
+        max_size_gb=config.get('max_size_gb'),
+        lock_timeout=config.get('lock_timeout', 1800),
+        transfer=sync_config.get('transfer', 'auto'),
+        compression=sync_config.get('compression', 'auto'),
+        suppress_output=suppress_output
+    )
@@ -0,0 +1,215 @@
+import os
+import time
+import shlex
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flowkestra.utils import SSHClient, quote_path
+
+# Per-step job directory (pid, exit code, stdout, stderr) under the instance's workdir.
+JOBS_DIR = ".flowkestra-jobs"
+DEFAULT_POLL_INTERVAL = 5.0
+# Bytes of new output read per stream, job and poll.
+MAX_READ_BYTES = 1024 * 1024
+MARKER = b"@@flowkestra-job"
+# Exit status reported for a job whose launcher vanished without recording one (e.g. a reboot).
+LOST_RETURNCODE = 255
+
+
+def job_dir(workdir, key: str) -> str:
+    return f"{workdir}/{JOBS_DIR}/{key}"
+
+
+def launch_command(workdir, key: str, command: str) -> str:
+    """
+    Shell command that starts command (a full remote command line, as run by the held-channel
+    mode) detached from the SSH session, and returns at once.
+
+    The job survives the channel and the connection: it runs under nohup in its own session
+    (setsid, where available) with its output in ``<job dir>/stdout`` and ``stderr``, the
+    launcher's pid in ``pid``, and its exit status written to ``exit`` when it ends.
+    """
+    rel = f"{JOBS_DIR}/{key}"
+    # $1 is the absolute job dir; exit is renamed into place so a poll never reads it half-written.
+    wrapper = f'sh -c {shlex.quote(command)}; echo $? > "$1/exit.tmp"; mv "$1/exit.tmp" "$1/exit"'
+    return (
+        f"J=$(cd {quote_path(workdir)} && mkdir -p {rel} && cd {rel} && pwd) || exit 1; "
+        f"nohup $(command -v setsid) sh -c {shlex.quote(wrapper)} sh \"$J\" "
+        f"> \"$J/stdout\" 2> \"$J/stderr\" < /dev/null & echo $! > \"$J/pid\""
+    )
+
+
+def parse_poll_output(data: bytes) -> Dict[str, Dict[str, bytes]]:
+    """Split a batched poll's output into {key: {'status', 'stdout', 'stderr'}}."""
+    body = data.rsplit(b"\n" + MARKER + b"-end", 1)[0]
+    sections: Dict[str, Dict[str, bytes]] = {}
+    for section in body.split(b"\n" + MARKER + b" ")[1:]:
+        header, _, content = section.partition(b"\n")
+        key, _, kind = header.decode(errors="replace").partition(" ")
+        sections.setdefault(key, {})[kind] = content
+    return sections
+
+
+class DetachedJob:
+    """A step launched detached on a remote host, followed by the host's JobTracker."""
+
+    def __init__(self, key: str, path: str, on_data: Callable[[str, bytes], None], cleanup: List[str] = ()):
+        self.key = key
+        self.path = path
+        self.on_data = on_data
+        # Remote files removed with the job dir once the job is done.
+        self.cleanup = list(cleanup)
+        self.offsets = {'stdout': 0, 'stderr': 0}
+        self.returncode: Optional[int] = None
+        self.lost = False
+        self.done = threading.Event()
+        self._callbacks: List[Callable[["DetachedJob"], None]] = []
+        self._lock = threading.Lock()
+
+    def add_done_callback(self, callback: Callable[["DetachedJob"], None]):
+        """Call callback(job) from the tracker thread when the job ends (at once if it has)."""
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, returncode: int, lost=False):
+        with self._lock:
+            self.returncode = returncode
+            self.lost = lost
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class JobTracker:
+    """
+    Follows every detached job on one host.
+
+    Like the resource sampler and the metric reader, one background thread per host (and per
+    worker process) polls all jobs at once: a single batched command per interval reports each
+    job's state and the output it wrote since the last poll, which is handed to the job's
+    ``on_data``. A failed poll (dropped connection, host rebooting) is simply retried on the next
+    interval; the SSH client reconnects on demand and the jobs keep running meanwhile.
+    """
+
+    def __init__(self, ssh_client: SSHClient, interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        Args:
+            ssh_client (SSHClient): host the jobs run on
+            interval (float): seconds between polls
+        """
+        self.ssh_client = ssh_client
+        self.interval = interval
+        self._jobs: Dict[str, DetachedJob] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def track(self, job: DetachedJob) -> DetachedJob:
+        with self._lock:
+            self._jobs[job.key] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True, name="flowkestra-jobs")
+                self._thread.start()
+        return job
+
+    def untrack(self, key: str):
+        """Stop following a job (e.g. abandoned after a timeout) without waiting for it to end."""
+        with self._lock:
+            self._jobs.pop(key, None)
+
+    def _command(self, jobs: Dict[str, DetachedJob]) -> str:
+        script = []
+        for key, job in jobs.items():
+            path = quote_path(job.path)
+            script.append(
+                f"printf '\\n{MARKER.decode()} %s status\\n' {key}; "
+                f"if [ -f {path}/exit ]; then echo \"exit $(cat {path}/exit)\"; "
+                f"elif kill -0 \"$(cat {path}/pid 2>/dev/null)\" 2>/dev/null; then echo running; else echo lost; fi"
+            )
+            for stream in ('stdout', 'stderr'):
+                script.append(
+                    f"printf '\\n{MARKER.decode()} %s {stream}\\n' {key}; "
+                    f"tail -c +{job.offsets[stream] + 1} {path}/{stream} 2>/dev/null | head -c {MAX_READ_BYTES}"
+                )
+        # The end marker keeps the last job's trailing output intact.
+        return "; ".join(script) + f"; printf '\\n{MARKER.decode()}-end\\n'"
+
+    def _poll(self, jobs: Dict[str, DetachedJob]):
+        chunks = []
+        try:
+            self.ssh_client.read_stream(self._command(jobs), lambda stdout: chunks.append(stdout.read()))
+        except Exception:
+            return  # e.g. a dropped connection: try again on the next poll
+        finished = []
+        for key, section in parse_poll_output(b"".join(chunks)).items():
+            job = jobs.get(key)
+            if job is None:
+                continue
+            complete = True
+            for stream in ('stdout', 'stderr'):
+                data = section.get(stream, b"")
+                if data:
+                    job.offsets[stream] += len(data)
+                    try:
+                        job.on_data(stream, data)
+                    except Exception:
+                        pass
+                # A full read may have left more output behind: finish on a later poll.
+                complete = complete and len(data) < MAX_READ_BYTES
+            status = section.get('status', b"").decode(errors="replace").split()
+            if not complete or not status or status[0] == 'running':
+                continue
+            if status[0] == 'exit' and len(status) > 1 and status[1].lstrip("-").isdigit():
+                finished.append((job, int(status[1]), False))
+            elif status[0] == 'lost':
+                finished.append((job, LOST_RETURNCODE, True))
+
+        if not finished:
+            return
+        with self._lock:
+            for job, _, _ in finished:
+                self._jobs.pop(job.key, None)
+        try:
+            paths = [path for job, _, _ in finished for path in [job.path, *job.cleanup]]
+            self.ssh_client.execute("rm -rf " + " ".join(paths), suppress_output=True)
+        except Exception:
+            pass  # only leftovers; the job's result is already known
+        for job, returncode, lost in finished:
+            job._finish(returncode, lost)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                jobs = dict(self._jobs)
+                if not jobs:
+                    self._thread = None
+                    return
+            self._poll(jobs)
+
+
+_trackers: Dict[Tuple[int, float], JobTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # A forked worker process starts its own tracker threads.
+    global _trackers_lock
+    _trackers.clear()
+    _trackers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def job_tracker_for(ssh_client: SSHClient, interval: float = DEFAULT_POLL_INTERVAL) -> JobTracker:
+    """The process-wide tracker of a host's detached jobs."""
+    key = (id(ssh_client), interval)
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = JobTracker(ssh_client, interval)
+        return _trackers[key]
@@ -0,0 +1,306 @@
+import os
+import json
+import math
+import time
+import shlex
+import statistics
+import subprocess
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flowkestra.utils import SSHClient, quote_path
+
+# Set in every step's environment next to MLFLOW_TRACKING_URI when early stopping is on.
+METRICS_ENV = "FLOWKESTRA_METRICS_FILE"
+METRICS_FILE_PREFIX = ".flowkestra-metrics-"
+# How long a stopped script gets to exit on SIGTERM before it is killed.
+STOP_GRACE_SECONDS = 10
+# How often a running script checks whether it was asked to stop.
+STOP_POLL_SECONDS = 0.5
+# Bytes of new metric lines read per file and poll.
+MAX_READ_BYTES = 1024 * 1024
+MARKER = "@@flowkestra-metrics"
+
+
+class EarlyStopped(subprocess.SubprocessError):
+    """Result of a step terminated by the early-stopping rules."""
+
+    def __init__(self, cmd, output=None):
+        self.cmd = cmd
+        self.output = output
+        self.returncode = None
+
+    def __str__(self):
+        return f"Command '{self.cmd}' was stopped early"
+
+
+def remote_terminate_command(pidfile: str, grace=STOP_GRACE_SECONDS) -> str:
+    """SIGTERM the process recorded in pidfile now, SIGKILL it after grace seconds if still alive."""
+    kill_later = shlex.quote(f"sleep {grace}; kill -KILL $1 2>/dev/null")
+    return (
+        f"p=$(cat \"{pidfile}\" 2>/dev/null); if [ -n \"$p\" ]; then kill -TERM $p 2>/dev/null; "
+        f"nohup sh -c {kill_later} sh $p >/dev/null 2>&1 </dev/null & fi"
+    )
+
+
+def parse_metric_lines(data: bytes) -> Tuple[List[dict], int]:
+    """
+    Parse the complete lines of data as metrics. Returns (metrics, bytes consumed); a trailing
+    partial line is left for the next read. Lines that aren't ``{"name", "value"}`` JSON are skipped.
+    """
+    end = data.rfind(b"\n") + 1
+    metrics = []
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict) and 'name' in record and math.isfinite(float(record['value'])):
+                metrics.append(record)
+        except (ValueError, TypeError):
+            continue
+    return metrics, end
+
+
+class MetricTail:
+    """
+    Follows the metric files of every running step on one host.
+
+    Like the resource sampler, one background thread per host (and per worker process) polls
+    all files at once: direct reads locally, a single batched ``tail -c`` per interval for a
+    remote host. New complete lines are parsed and handed to each file's callback.
+    """
+
+    def __init__(self, ssh_client: SSHClient = None, interval: float = 2.0):
+        """
+        Args:
+            ssh_client (SSHClient, optional): host whose files are read (local if omitted)
+            interval (float): seconds between polls
+        """
+        self.ssh_client = ssh_client
+        self.interval = interval
+        self._watches: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, key: str, path, callback: Callable[[dict], None]):
+        """Start following path (local, or on the remote host); callback receives each metric dict."""
+        with self._lock:
+            self._watches[key] = {'path': str(path), 'offset': 0, 'callback': callback}
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True, name="flowkestra-metrics")
+                self._thread.start()
+
+    def unwatch(self, key: str):
+        """Deliver what is left in the file, then stop following it."""
+        with self._lock:
+            watch = self._watches.get(key)
+        if watch:
+            self._poll({key: watch})
+        with self._lock:
+            self._watches.pop(key, None)
+
+    def _read(self, watches: Dict[str, dict]) -> Dict[str, bytes]:
+        if not self.ssh_client:
+            chunks = {}
+            for key, watch in watches.items():
+                try:
+                    with open(watch['path'], "rb") as f:
+                        f.seek(watch['offset'])
+                        chunks[key] = f.read(MAX_READ_BYTES)
+                except OSError:
+                    continue
+            return chunks
+
+        script = [
+            f"printf '\\n{MARKER} %s\\n' {shlex.quote(key)}; "
+            f"tail -c +{watch['offset'] + 1} {quote_path(watch['path'])} 2>/dev/null | head -c {MAX_READ_BYTES}"
+            for key, watch in watches.items()
+        ]
+        # The end marker keeps the last file's trailing newline from being stripped.
+        out, _ = self.ssh_client.execute("; ".join(script) + f"; printf '\\n{MARKER}-end\\n'", suppress_output=True)
+        text = ("\n" + out).rsplit(f"\n{MARKER}-end", 1)[0]
+        chunks = {}
+        for section in text.split(f"\n{MARKER} ")[1:]:
+            key, _, content = section.partition("\n")
+            chunks[key] = content.encode()
+        return chunks
+
+    def _poll(self, watches: Dict[str, dict]):
+        try:
+            chunks = self._read(watches)
+        except Exception:
+            return  # e.g. a dropped connection: try again on the next poll
+        for key, data in chunks.items():
+            watch = watches[key]
+            metrics, consumed = parse_metric_lines(data)
+            watch['offset'] += consumed
+            for metric in metrics:
+                try:
+                    watch['callback'](metric)
+                except Exception:
+                    pass
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watches = dict(self._watches)
+                if not watches:
+                    self._thread = None
+                    return
+            self._poll(watches)
+
+
+_tails: Dict[Tuple[int, float], MetricTail] = {}
+_tails_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # A forked worker process starts its own reader threads.
+    global _tails_lock
+    _tails.clear()
+    _tails_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def metric_tail_for(ssh_client: SSHClient = None, interval: float = 2.0) -> MetricTail:
+    """The process-wide metric reader of a host (local when ssh_client is None)."""
+    key = (id(ssh_client) if ssh_client else 0, interval)
+    with _tails_lock:
+        if key not in _tails:
+            _tails[key] = MetricTail(ssh_client, interval)
+        return _tails[key]
+
+
+class EarlyStopper:
+    """
+    Decides which trials to stop from the intermediate metrics of their siblings.
+
+    Rules:
+        median: stop a trial whose best value so far at iteration t is worse than the median of
+            its siblings' running averages up to t (siblings that reached t).
+        successive_halving: rungs at ``min_iterations * eta**k``; a trial reaching a rung
+            continues only if it ranks in the top 1/eta of the siblings that reached that rung
+            (asynchronous successive halving: promotions are never taken back).
+
+    Siblings are the other trials of the same sweep (or all plain instances), running or finished.
+    """
+
+    def __init__(self, metric: str, mode="min", rule="median", min_iterations=1, min_peers=3, eta=3):
+        """
+        Args:
+            metric (str): name of the reported metric to compare
+            mode (str): 'min' if lower is better, 'max' if higher is better
+            rule (str): 'median' or 'successive_halving'
+            min_iterations (int): no trial is stopped before reporting this iteration (first rung)
+            min_peers (int): minimum number of siblings needed to compare (median rule)
+            eta (int): reduction factor between rungs (successive halving)
+        """
+        self.metric = metric
+        self.mode = mode
+        self.rule = rule
+        self.min_iterations = max(1, min_iterations)
+        self.min_peers = min_peers
+        self.eta = eta
+        self._promoted = set()
+
+    def _better(self, a: float, b: float) -> bool:
+        return a < b if self.mode == "min" else a > b
+
+    def _best_upto(self, curve: List[Tuple[float, float]], iteration: float) -> Optional[float]:
+        values = [v for it, v in curve if it <= iteration]
+        if not values:
+            return None
+        return min(values) if self.mode == "min" else max(values)
+
+    def _median_reason(self, worker_id, curves) -> Optional[str]:
+        curve = curves[worker_id]
+        iteration = curve[-1][0]
+        if iteration < self.min_iterations:
+            return None
+        averages = []
+        for other_id, other in curves.items():
+            if other_id == worker_id or not other or other[-1][0] < iteration:
+                continue
+            values = [v for it, v in other if it <= iteration]
+            # A sibling reporting on a coarser grid may have no point up to t: it can't be compared.
+            if values:
+                averages.append(statistics.mean(values))
+        if len(averages) < self.min_peers:
+            return None
+        best = self._best_upto(curve, iteration)
+        median = statistics.median(averages)
+        if self._better(median, best):
+            return f"{self.metric} {best:.4g} at {iteration:g} worse than sibling median {median:.4g}"
+        return None
+
+    def _halving_reason(self, worker_id, curves) -> Optional[str]:
+        iteration = curves[worker_id][-1][0]
+        rung = self.min_iterations
+        while rung * self.eta <= iteration:
+            rung *= self.eta
+        if iteration < rung or (worker_id, rung) in self._promoted:
+            return None
+        reached = {
+            other_id: self._best_upto(other, rung)
+            for other_id, other in curves.items()
+            if other and other[-1][0] >= rung
+        }
+        # Trials whose first point is already past the rung have no value at it to rank by.
+        reached = {other_id: value for other_id, value in reached.items() if value is not None}
+        if worker_id not in reached:
+            return None
+        if len(reached) < self.eta:
+            # Too few siblings at this rung to rank: continue optimistically.
+            self._promoted.add((worker_id, rung))
+            return None
+        ranked = sorted(reached, key=lambda wid: reached[wid], reverse=self.mode == "max")
+        keep = max(1, len(ranked) // self.eta)
+        if worker_id in ranked[:keep]:
+            self._promoted.add((worker_id, rung))
+            return None
+        return f"{self.metric} {reached[worker_id]:.4g} not in the top 1/{self.eta} at rung {rung:g}"
+
+    def decide(self, curves: Dict[str, List[Tuple[float, float]]], running: List[str]) -> Dict[str, str]:
+        """
+        Return {worker_id: reason} for the running trials to stop.
+
+        Args:
+            curves (dict): worker_id -> [(iteration, value), ...] of the metric, for one sibling group
+            running (list): ids of the trials currently running (only these can be stopped)
+        """
+        decisions = {}
+        for worker_id in running:
+            if not curves.get(worker_id):
+                continue
+            if self.rule == "successive_halving":
+                reason = self._halving_reason(worker_id, curves)
+            else:
+                reason = self._median_reason(worker_id, curves)
+            if reason:
+                decisions[worker_id] = reason
+        return decisions
+
+
+def metric_curves(table: Dict[str, dict], metric: str) -> Dict[str, List[Tuple[float, float]]]:
+    """The metric's (iteration, value) series per instance from the status channel's table."""
+    return {
+        worker_id: sorted((it, value) for it, value in row.get('metrics', {}).get(metric, []))
+        for worker_id, row in table.items()
+    }
+
+
+def build_early_stopper(config: Optional[dict]) -> Optional[EarlyStopper]:
+    """Create an EarlyStopper from the ``early_stopping`` config section, or None when disabled."""
+    if not config or not config.get('enabled'):
+        return None
+    return EarlyStopper(
+        metric=config['metric'],
+        mode=config.get('mode', 'min'),
+        rule=config.get('rule', 'median'),
+        min_iterations=config.get('min_iterations', 1),
+        min_peers=config.get('min_peers', 3),
+        eta=config.get('eta', 3)
+    )
@@ -0,0 +1,133 @@
+import json
+import time
+import queue
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Resource samples kept per instance for the monitor (the full series is in the step's JSONL).
+RESOURCE_HISTORY = 32
+
+
+class StatusReporter:
+    """Pushes one worker's status events onto the shared channel. Cheap, non-blocking, picklable."""
+
+    def __init__(self, worker_id: str, events_queue):
+        self.worker_id = worker_id
+        self._queue = events_queue
+
+    def emit(self, kind: str, **fields):
+        self._queue.put({'worker_id': self.worker_id, 'ts': time.time(), 'kind': kind, **fields})
+
+    def status(self, value: str):
+        self.emit('status', value=value)
+
+    def phase(self, value: str):
+        self.emit('phase', value=value)
+
+    def step_start(self, step: str):
+        self.emit('step_start', step=step)
+
+    def step_end(self, step: str, exit_code: Optional[int], state: str):
+        self.emit('step_end', step=step, exit_code=exit_code, state=state)
+
+    def log(self, line: str):
+        self.emit('log', value=line)
+
+
+class StatusChannel:
+    """
+    One-way event channel from workers (threads or processes) to the supervisor.
+
+    Workers push small timestamped events through a ``multiprocessing.Queue``; the supervisor
+    drains it and folds the events into a plain in-process table, so reading the status
+    costs no IPC and no manager server process is needed. Events themselves are not kept in
+    memory (only in the optional events file): the table is all the supervisor holds.
+    """
+
+    def __init__(self, events_file: Optional[str] = None):
+        """
+        Args:
+            events_file (str, optional): if given, every event is appended to this JSONL file
+        """
+        self._queue = multiprocessing.Queue()
+        self.table: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._events_file = None
+        if events_file:
+            Path(events_file).parent.mkdir(parents=True, exist_ok=True)
+            self._events_file = open(events_file, "a")
+
+    def reporter(self, worker_id: str) -> StatusReporter:
+        return StatusReporter(worker_id, self._queue)
+
+    def register(self, worker_id: str, **initial):
+        with self._lock:
+            self.table[worker_id] = {'id': worker_id, 'steps': {}, **initial}
+
+    def subscribe(self, listener):
+        """Call listener(event, row) for every event drained from now on, after it is folded into row."""
+        self._listeners.append(listener)
+
+    def _fold(self, event: Dict[str, Any]):
+        row = self.table.setdefault(event['worker_id'], {'id': event['worker_id'], 'steps': {}})
+        kind = event['kind']
+        if kind == 'status':
+            row['status'] = event['value']
+        elif kind == 'phase':
+            row['phase'] = event['value']
+        elif kind == 'log':
+            row['last_log'] = event['value']
+        elif kind == 'step_start':
+            row['steps'][event['step']] = {'state': 'running', 'started': event['ts']}
+        elif kind == 'step_end':
+            step = row['steps'].setdefault(event['step'], {})
+            step.update(state=event['state'], exit_code=event['exit_code'], ended=event['ts'])
+        elif kind == 'resources':
+            sample = {k: v for k, v in event.items() if k not in ('worker_id', 'kind')}
+            row['resources'] = sample
+            history = row.setdefault('resource_history', [])
+            history.append(sample)
+            del history[:-RESOURCE_HISTORY]
+        elif kind == 'metric':
+            # Whole curves are kept: the early-stopping rules compare trials at the same iteration.
+            row.setdefault('metrics', {}).setdefault(event['name'], []).append([event['iteration'], event['value']])
+        elif kind == 'placement':
+            row['host'] = event['host']
+        elif kind == 'timing':
+            row.setdefault('timings', []).append(
+                {k: v for k, v in event.items() if k not in ('worker_id', 'kind')}
+            )
+        row['updated'] = event['ts']
+
+    def drain(self) -> int:
+        """Fold every pending event into the table. Returns the number of events processed."""
+        count = 0
+        with self._lock:
+            while True:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._fold(event)
+                for listener in self._listeners:
+                    listener(event, self.table[event['worker_id']])
+                if self._events_file:
+                    self._events_file.write(json.dumps(event) + "\n")
+                count += 1
+            if count and self._events_file:
+                self._events_file.flush()
+        return count
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Drain pending events and return the current table."""
+        self.drain()
+        return self.table
+
+    def close(self):
+        self.drain()
+        if self._events_file:
+            self._events_file.close()
+            self._events_file = None
@@ -0,0 +1,420 @@
+import os
+import sys
+import json
+import time
+import array
+import select
+import signal
+import socket
+import stat
+import struct
+import hashlib
+import tempfile
+import functools
+import subprocess
+
+# This module is also run directly by the step's venv interpreter (locally from the package,
+# remotely from a copy in the venv), so it only depends on the standard library.
+
+SCRIPT = os.path.abspath(__file__)
+# How long a client waits for a server that is starting (and preloading) before running the script itself.
+START_TIMEOUT = 120
+DEFAULT_IDLE_TIMEOUT = 600
+# Longest Unix socket path bind() accepts (sun_path, minus its terminating NUL).
+MAX_SOCKET_PATH = 103 if sys.platform == "darwin" else 107
+
+
+def supported() -> bool:
+    """Fork servers need fork() and fd passing over Unix sockets (not available on Windows)."""
+    return hasattr(os, "fork") and hasattr(socket, "AF_UNIX")
+
+
+@functools.lru_cache(maxsize=None)
+def script_digest() -> str:
+    with open(SCRIPT, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def socket_name(python, preload, thread_env=None) -> str:
+    """
+    One server per interpreter, preload list and thread-pool settings (and version of this
+    module) on a host. Preloaded numeric libraries size their thread pools from the environment
+    when they are imported, i.e. when the server starts, so steps with other OMP_NUM_THREADS
+    (etc.) values get a server of their own.
+    """
+    key = hashlib.sha256(json.dumps(
+        [str(python), sorted(preload), sorted((thread_env or {}).items()), script_digest()]
+    ).encode()).hexdigest()[:16]
+    return f"flowkestra-fs-{key}.sock"
+
+
+def socket_dir() -> str:
+    """
+    This user's private directory for server sockets, created 0700: in $XDG_RUNTIME_DIR when
+    set, else in the temp dir. Raises OSError if the directory is not safely ours (e.g. another
+    user created it first), since the socket receives each step's environment and stdio.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        path = os.path.join(runtime_dir, "flowkestra")
+    else:
+        path = os.path.join(tempfile.gettempdir(), f"flowkestra-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory of this user")
+    return path
+
+
+def _open_private(path, flags):
+    """Open (creating it 0600) a file in the socket dir without following a planted symlink."""
+    return os.open(path, flags | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+
+
+def client_command(python, server_script, name, script, args=None, preload=(), idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                   pidfile=None, cores=None):
+    """
+    Command line that runs script through the fork server called name, starting the server if needed.
+
+    Args:
+        python (str or Path): the venv interpreter (the server runs on it too)
+        server_script (str or Path): this module's file on the host
+        name (str): the server's socket name (see socket_name), in the host user's socket_dir()
+        script (str or Path): the step's script
+        args (list of str, optional): the script's arguments
+        preload (list of str): modules the server imports once before forking
+        idle_timeout (float): seconds without requests after which the server exits
+        pidfile (str, optional): file the client writes the step's pid to (for sampling and stopping)
+        cores (list of int, optional): cores the forked step is pinned to
+    """
+    # -I -S: the client itself needs neither site-packages nor the environment's PYTHON* settings.
+    cmd = [str(python), "-I", "-S", str(server_script), "run", name,
+           "--preload", ",".join(preload), "--idle-timeout", str(idle_timeout)]
+    if pidfile:
+        cmd += ["--pidfile", str(pidfile)]
+    if cores:
+        cmd += ["--cores", ",".join(str(core) for core in cores)]
+    return cmd + ["--", str(script)] + list(args or [])
+
+
+# ---------- client ----------
+def _spawn_server(socket_path, preload, idle_timeout):
+    log = os.fdopen(_open_private(socket_path + ".log", os.O_WRONLY | os.O_APPEND), "ab")
+    # Without -I/-S: the server imports from the venv's site-packages.
+    subprocess.Popen(
+        [sys.executable, SCRIPT, "serve", os.path.basename(socket_path),
+         "--preload", ",".join(preload), "--idle-timeout", str(idle_timeout)],
+        stdin=subprocess.DEVNULL, stdout=log, stderr=log, cwd="/", start_new_session=True
+    )
+    log.close()
+
+
+def _connect(socket_path, preload, idle_timeout):
+    """Connect to the server, (re)starting it while it doesn't answer. None after START_TIMEOUT."""
+    deadline = time.monotonic() + START_TIMEOUT
+    next_spawn = 0.0
+    while time.monotonic() < deadline:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+        else:
+            if _peer_uid(sock, socket_path) == os.getuid():
+                return sock
+            sock.close()
+            return None  # not our server: never hand it the environment and descriptors
+        if time.monotonic() >= next_spawn:
+            # A second server exits at once while another one holds the lock (and is preloading).
+            _spawn_server(socket_path, preload, idle_timeout)
+            next_spawn = time.monotonic() + 2.0
+        time.sleep(0.05)
+    return None
+
+
+def _peer_uid(sock, socket_path):
+    """The uid of the process serving sock (SO_PEERCRED), or of the socket file where unsupported."""
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    return os.lstat(socket_path).st_uid
+
+
+def _request(sock, script, args, cores=None):
+    payload = json.dumps({
+        'argv': [script] + args,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'cores': cores,
+    }).encode()
+    data = struct.pack("!I", len(payload)) + payload
+    # The step writes straight to our stdin/stdout/stderr: pass the descriptors along.
+    sent = sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [0, 1, 2]))])
+    sock.sendall(data[sent:])
+
+
+def run_client(socket_path, script, args, preload, idle_timeout, pidfile=None, cores=None):
+    """Run script in a child of the fork server and exit like it did; fall back to a plain run."""
+    child = {'pid': None, 'pending': []}
+
+    def forward(signum, frame):
+        if child['pid']:
+            os.kill(child['pid'], signum)
+        else:
+            child['pending'].append(signum)
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+
+    for _ in range(2):
+        sock = _connect(socket_path, preload, idle_timeout)
+        if sock is None:
+            break
+        _request(sock, script, args, cores)
+        reply = sock.makefile("rb")
+        line = reply.readline()
+        if not line.startswith(b"pid "):
+            # The server went away (e.g. its venv changed): retry once with a fresh one.
+            sock.close()
+            continue
+        child['pid'] = int(line.split()[1])
+        if pidfile:
+            with open(pidfile, "w") as f:
+                f.write(f"{child['pid']}\n")
+        for signum in child['pending']:
+            os.kill(child['pid'], signum)
+        line = reply.readline()
+        if not line.startswith(b"exit "):
+            sys.stderr.write("flowkestra fork server: lost the connection to the step\n")
+            sys.exit(1)
+        code = int(line.split()[1])
+        if code < 0:
+            # Killed by a signal: die the same way so the caller sees the same status.
+            try:
+                signal.signal(-code, signal.SIG_DFL)
+            except (OSError, ValueError):
+                pass  # SIGKILL/SIGSTOP can't be handled anyway
+            os.kill(os.getpid(), -code)
+            code = 128 - code
+        sys.exit(code)
+
+    # No server: run the script the usual way (the client itself was pinned by the runner).
+    os.execv(sys.executable, [sys.executable, script] + args)
+
+
+# ---------- server ----------
+def _fingerprint():
+    """Changes when packages are installed into (or removed from) the interpreter's site-packages."""
+    return [os.stat(p).st_mtime_ns for p in sys.path if p.endswith("site-packages") and os.path.isdir(p)]
+
+
+def _receive(conn):
+    data, ancdata, _, _ = conn.recvmsg(65536, socket.CMSG_SPACE(3 * array.array("i").itemsize))
+    fds = array.array("i")
+    for level, kind, cmsg in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg[:len(cmsg) - (len(cmsg) % fds.itemsize)])
+    while len(data) < 4 or len(data) < 4 + struct.unpack("!I", data[:4])[0]:
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise ConnectionError("client went away before its request was complete")
+        data += chunk
+    return list(fds), json.loads(data[4:])
+
+
+def _run_step(fds, request):
+    """In the forked child: become the step's interpreter and run its script as __main__."""
+    import runpy
+    import atexit
+    import traceback
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+    for fd in fds:
+        if fd > 2:
+            os.close(fd)
+    os.chdir(request['cwd'])
+    if request.get('cores') and hasattr(os, "sched_setaffinity"):
+        # The fork inherits the server's affinity, not the client's: pin the step itself.
+        try:
+            os.sched_setaffinity(0, request['cores'])
+        except OSError:
+            pass  # cores outside our cgroup: run unpinned, as pin_process does
+    os.environ.clear()
+    os.environ.update(request['env'])
+    for signum in (signal.SIGTERM, signal.SIGHUP, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    sys.argv = request['argv']
+    extra = [p for p in request['env'].get("PYTHONPATH", "").split(os.pathsep) if p]
+    sys.path[0:0] = [os.path.dirname(os.path.abspath(sys.argv[0]))] + extra
+    # Forked children would otherwise all draw the same "random" numbers.
+    if "random" in sys.modules:
+        sys.modules["random"].seed()
+    if "numpy" in sys.modules:
+        sys.modules["numpy"].random.seed()
+
+    code = 0
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _handle(conn):
+    """
+    In a forked handler: fork the step, report its pid and exit code to the client, and kill
+    it if the client goes away (e.g. killed on a timeout).
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    fds, request = _receive(conn)
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda *args: None)
+
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        signal.set_wakeup_fd(-1)
+        os.close(wakeup_r)
+        os.close(wakeup_w)
+        _run_step(fds, request)
+    for fd in fds:
+        os.close(fd)
+    conn.sendall(b"pid %d\n" % pid)
+    while True:
+        ready, _, _ = select.select([conn, wakeup_r], [], [])
+        if wakeup_r in ready:
+            os.read(wakeup_r, 512)
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            conn.sendall(b"exit %d\n" % code)
+            return
+        if conn in ready and not conn.recv(1):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            return
+
+
+def serve(socket_path, preload, idle_timeout):
+    """Preload modules, then fork a handler per request until idle for idle_timeout seconds."""
+    import fcntl
+    import importlib
+
+    lock = os.fdopen(_open_private(socket_path + ".lock", os.O_WRONLY), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return  # another server owns this socket
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"preload of {name} failed: {e}", flush=True)
+    fingerprint = _fingerprint()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # left by a server that died
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Created 0600 (inside a 0700 dir): there is no window in which others can connect.
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen(128)
+    # Handlers are reaped automatically; each one waits for its own step.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        while True:
+            ready, _, _ = select.select([server], [], [], idle_timeout)
+            if not ready:
+                return
+            conn, _ = server.accept()
+            if _fingerprint() != fingerprint:
+                # The venv changed under us: stop serving (the client retries with a new server).
+                conn.close()
+                return
+            if os.fork() == 0:
+                # Only the server holds the lock: a new one can start while old steps still run.
+                server.close()
+                lock.close()
+                try:
+                    _handle(conn)
+                finally:
+                    os._exit(0)
+            conn.close()
+    finally:
+        server.close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+
+
+def _parse_options(argv):
+    options = {'preload': [], 'idle_timeout': DEFAULT_IDLE_TIMEOUT, 'pidfile': None, 'cores': None}
+    rest = []
+    while argv:
+        arg = argv.pop(0)
+        if arg == "--":
+            rest += argv
+            break
+        if arg == "--preload":
+            options['preload'] = [name for name in argv.pop(0).split(",") if name]
+        elif arg == "--idle-timeout":
+            options['idle_timeout'] = float(argv.pop(0))
+        elif arg == "--pidfile":
+            options['pidfile'] = argv.pop(0)
+        elif arg == "--cores":
+            options['cores'] = [int(core) for core in argv.pop(0).split(",") if core]
+        else:
+            rest.append(arg)
+    return options, rest
+
+
+def main(argv):
+    mode, name = argv[0], argv[1]
+    options, rest = _parse_options(argv[2:])
+    try:
+        socket_path = os.path.join(socket_dir(), name)
+        if len(os.fsencode(socket_path)) > MAX_SOCKET_PATH:
+            # The server could never bind it: don't wait START_TIMEOUT for one to answer.
+            raise OSError(f"socket path {socket_path} is too long")
+    except OSError as e:
+        if mode == "serve":
+            return
+        sys.stderr.write(f"flowkestra fork server: {e}; running the step without it\n")
+        os.execv(sys.executable, [sys.executable] + rest)
+    if mode == "serve":
+        serve(socket_path, options['preload'], options['idle_timeout'])
+    else:
+        run_client(socket_path, rest[0], rest[1:], options['preload'], options['idle_timeout'], options['pidfile'],
+                   options['cores'])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
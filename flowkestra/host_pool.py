@@ -0,0 +1,234 @@
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+# Which hosts already hold an instance's code, venv or data, remembered across runs.
+AFFINITY_FILE = "~/.cache/flowkestra/host_affinity.json"
+MAX_AFFINITY_KEYS = 512
+# Affinity keys only meaningful within one run (e.g. a sweep's shared code tree), never saved.
+RUN_SCOPED_PREFIXES = ("sweep:",)
+
+
+class HostUnreachable(RuntimeError):
+    """An instance's setup failed because its pool host could not be reached; it can be placed elsewhere."""
+
+    def __init__(self, host: "PoolHost", error: BaseException):
+        self.host = host
+        super().__init__(f"host {host.name} unreachable: {error}")
+
+
+class PoolHost:
+    """One host of a pool: its SSH settings, capacity and what is placed on it."""
+
+    def __init__(self, config: dict):
+        self.ssh = config['ssh']
+        self.name = config.get('name') or f"{self.ssh['hostname']}:{self.ssh.get('port', 22)}"
+        self.slots = config.get('slots', 1)
+        self.memory_gb = config.get('memory_gb')
+        self.used_slots = 0.0
+        self.used_memory_gb = 0.0
+        self.placed: Dict[str, tuple] = {}
+        self.failures = 0
+        self.down_until = 0.0
+
+    def fits(self, cpus: float, memory_gb: float) -> bool:
+        if not self.placed:
+            # As with the local scheduler, a request larger than the host runs on it alone.
+            return True
+        if self.used_slots + cpus > self.slots:
+            return False
+        return self.memory_gb is None or self.used_memory_gb + memory_gb <= self.memory_gb
+
+    @property
+    def load(self) -> float:
+        return self.used_slots / self.slots
+
+
+class HostPool:
+    """
+    Places instances on the hosts of one pool.
+
+    An instance goes to a reachable host with enough free slots (and memory), preferring the
+    hosts that already hold most of its code, venv or data and then the least loaded one. A host
+    found unreachable is skipped for ``retry_interval`` seconds and dropped after ``max_failures``.
+    """
+
+    def __init__(self, name: str, hosts: List[dict], retry_interval: float = 60, max_failures: int = 3,
+                 affinity: Dict[str, Set[str]] = None):
+        """
+        Args:
+            name (str): pool name
+            hosts (list of dict): ``{'ssh', 'slots', 'memory_gb', 'name'}`` per host
+            retry_interval (float): seconds before an unreachable host is tried again
+            max_failures (int): times a host may be found unreachable before it is dropped
+            affinity (dict, optional): host name -> keys of what it already holds (shared, updated in place)
+        """
+        self.name = name
+        self.hosts = [PoolHost(host) for host in hosts]
+        self.retry_interval = retry_interval
+        self.max_failures = max_failures
+        self.affinity = affinity if affinity is not None else {}
+
+    def _available(self, host: PoolHost, now: float) -> bool:
+        return host.failures < self.max_failures and now >= host.down_until
+
+    @property
+    def exhausted(self) -> bool:
+        """True when every host was dropped: nothing queued on this pool can ever run."""
+        return all(host.failures >= self.max_failures for host in self.hosts)
+
+    def place(self, worker_id: str, cpus: float, memory_gb: float, keys: Iterable[str] = ()) -> Optional[PoolHost]:
+        """Reserve capacity for worker_id on the best host, or return None if no host fits right now."""
+        now = time.monotonic()
+        keys = set(keys)
+        candidates = [h for h in self.hosts if self._available(h, now) and h.fits(cpus, memory_gb)]
+        if not candidates:
+            return None
+        host = max(
+            candidates,
+            key=lambda h: (len(keys & self.affinity.get(h.name, set())), -h.load, -self.hosts.index(h))
+        )
+        host.used_slots += cpus
+        host.used_memory_gb += memory_gb
+        host.placed[worker_id] = (cpus, memory_gb)
+        return host
+
+    def release(self, worker_id: str):
+        for host in self.hosts:
+            if worker_id in host.placed:
+                cpus, memory_gb = host.placed.pop(worker_id)
+                host.used_slots = max(0.0, host.used_slots - cpus)
+                host.used_memory_gb = max(0.0, host.used_memory_gb - memory_gb)
+
+    def mark_unreachable(self, host: PoolHost):
+        now = time.monotonic()
+        if now < host.down_until:
+            return  # the same outage, reported by another instance that was placed there
+        host.failures += 1
+        host.down_until = now + self.retry_interval
+
+    def mark_reachable(self, host: PoolHost):
+        host.failures = 0
+        host.down_until = 0.0
+
+    def usage(self) -> str:
+        now = time.monotonic()
+        states = []
+        for host in self.hosts:
+            if host.failures >= self.max_failures:
+                states.append(f"{host.name} dropped")
+            elif not self._available(host, now):
+                states.append(f"{host.name} down")
+            else:
+                states.append(f"{host.name} {host.used_slots:g}/{host.slots:g}")
+        return ", ".join(states)
+
+
+class HostPools:
+    """
+    The configured host pools of a run, and the affinity of their hosts: which instance code
+    trees, venvs and data each host already holds. The affinity is persisted so a later run
+    sends instances back to the hosts with warm caches.
+    """
+
+    def __init__(self, pools_config: Dict[str, dict], affinity_file: Optional[str] = AFFINITY_FILE):
+        """
+        Args:
+            pools_config (dict): the ``host_pools`` section, pool name -> {'hosts', ...}
+            affinity_file (str, optional): JSON file the affinity is loaded from and saved to
+        """
+        self.affinity_file = Path(affinity_file).expanduser() if affinity_file else None
+        self.affinity: Dict[str, Set[str]] = self._load()
+        self.pools = {
+            name: HostPool(
+                name,
+                pool['hosts'],
+                retry_interval=pool.get('retry_interval', 60),
+                max_failures=pool.get('max_failures', 3),
+                affinity=self.affinity
+            )
+            for name, pool in pools_config.items()
+        }
+        self.placements: Dict[str, PoolHost] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Set[str]]:
+        try:
+            return {host: set(keys) for host, keys in json.loads(self.affinity_file.read_text()).items()}
+        except (AttributeError, OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.affinity_file:
+            return
+        try:
+            self.affinity_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.affinity_file.with_suffix(".tmp")
+            saved = {
+                host: sorted(key for key in keys if not key.startswith(RUN_SCOPED_PREFIXES))
+                for host, keys in self.affinity.items()
+            }
+            tmp.write_text(json.dumps(saved))
+            tmp.replace(self.affinity_file)
+        except OSError:
+            pass  # only a placement hint
+
+    def place(self, pool: str, worker_id: str, cpus: float, memory_gb: float, keys: Iterable[str] = ()) -> Optional[PoolHost]:
+        with self._lock:
+            host = self.pools[pool].place(worker_id, cpus, memory_gb, keys)
+            if host:
+                self.placements[worker_id] = host
+            return host
+
+    def host_of(self, worker_id: str) -> Optional[PoolHost]:
+        return self.placements.get(worker_id)
+
+    def release(self, worker_id: str):
+        with self._lock:
+            host = self.placements.pop(worker_id, None)
+            if host:
+                for pool in self.pools.values():
+                    pool.release(worker_id)
+
+    def record(self, worker_id: str, keys: Iterable[str], persist: bool = True):
+        """Remember that worker_id's host now holds keys (its host also proved reachable)."""
+        with self._lock:
+            host = self.placements.get(worker_id)
+            if not host:
+                return
+            for pool in self.pools.values():
+                if host in pool.hosts:
+                    pool.mark_reachable(host)
+            known = self.affinity.setdefault(host.name, set())
+            known.update(keys)
+            if len(known) > MAX_AFFINITY_KEYS:
+                self.affinity[host.name] = set(sorted(known)[-MAX_AFFINITY_KEYS:])
+            if persist:
+                self._save()
+
+    def mark_unreachable(self, host: PoolHost):
+        with self._lock:
+            for pool in self.pools.values():
+                if host in pool.hosts:
+                    pool.mark_unreachable(host)
+
+    def is_down(self, host: PoolHost) -> bool:
+        """True while host is skipped (or was dropped) after being found unreachable."""
+        now = time.monotonic()
+        return any(host in pool.hosts and not pool._available(host, now) for pool in self.pools.values())
+
+    def exhausted(self, pool: str) -> bool:
+        return self.pools[pool].exhausted
+
+    def usage(self) -> Dict[str, str]:
+        with self._lock:
+            return {name: pool.usage() for name, pool in self.pools.items()}
+
+
+def build_host_pools(pools_config: Optional[Dict[str, dict]]) -> Optional[HostPools]:
+    """Create the HostPools of the ``host_pools`` config section, or None when it defines none."""
+    if not pools_config:
+        return None
+    return HostPools(pools_config)
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+JOURNAL_FILE = "journal.jsonl"
+# Final instance statuses a resumed run doesn't redo.
+FINISHED_STATUSES = ('completed', 'stopped early')
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """Stable digest of an instance's (validated) config: a changed config never resumes old work."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def origin_fingerprint(origin_dir) -> str:
+    """Digest of the paths, sizes and mtimes under origin_dir: tells whether a synced workdir is still current."""
+    origin_dir = Path(origin_dir)
+    entries = []
+    for path in sorted(origin_dir.glob("**/*")):
+        if path.is_file():
+            stat = path.stat()
+            entries.append([path.relative_to(origin_dir).as_posix(), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+
+
+def run_dir_for(config_path, root) -> Path:
+    """One run directory per config file: a restart with the same file finds its journal."""
+    config_path = os.path.abspath(config_path)
+    digest = hashlib.sha256(config_path.encode()).hexdigest()[:8]
+    return Path(os.path.expanduser(root)) / f"{Path(config_path).stem}-{digest}"
+
+
+class RunJournal:
+    """
+    Append-only record of a run: which instances it has (by config hash), their phase
+    transitions, verified setups (workdir and venv) and per-step completion with exit codes.
+
+    Each record is one JSON line, flushed as it is written, so the journal survives the
+    supervisor being killed at any point. A restarted supervisor folds the records back into
+    the last known state of every instance to resume instead of redoing work.
+    """
+
+    def __init__(self, path, resume: bool = False):
+        """
+        Args:
+            path (str or Path): the journal file
+            resume (bool): keep and load the existing journal (otherwise a new one is started)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.state: Dict[str, Dict[str, Any]] = self._load() if resume else {}
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a" if resume else "w")
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        state: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self._fold(state, json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue  # e.g. the last line, cut short by a crash
+        except OSError:
+            pass
+        return state
+
+    @staticmethod
+    def _fold(state: Dict[str, Dict[str, Any]], record: Dict[str, Any]):
+        row = state.setdefault(record['instance'], {'steps': {}})
+        kind = record['kind']
+        if kind == 'instance':
+            if row.get('config_hash') not in (None, record['config_hash']):
+                row.clear()
+                row['steps'] = {}
+            row['config_hash'] = record['config_hash']
+        elif kind == 'phase':
+            row['phase'] = record['phase']
+        elif kind == 'setup':
+            row['setup'] = {k: v for k, v in record.items() if k not in ('ts', 'kind', 'instance')}
+            # A new setup (e.g. a changed origin) invalidates the outputs of earlier steps.
+            row['steps'] = {}
+        elif kind == 'step':
+            row['steps'][record['step']] = {'state': record['state'], 'exit_code': record.get('exit_code')}
+        elif kind == 'end':
+            row['status'] = record['status']
+
+    def record(self, kind: str, instance: str, **fields):
+        entry = {'ts': time.time(), 'kind': kind, 'instance': instance, **fields}
+        with self._lock:
+            self._fold(self.state, entry)
+            if self._file:
+                self._file.write(json.dumps(entry) + "\n")
+                self._file.flush()
+
+    def instance(self, instance: str, config_hash: str) -> Optional[Dict[str, Any]]:
+        """The journaled state of an instance from an earlier run, or None if it has none for this config."""
+        row = self.state.get(instance)
+        if not row or row.get('config_hash') != config_hash:
+            return None
+        return row
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def build_run_journal(config: Optional[dict], config_path, logs_dir, resume: bool = False) -> Optional[RunJournal]:
+    """Create the RunJournal of the ``journal`` config section, or None when disabled."""
+    config = config or {}
+    if not config.get('enabled', True):
+        if resume:
+            raise ValueError("--resume needs the run journal (journal.enabled)")
+        return None
+    root = config.get('dir') or os.path.join(os.path.expanduser(logs_dir), "runs")
+    return RunJournal(run_dir_for(config_path, root) / JOURNAL_FILE, resume=resume)
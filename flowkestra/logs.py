@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable, List, Optional
+
+# A line longer than this is flushed in pieces so a newline-free stream can't grow unbounded.
+MAX_PARTIAL_LINE = 64 * 1024
+
+
+class StepLog:
+    """
+    Log sink for one pipeline step.
+
+    Output is written incrementally to a size-rotated file (``<step>.log``, ``<step>.log.1``, ...)
+    and only the last ``tail_lines`` lines are kept in memory for status display.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=3, tail_lines=200,
+                 on_line: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            path (str or Path): log file path
+            max_bytes (int): rotate once the file exceeds this size (0 disables rotation)
+            backup_count (int): number of rotated files kept
+            tail_lines (int): number of recent lines kept in memory
+            on_line (callable, optional): called with every complete line
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.on_line = on_line
+        self._tail = deque(maxlen=tail_lines)
+        self._partial = {'stdout': b"", 'stderr': b""}
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "ab")
+
+    def _emit(self, stream: str, line: bytes):
+        text = line.decode(errors="replace").rstrip("\r\n")
+        record = (f"[{stream}] " if stream == 'stderr' else "") + text
+        self._file.write(record.encode() + b"\n")
+        self._tail.append(record)
+        if self.on_line:
+            self.on_line(record)
+
+    def feed(self, stream: str, data: bytes):
+        """Append a chunk of raw output from ``stream`` ('stdout' or 'stderr')."""
+        with self._lock:
+            buffer = self._partial[stream] + data
+            *lines, buffer = buffer.split(b"\n")
+            if len(buffer) > MAX_PARTIAL_LINE:
+                lines.append(buffer)
+                buffer = b""
+            self._partial[stream] = buffer
+            for line in lines:
+                self._emit(stream, line)
+            self._file.flush()
+            if self.max_bytes and self._file.tell() > self.max_bytes:
+                self._rotate()
+
+    def tail(self, n: Optional[int] = None) -> List[str]:
+        """Return the last n lines (default: all lines kept in memory)."""
+        with self._lock:
+            lines = list(self._tail)
+        return lines[-n:] if n else lines
+
+    def close(self):
+        with self._lock:
+            for stream, buffer in self._partial.items():
+                if buffer:
+                    self._emit(stream, buffer)
+                self._partial[stream] = b""
+            self._file.close()
+
+
+def safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+def tail_file(path, n=20, block_size=8192) -> List[str]:
+    """Return the last n lines of a log file, reading backwards from its end."""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0 and data.count(b"\n") <= n:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    return [line.decode(errors="replace") for line in data.splitlines()[-n:]]
+
+
+class LogStore:
+    """Per-instance directory of step logs: ``<log_dir>/<instance>/<step>.log``."""
+
+    def __init__(self, log_dir, instance_name, max_bytes=10 * 1024 * 1024, backup_count=3, tail_lines=200):
+        self.dir = Path(log_dir).expanduser() / safe_name(instance_name)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.tail_lines = tail_lines
+
+    def path_for(self, step_name: str) -> Path:
+        return self.dir / f"{safe_name(step_name)}.log"
+
+    def resources_path_for(self, step_name: str) -> Path:
+        """Time series of the step's resource samples (JSONL)."""
+        return self.dir / f"{safe_name(step_name)}.resources.jsonl"
+
+    def open(self, step_name: str, on_line: Optional[Callable[[str], None]] = None) -> StepLog:
+        return StepLog(
+            self.path_for(step_name),
+            max_bytes=self.max_bytes,
+            backup_count=self.backup_count,
+            tail_lines=self.tail_lines,
+            on_line=on_line
+        )
+
+    def tail(self, step_name: str, n=20) -> List[str]:
+        """Tail a step's log from disk; works from any process."""
+        return tail_file(self.path_for(step_name), n)
+
+
+def build_log_store(log_config: Optional[dict], instance_name: str) -> LogStore:
+    log_config = log_config or {}
+    return LogStore(
+        log_dir=log_config.get('dir', './flowkestra_logs'),
+        instance_name=instance_name,
+        max_bytes=log_config.get('max_bytes', 10 * 1024 * 1024),
+        backup_count=log_config.get('backup_count', 3),
+        tail_lines=log_config.get('tail_lines', 200)
+    )
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from flowkestra.events import StatusReporter
+
+
+class PhaseTimer:
+    """Times named phases of an instance and reports each duration as a 'timing' event."""
+
+    def __init__(self, reporter: Optional[StatusReporter] = None):
+        self.reporter = reporter
+
+    @contextmanager
+    def phase(self, name: str, **extra):
+        """
+        Time the enclosed block as phase ``name``. The yielded dict can be filled with
+        extra measurements (e.g. bytes moved) that are reported alongside the duration.
+        """
+        info: Dict[str, Any] = dict(extra)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield info
+            ok = True
+        finally:
+            self.record(name, time.perf_counter() - start, ok=ok, **info)
+
+    def record(self, name: str, duration: float, ok: bool = True, **extra):
+        """Report a duration measured elsewhere (e.g. on a remote host) as phase ``name``."""
+        if self.reporter:
+            self.reporter.emit('timing', phase=name, duration=duration, ok=ok, **extra)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in [0, 100]) of a non-empty list."""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def build_report(table: Dict[str, Dict[str, Any]], names: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Assemble per-instance phase timings and a cross-instance summary.
+
+    Args:
+        table (dict): status table folded by StatusChannel (rows carry a 'timings' list)
+        names (dict): worker_id -> readable instance name
+    """
+    instances = {}
+    per_phase: Dict[str, List[float]] = {}
+    for worker_id, row in table.items():
+        timings = row.get('timings', [])
+        instances[worker_id] = {
+            'name': names.get(worker_id, worker_id),
+            'status': row.get('status'),
+            'phases': timings,
+            # Wall-clock span: phases can nest or run in parallel, so durations don't simply add up.
+            'total_seconds': (max(t['ts'] for t in timings) - min(t['ts'] - t['duration'] for t in timings)) if timings else 0.0,
+        }
+        for t in timings:
+            per_phase.setdefault(t['phase'], []).append(t['duration'])
+
+    summary = {
+        phase: {
+            'count': len(durations),
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'max': max(durations),
+            'total': sum(durations),
+        }
+        for phase, durations in per_phase.items()
+    }
+    return {'generated': time.time(), 'instances': instances, 'summary': summary}
+
+
+def write_json_report(report: Dict[str, Any], path) -> Path:
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    return path
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def write_prometheus_textfile(report: Dict[str, Any], path) -> Path:
+    """Write the report in the node_exporter textfile collector format (atomically)."""
+    lines = [
+        "# HELP flowkestra_phase_duration_seconds Duration of an instance phase.",
+        "# TYPE flowkestra_phase_duration_seconds gauge",
+    ]
+    moved = []
+    for info in report['instances'].values():
+        for t in info['phases']:
+            lines.append(
+                f'flowkestra_phase_duration_seconds{{instance="{_label(info["name"])}",phase="{_label(t["phase"])}"}} {t["duration"]:.6f}'
+            )
+            for key in ('bytes', 'files'):
+                if key in t:
+                    moved.append(f'flowkestra_phase_{key}{{instance="{_label(info["name"])}",phase="{_label(t["phase"])}"}} {t[key]}')
+    if moved:
+        lines += ["# HELP flowkestra_phase_bytes Bytes moved by a phase.", "# TYPE flowkestra_phase_bytes gauge"]
+        lines += [m for m in moved if m.startswith("flowkestra_phase_bytes")]
+        lines += ["# HELP flowkestra_phase_files Files moved by a phase.", "# TYPE flowkestra_phase_files gauge"]
+        lines += [m for m in moved if m.startswith("flowkestra_phase_files")]
+    lines += [
+        "# HELP flowkestra_phase_duration_quantile_seconds Phase duration quantiles across instances.",
+        "# TYPE flowkestra_phase_duration_quantile_seconds gauge",
+    ]
+    for phase, stats in report['summary'].items():
+        for q in ('p50', 'p95'):
+            lines.append(
+                f'flowkestra_phase_duration_quantile_seconds{{phase="{_label(phase)}",quantile="{int(q[1:]) / 100:g}"}} {stats[q]:.6f}'
+            )
+
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def print_summary(report: Dict[str, Any]):
+    """Print p50/p95 per phase across instances."""
+    if not report['summary']:
+        return
+    width = max(len(p) for p in report['summary'])
+    print(f"--- Phase timings across {len(report['instances'])} instance(s) ---")
+    print(f"{'PHASE':<{width}}  {'N':>4}  {'P50 (s)':>9}  {'P95 (s)':>9}  {'MAX (s)':>9}")
+    for phase, stats in report['summary'].items():
+        print(f"{phase:<{width}}  {stats['count']:>4}  {stats['p50']:>9.2f}  {stats['p95']:>9.2f}  {stats['max']:>9.2f}")
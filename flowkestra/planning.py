@@ -0,0 +1,292 @@
+import os
+import json
+import heapq
+import hashlib
+import statistics
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from flowkestra.dag import resolve_dependencies
+from flowkestra.scheduler import ResourceScheduler
+
+# Durations of past steps and instances, by script contents, args and host.
+DURATIONS_FILE = "~/.cache/flowkestra/durations.json"
+DEFAULT_MAX_SAMPLES = 20
+# Timing phases that make up an instance's setup (see Worker.setup).
+SETUP_PHASES = ('clean', 'sync', 'environment', 'sync/data_store', 'resume')
+ANY_HOST = '*'
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class DurationHistory:
+    """
+    Local store of how long steps and instances took in earlier runs.
+
+    A step is identified by the contents of its script and its args, an instance by its
+    steps; each keeps the last ``max_samples`` durations per host. Estimates are medians,
+    taken on the same host when it has samples and across hosts otherwise, so that a
+    first run on a new host (or a pooled instance whose host isn't known yet) still gets one.
+    """
+
+    def __init__(self, path=DURATIONS_FILE, max_samples: int = DEFAULT_MAX_SAMPLES):
+        """
+        Args:
+            path (str or Path, optional): JSON file the history is loaded from and saved to
+            max_samples (int): durations kept per step (or instance) and host
+        """
+        self.path = Path(path).expanduser() if path else None
+        self.max_samples = max_samples
+        self.data: Dict[str, Dict[str, Any]] = self._load()
+        self._script_hashes: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text())
+            return {'steps': dict(data.get('steps', {})), 'instances': dict(data.get('instances', {}))}
+        except (AttributeError, OSError, ValueError):
+            return {'steps': {}, 'instances': {}}
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with self._lock:
+                tmp.write_text(json.dumps(self.data))
+            tmp.replace(self.path)
+        except OSError:
+            pass  # only a scheduling hint
+
+    def _script_hash(self, script_path) -> Optional[str]:
+        script_path = os.path.abspath(script_path)
+        if script_path not in self._script_hashes:
+            try:
+                with open(script_path, 'rb') as f:
+                    self._script_hashes[script_path] = hashlib.sha256(f.read()).hexdigest()[:16]
+            except OSError:
+                self._script_hashes[script_path] = None
+        return self._script_hashes[script_path]
+
+    def step_keys(self, cfg: Dict[str, Any]) -> Dict[str, Optional[Tuple[str, str]]]:
+        """{step: (script hash, args digest)} of an instance config; None for a step whose script can't be read."""
+        keys = {}
+        for name, step in (cfg.get('pipelines') or {}).items():
+            script_hash = self._script_hash(os.path.join(cfg['workdir'], step['script']))
+            keys[name] = (script_hash, _digest(step.get('args') or [])) if script_hash else None
+        return keys
+
+    def instance_key(self, cfg: Dict[str, Any]) -> Optional[str]:
+        keys = self.step_keys(cfg)
+        if not keys or None in keys.values():
+            return None
+        return _digest(sorted(keys.items()))
+
+    def _append(self, samples: List[float], value: float):
+        samples.append(round(value, 3))
+        del samples[:-self.max_samples]
+
+    def record_step(self, key: Tuple[str, str], step: str, host: str, duration: float):
+        script_hash, args = key
+        with self._lock:
+            entry = self.data['steps'].setdefault(script_hash, {}).setdefault(args, {'step': step, 'hosts': {}})
+            entry['step'] = step
+            self._append(entry['hosts'].setdefault(host, []), duration)
+
+    def record_instance(self, key: str, host: str, setup: float, run: float):
+        with self._lock:
+            entry = self.data['instances'].setdefault(key, {}).setdefault(host, {'setup': [], 'run': []})
+            self._append(entry['setup'], setup)
+            self._append(entry['run'], run)
+
+    @staticmethod
+    def _median(samples: List[float]) -> Optional[float]:
+        return statistics.median(samples) if samples else None
+
+    def step_estimate(self, key: Optional[Tuple[str, str]], step: str, host: str = ANY_HOST) -> Optional[float]:
+        """
+        Median duration of a step: on host with the same args, on any host with the same args,
+        or (e.g. a new sweep trial) of the same step and script with any args.
+        """
+        if key is None:
+            return None
+        by_args = self.data['steps'].get(key[0], {})
+        hosts = by_args.get(key[1], {}).get('hosts', {})
+        if hosts.get(host):
+            return self._median(hosts[host])
+        if hosts:
+            return self._median([d for samples in hosts.values() for d in samples])
+        return self._median([
+            d for entry in by_args.values() if entry['step'] == step
+            for samples in entry['hosts'].values() for d in samples
+        ])
+
+    def estimate(self, cfg: Dict[str, Any], host: str = ANY_HOST) -> Optional[Dict[str, float]]:
+        """
+        Predicted ``{'setup', 'run'}`` seconds of an instance, or None when some of its steps
+        have never run. Without a record of the whole instance, the run is the longest chain
+        of step estimates through its dependency graph (their sum for sequential pipelines).
+        """
+        key = self.instance_key(cfg)
+        hosts = self.data['instances'].get(key, {}) if key else {}
+        entries = [hosts[host]] if hosts.get(host) else list(hosts.values())
+        if entries:
+            return {
+                'setup': self._median([d for e in entries for d in e['setup']]),
+                'run': self._median([d for e in entries for d in e['run']]),
+            }
+
+        durations = {name: self.step_estimate(k, name, host) for name, k in self.step_keys(cfg).items()}
+        if None in durations.values():
+            return None
+        if (cfg.get('max_parallel_steps') or 1) <= 1:
+            return {'setup': 0.0, 'run': sum(durations.values())}
+        deps = resolve_dependencies(cfg.get('pipelines') or {})
+        finish: Dict[str, float] = {}
+
+        def finish_of(name) -> float:
+            if name not in finish:
+                finish[name] = durations[name] + max((finish_of(d) for d in deps.get(name, [])), default=0.0)
+            return finish[name]
+
+        return {'setup': 0.0, 'run': max((finish_of(name) for name in durations), default=0.0)}
+
+    def record_run(self, configs: Dict[str, Dict[str, Any]], table: Dict[str, Dict[str, Any]],
+                   hosts: Dict[str, str], skip=()):
+        """
+        Fold a finished run into the history: every step that ran to completion (not restored
+        from the step cache), and the setup and run time of every instance that completed.
+
+        Args:
+            configs (dict): worker_id -> instance config
+            table (dict): status table folded by StatusChannel (rows carry 'timings' and 'steps')
+            hosts (dict): worker_id -> host the instance ran on
+            skip (iterable): instances whose run time is not representative (e.g. resumed ones)
+        """
+        for worker_id, cfg in configs.items():
+            row = table.get(worker_id) or {}
+            host = hosts.get(worker_id, ANY_HOST)
+            keys = self.step_keys(cfg)
+            steps = {}
+            for timing in row.get('timings', []):
+                name = timing['phase'][len('step:'):] if timing['phase'].startswith('step:') else None
+                if (name in keys and keys[name] and timing.get('ok') and not timing.get('cached')
+                        and (row.get('steps') or {}).get(name, {}).get('state') == 'done'):
+                    self.record_step(keys[name], name, host, timing['duration'])
+                    steps[name] = timing
+            key = self.instance_key(cfg)
+            if not key or worker_id in skip or row.get('status') != 'completed' or len(steps) != len(keys):
+                continue
+            setup = sum(t['duration'] for t in row.get('timings', []) if t['phase'] in SETUP_PHASES)
+            # Wall-clock span of the steps: with max_parallel_steps > 1 they overlap.
+            run = max(t['ts'] for t in steps.values()) - min(t['ts'] - t['duration'] for t in steps.values())
+            self.record_instance(key, host, setup, run)
+
+
+def admission_order(configs: Dict[str, Dict[str, Any]], estimates: Dict[str, Optional[float]],
+                    order: str = 'config') -> List[str]:
+    """
+    Instance ids sorted by descending priority, then by predicted duration: longest first
+    (the longest-processing-time rule, which keeps the makespan short) or shortest first (for
+    quick feedback). Instances without an estimate count as the median of the others; config
+    order breaks ties.
+    """
+    known = [e for e in estimates.values() if e is not None]
+    fallback = statistics.median(known) if known else 0.0
+    sign = {'longest_first': -1, 'shortest_first': 1}.get(order, 0)
+
+    def key(wid):
+        estimate = estimates.get(wid)
+        return -configs[wid].get('priority', 0), sign * (fallback if estimate is None else estimate)
+
+    return sorted(configs, key=key)
+
+
+def simulate_schedule(order: List[str], durations: Dict[str, Dict[str, float]], requests: Dict[str, Dict[str, Any]],
+                      scheduler: ResourceScheduler, max_concurrent_setups: int) -> Dict[str, Dict[str, float]]:
+    """
+    Replay the admission loop on predicted durations: setups run ``max_concurrent_setups``
+    at a time in admission order, and each instance starts once its setup is done and the
+    scheduler admits it. Capacity of host pools is not modelled.
+
+    Args:
+        order (list): instance ids in admission order
+        durations (dict): worker_id -> {'setup', 'run'} seconds
+        requests (dict): worker_id -> scheduler request ({'cpus', 'memory_gb', 'local'})
+        scheduler (ResourceScheduler): an idle scheduler with the run's capacity
+        max_concurrent_setups (int): size of the setup pool
+
+    Returns:
+        worker_id -> {'setup_start', 'start', 'end'} in seconds from the start of the run
+    """
+    schedule = {wid: {} for wid in order}
+    pending = list(order)
+    ready: List[str] = []
+    events: List[Tuple[float, int, str, str]] = []  # (time, seq, kind, worker_id)
+    setting_up = 0
+    now = 0.0
+    seq = 0
+    while True:
+        while pending and setting_up < max_concurrent_setups:
+            wid = pending.pop(0)
+            schedule[wid]['setup_start'] = now
+            heapq.heappush(events, (now + durations[wid]['setup'], seq, 'ready', wid))
+            seq += 1
+            setting_up += 1
+        for wid in list(ready):
+            if scheduler.try_acquire(**requests[wid]):
+                ready.remove(wid)
+                schedule[wid]['start'] = now
+                heapq.heappush(events, (now + durations[wid]['run'], seq, 'done', wid))
+                seq += 1
+        if not events:
+            return schedule
+        now = events[0][0]
+        while events and events[0][0] == now:
+            _, _, kind, wid = heapq.heappop(events)
+            if kind == 'ready':
+                setting_up -= 1
+                ready.append(wid)
+                ready.sort(key=order.index)
+            else:
+                scheduler.release(**requests[wid])
+                schedule[wid]['end'] = now
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def print_plan(schedule: Dict[str, Dict[str, float]], names: Dict[str, str], unknown=()):
+    """Print the predicted schedule, in start order, and its makespan."""
+    width = max([len(name) for name in names.values()] + [8])
+    print(f"{'INSTANCE':<{width}}  {'SETUP AT':>9}  {'START':>9}  {'END':>9}  {'RUN':>9}")
+    for wid, times in sorted(schedule.items(), key=lambda item: (item[1]['start'], item[1]['setup_start'])):
+        run = _format_duration(times['end'] - times['start'])
+        if wid in unknown:
+            run += " (no history)"
+        print(f"{names[wid]:<{width}}  {_format_duration(times['setup_start']):>9}  "
+              f"{_format_duration(times['start']):>9}  {_format_duration(times['end']):>9}  {run:>9}")
+    makespan = max((times['end'] for times in schedule.values()), default=0.0)
+    print(f"Predicted makespan: {_format_duration(makespan)}")
+    if unknown and len(unknown) == len(schedule):
+        print("No duration history for these instances yet: the prediction needs at least one earlier run")
+    elif unknown:
+        print(f"{len(unknown)} instance(s) without history were counted as the median of the others")
+
+
+def build_duration_history(config: Optional[dict]) -> Optional[DurationHistory]:
+    """Create the DurationHistory of the ``history`` config section, or None when disabled."""
+    config = config or {}
+    if not config.get('enabled', True):
+        return None
+    return DurationHistory(config.get('file') or DURATIONS_FILE, max_samples=config.get('max_samples', DEFAULT_MAX_SAMPLES))
@@ -1,49 +1,88 @@
 import os
 import sys
+import time
+import asyncio
 import subprocess
+import shlex
 from pathlib import Path
 import platform
+import uuid
+import selectors
+import tempfile
+import threading
 
-from flowkestra.utils import SSHClient
+from flowkestra.utils import SSHClient, quote_path
+from flowkestra.logs import StepLog
+from flowkestra.metrics import PhaseTimer
+from flowkestra.venv_cache import VenvCache
+from flowkestra.wheelhouse import Wheelhouse
+from flowkestra.affinity import THREAD_ENV_VARS, pin_process
+from flowkestra.sampling import sampler_for, remote_pidfile
+from flowkestra.early_stopping import (
+    METRICS_ENV, METRICS_FILE_PREFIX, STOP_GRACE_SECONDS, STOP_POLL_SECONDS,
+    EarlyStopped, metric_tail_for, remote_terminate_command
+)
+from flowkestra.detached import DEFAULT_POLL_INTERVAL, DetachedJob, job_dir, job_tracker_for, launch_command
+from flowkestra.fork_server import (
+    SCRIPT as FORK_SERVER_SCRIPT, DEFAULT_IDLE_TIMEOUT,
+    client_command, socket_name, script_digest, supported as fork_server_supported
+)
+
+# Remote venvs the fork server script was already copied into, per SSH client
+_fork_server_installs = set()
+_fork_server_installs_lock = threading.Lock()
 
 #ALL MESSAGES PRINTED FROM THIS CLASS SHOULD BE HANDLED BY WORKER HENCE ALL SUPRESSED OUTPUTS
 class Runner:
-    def __init__(self, workdir, venv_name="venv", ssh_client: SSHClient =None, suppress_output=True):
+    def __init__(self, workdir, venv_name="venv", ssh_client: SSHClient =None, suppress_output=True, venv_cache: VenvCache = None, timer: PhaseTimer = None, wheelhouse: Wheelhouse = None, sample_interval=None,
+                 metric_interval=None, stop_grace=STOP_GRACE_SECONDS, fork_server=None, detached=None):
         """
         Args:
             workdir (str or Path): working directory (local or remote)
             venv_name (str): virtual environment name
             ssh_client (SSHClient, optional): if provided, scripts run remotely
             suppress_output (bool): If True, suppress stdout/stderr from setup commands.
+            venv_cache (VenvCache, optional): if provided, environments are shared through the cache
+            timer (PhaseTimer, optional): if provided, venv creation and pip install are timed
+            wheelhouse (Wheelhouse, optional): if provided, requirements are installed offline from
+                wheels built once per requirements/interpreter
+            sample_interval (float, optional): if provided, scripts given an ``on_sample`` callback
+                have their CPU, memory and I/O sampled at this interval
+            metric_interval (float, optional): if provided, scripts given an ``on_metric`` callback
+                get a metrics file (``FLOWKESTRA_METRICS_FILE``) that is read at this interval
+            stop_grace (float): seconds a script stopped early gets to exit on SIGTERM before SIGKILL
+            fork_server (dict, optional): the ``fork_server`` section; scripts then start as forks of
+                a warm interpreter per venv with its modules preloaded (steps can opt in or out)
+            detached (dict, optional): the ``detached`` section; remote scripts then run detached
+                from the SSH session and are followed by polling instead of a held channel
         """
         self.workdir = Path(workdir).resolve() if ssh_client is None else Path(workdir)
         self.venv_name = venv_name
+        self.venv_path = self.workdir / self.venv_name
         self.ssh_client = ssh_client
         self.suppress_output = suppress_output
+        self.venv_cache = venv_cache
+        self.wheelhouse = wheelhouse
+        # Cores local scripts are pinned to (set by the supervisor when it partitions the host)
+        self.cpu_cores = None
+        self.timer = timer or PhaseTimer()
+        self.sample_interval = sample_interval
+        self.metric_interval = metric_interval
+        self.stop_grace = stop_grace
+        self.fork_server = fork_server or {}
+        self.detached = detached or {}
+        # Detected on the first setup_environment() so constructing a Runner needs no round trip.
         self.remote_is_windows = None
 
-        if self.ssh_client:
-            self.remote_is_windows = self._detect_remote_os()
-
     def _detect_remote_os(self):
-        """Detect if the remote server is Windows. Call this once during init."""
-        try:
-            # The 'ver' command is specific to Windows and will typically fail on Unix-like systems.
-            # We rely on the command execution to fail (raising an exception) to infer a non-Windows OS.
-            out, _ = self.ssh_client.execute("ver", suppress_output=True)
-            if out and 'windows' in out.lower():
-                if not self.suppress_output:
-                    print("Detected remote OS: Windows")
-                return True
-        except Exception:
-            # Assuming any error means it's not a Windows shell that knows 'ver'
-            pass
+        """Detect if the remote server is Windows, using the host facts cached by the SSH pool."""
+        is_windows = self.ssh_client.host_facts().get('os') == 'windows'
         if not self.suppress_output:
-            print("Detected remote OS: Unix-like")
-        return False
+            print(f"Detected remote OS: {'Windows' if is_windows else 'Unix-like'}")
+        return is_windows
     
     def _get_venv_python(self):
-        venv_path = self.workdir / self.venv_name
+        venv_path = self.venv_path
 
         if self.ssh_client:
             if self.remote_is_windows:
@@ -57,7 +96,7 @@ class Runner:
                 return venv_path / "bin" / "python"
 
     def _get_pip(self):
-        venv_path = self.workdir / self.venv_name
+        venv_path = self.venv_path
 
         if self.ssh_client:
             if self.remote_is_windows:
@@ -70,96 +109,652 @@ class Runner:
             else:
                 return venv_path / "bin" / "pip"
 
-    def setup_environment(self, requirements):
-        """Set up virtual environment and install requirements."""
+    def setup_environment(self, requirements, local_requirements=None):
+        """
+        Set up virtual environment and install requirements.
+
+        Args:
+            requirements (str or Path): requirements file in the workdir (local or remote)
+            local_requirements (str or Path, optional): local copy of it, needed by the wheelhouse
+        """
+        if self.ssh_client and self.remote_is_windows is None:
+            self.remote_is_windows = self._detect_remote_os()
+
+        if self.ssh_client:
+            self.ssh_client.execute(f"mkdir -p {quote_path(self.workdir)}", suppress_output=self.suppress_output)
+        else:
+            self.workdir.mkdir(parents=True, exist_ok=True)
+
+        if self.venv_cache and not self.remote_is_windows:
+            self.venv_path = self.venv_cache.ensure(
+                requirements,
+                lambda venv_path: self._build_venv(venv_path, requirements, local_requirements),
+                lease=True
+            )
+        else:
+            self.venv_path = self.workdir / self.venv_name
+            self._build_venv(self.venv_path, requirements, local_requirements)
+
+    def reuse_environment(self, venv_path, required=()) -> bool:
+        """
+        Adopt an environment built by an earlier (interrupted) run if the workdir, the venv's
+        interpreter and the required files (e.g. the synced scripts) are still there. Returns
+        False, changing nothing, when they are not.
+        """
+        if self.ssh_client and self.remote_is_windows is None:
+            self.remote_is_windows = self._detect_remote_os()
+        if self.ssh_client and self.remote_is_windows:
+            return False
+        previous, self.venv_path = self.venv_path, Path(venv_path)
+        python = self._get_venv_python()
+        if self.ssh_client:
+            checks = [f"test -d {quote_path(self.workdir)}", f"test -x {quote_path(python)}"]
+            checks += [f"test -e {quote_path(path)}" for path in required]
+            out, _ = self.ssh_client.execute(" && ".join(checks) + " && echo ok", suppress_output=True)
+            found = out.strip() == "ok"
+        else:
+            found = self.workdir.is_dir() and python.exists() and all(Path(path).exists() for path in required)
+        if not found:
+            self.venv_path = previous
+        elif self.venv_cache and self.venv_path.parent == self.venv_cache.cache_dir:
+            # A cached environment: keep it from being evicted while we use it.
+            self.venv_cache.lease(self.venv_path)
+        return found
+
+    def release_environment(self):
+        """Let the venv cache evict the environment again once this runner's steps are done."""
+        if self.venv_cache:
+            self.venv_cache.release()
+
+    def _wheel_dir(self, requirements, local_requirements):
+        """Directory to install from offline, or None when the wheelhouse doesn't apply."""
+        if not self.wheelhouse or self.remote_is_windows:
+            return None
+        with self.timer.phase('environment/wheelhouse'):
+            return self.wheelhouse.prepare(
+                local_requirements or requirements,
+                ssh_client=self.ssh_client,
+                pip=self._get_pip(),
+                remote_requirements=requirements
+            )
+
+    def _run_setup_batch(self, commands, phases):
+        """Run setup commands in one remote batch, reporting each command's time under its phase."""
+        results = self.ssh_client.run_batch(commands, suppress_output=self.suppress_output)
+        durations = {}
+        for phase, result in zip(phases, results):
+            if result.duration is not None:
+                durations[phase] = durations.get(phase, 0.0) + result.duration
+        for phase, duration in durations.items():
+            self.timer.record(phase, duration, ok=results.ok)
+        results.raise_for_status()
+
+    def _build_venv(self, venv_path, requirements, local_requirements=None):
+        """Create the virtual environment at venv_path and install requirements into it."""
         stdout = subprocess.DEVNULL if self.suppress_output else None
         stderr = subprocess.DEVNULL if self.suppress_output else None
 
+        self.venv_path = Path(venv_path)
         if self.ssh_client:
-            # Remote
-            cmds = [
-                f"mkdir -p {self.workdir}",
-                f"python3 -m venv {self.workdir / self.venv_name}",
-                f"{self._get_pip()} install --upgrade pip",
-                f"{self._get_pip()} install -r {requirements}"
-            ]
-            for cmd in cmds:
-                self.ssh_client.execute(cmd, suppress_output=self.suppress_output)
+            # Remote: venv creation and installs go out as batches, one round trip each
+            pip = quote_path(self._get_pip())
+            commands = [f"python3 -m venv {quote_path(self.venv_path)}"]
+            if self.wheelhouse and not self.remote_is_windows:
+                # The wheelhouse may build with the new venv's pip, so create it first.
+                self._run_setup_batch(commands, ['environment/venv_create'])
+                wheel_dir = self._wheel_dir(requirements, local_requirements)
+                # Every wheel is already on the host; the venv's bundled pip can install them.
+                commands = [f"{pip} install --no-index --find-links {quote_path(wheel_dir)} -r {quote_path(requirements)}"]
+                self._run_setup_batch(commands, ['environment/pip_install'])
+            else:
+                commands += [f"{pip} install --upgrade pip", f"{pip} install -r {quote_path(requirements)}"]
+                self._run_setup_batch(commands, ['environment/venv_create', 'environment/pip_install', 'environment/pip_install'])
         else:
             # Local
-            self.workdir.mkdir(parents=True, exist_ok=True)
-            venv_path = self.workdir / self.venv_name
-            if not venv_path.exists():
+            with self.timer.phase('environment/venv_create'):
+                if not self.venv_path.exists():
+                    subprocess.run(
+                        [sys.executable, "-m", "venv", str(self.venv_path)],
+                        check=True,
+                        stdout=stdout,
+                        stderr=stderr
+                    )
+            pip_path = self._get_pip()
+            wheel_dir = self._wheel_dir(requirements, local_requirements)
+            with self.timer.phase('environment/pip_install'):
+                if wheel_dir:
+                    # Offline install from the wheelhouse; no pip self-upgrade needed for that.
+                    subprocess.run(
+                        [str(pip_path), "install", "--no-index", "--find-links", str(wheel_dir), "-r", str(requirements)],
+                        check=True,
+                        stdout=stdout,
+                        stderr=stderr
+                    )
+                    return
                 subprocess.run(
-                    [sys.executable, "-m", "venv", str(venv_path)],
+                    [str(pip_path), "install", "--upgrade", "pip"],
                     check=True,
                     stdout=stdout,
                     stderr=stderr
                 )
-            pip_path = self._get_pip()
-            subprocess.run(
-                [str(pip_path), "install", "--upgrade", "pip"],
-                check=True,
-                stdout=stdout,
-                stderr=stderr
+                subprocess.run(
+                    [str(pip_path), "install", "-r", str(requirements)],
+                    check=True,
+                    stdout=stdout,
+                    stderr=stderr
+                )
+
+    def _command(self, script_path, args=None, fork=False, pidfile=None, env=None):
+        script_path = Path(script_path).resolve()
+        if fork:
+            python = self._get_venv_python()
+            preload = list(self.fork_server.get('preload') or [])
+            thread_env = {name: (env or {})[name] for name in THREAD_ENV_VARS if name in (env or {})}
+            return client_command(
+                python, self._fork_server_script(), socket_name(python, preload, thread_env), script_path, args,
+                preload=preload,
+                idle_timeout=self.fork_server.get('idle_timeout', DEFAULT_IDLE_TIMEOUT),
+                pidfile=pidfile,
+                # The step is forked from the server: pinning the client alone wouldn't reach it.
+                cores=self.cpu_cores
             )
-            subprocess.run(
-                [str(pip_path), "install", "-r", str(requirements)],
-                check=True,
-                stdout=stdout,
-                stderr=stderr
+        cmd_parts = [str(self._get_venv_python()), str(script_path)]
+        if args:
+            cmd_parts.extend(args)
+        return cmd_parts
+
+    def _use_fork_server(self, requested=None) -> bool:
+        """Whether a script runs through the fork server: the step's own choice, else the config's."""
+        enabled = self.fork_server.get('enabled', False) if requested is None else requested
+        if not enabled:
+            return False
+        if self.ssh_client:
+            return not self.remote_is_windows
+        return fork_server_supported()
+
+    def _fork_server_script(self):
+        """The fork server's file on the host: the package's own locally, a copy in the remote venv."""
+        if not self.ssh_client:
+            return FORK_SERVER_SCRIPT
+        target = f"{self.venv_path}/flowkestra-fork-server-{script_digest()}.py"
+        with _fork_server_installs_lock:
+            if (id(self.ssh_client), target) not in _fork_server_installs:
+                source = Path(FORK_SERVER_SCRIPT).read_text()
+                quoted = quote_path(target)
+                _, err, exit_status = self.ssh_client.pipe(
+                    f"if [ -f {quoted} ]; then cat > /dev/null; else cat > {quoted}.$$ && mv {quoted}.$$ {quoted}; fi",
+                    lambda stdin: stdin.write(source)
+                )
+                if exit_status != 0:
+                    raise RuntimeError(f"Installing the fork server in {self.venv_path} failed: {err}")
+                _fork_server_installs.add((id(self.ssh_client), target))
+        return target
+
+    @staticmethod
+    def _local_pidfile():
+        # Written by the fork server client once the step's pid is known (it isn't the client's own).
+        return os.path.join(tempfile.gettempdir(), f"flowkestra-{uuid.uuid4().hex[:16]}.pid")
+
+    def _remote_command(self, cmd_parts, additional_env=None, pidfile=None, metrics_file=None):
+        # Remote execution: join parts into a command string. The pidfile stays double-quoted so
+        # its ${TMPDIR:-/tmp} expands; everything else is quoted for the remote shell.
+        cmd = " ".join(f'"{part}"' if part == pidfile else quote_path(part) for part in map(str, cmd_parts))
+        env_str = ""
+        if additional_env:
+            env_str = " ".join(f"{k}={shlex.quote(str(v))}" for k, v in additional_env.items())
+        prefix = f"cd {quote_path(self.workdir)}"
+        if metrics_file:
+            # Absolute path via $PWD: a '~' in the workdir wouldn't expand inside the quoted env value.
+            prefix += f" && : > {shlex.quote(metrics_file)} && export {METRICS_ENV}=\"$PWD/{metrics_file}\""
+        if pidfile:
+            # exec keeps the shell's pid, so $$ is the script's pid for the sampler and for stopping.
+            return f"{prefix} && echo $$ > \"{pidfile}\" && exec env {env_str} {cmd}"
+        return f"{prefix} && {env_str} {cmd}" if env_str else f"{prefix} && {cmd}"
+
+    def _watch(self, on_sample, pid=None, stoppable=False):
+        """
+        Start sampling a script if requested. Returns (key, remote pidfile): key is None if not
+        sampled, the pidfile is set for remote scripts that are sampled or can be stopped.
+        """
+        if self.ssh_client and self.remote_is_windows:
+            return None, None
+        sampled = bool(on_sample and self.sample_interval)
+        key = uuid.uuid4().hex[:16]
+        pidfile = remote_pidfile(key) if self.ssh_client and (sampled or stoppable) else None
+        if not sampled:
+            return None, pidfile
+        sampler_for(self.ssh_client, self.sample_interval).watch(key, pidfile or pid, on_sample)
+        return key, pidfile
+
+    def _unwatch(self, key):
+        if key:
+            sampler_for(self.ssh_client, self.sample_interval).unwatch(key)
+
+    def _follow_metrics(self, on_metric, env=None):
+        """
+        Give a script a metrics file if requested. Returns (key, file name, env); the local
+        file is created and named in env, a remote one is created by the command itself.
+        """
+        if not (on_metric and self.metric_interval) or (self.ssh_client and self.remote_is_windows):
+            return None, None, env
+        key = uuid.uuid4().hex[:16]
+        name = f"{METRICS_FILE_PREFIX}{key}.jsonl"
+        if self.ssh_client:
+            path = f"{self.workdir}/{name}"
+        else:
+            path = self.workdir / name
+            path.write_bytes(b"")
+            env = {**(env or {}), METRICS_ENV: str(path)}
+        metric_tail_for(self.ssh_client, self.metric_interval).watch(key, path, on_metric)
+        return key, name, env
+
+    def _unfollow_metrics(self, key, name):
+        if not key:
+            return
+        metric_tail_for(self.ssh_client, self.metric_interval).unwatch(key)
+        if not self.ssh_client:
+            (self.workdir / name).unlink(missing_ok=True)
+
+    def _stop_remote(self, stop, pidfile, finished: threading.Event, stopped: threading.Event, sampled: bool):
+        """Wait until the remote script finishes or stop is set; in the latter case terminate it."""
+        while not finished.wait(STOP_POLL_SECONDS):
+            if stop.is_set():
+                stopped.set()
+                self.ssh_client.execute(remote_terminate_command(pidfile, self.stop_grace), suppress_output=True)
+                finished.wait()
+                break
+        if not sampled:
+            # The sampler reaps its own pidfiles; this one was only needed for stopping.
+            self._remove_remote_pidfile(pidfile)
+
+    def _terminate_remote(self, pidfile):
+        """Kill a timed-out remote script through its pidfile; nothing to do if the host is gone."""
+        try:
+            self.ssh_client.execute(remote_terminate_command(pidfile, 0), suppress_output=True)
+        except Exception:
+            pass
+
+    def _remove_remote_pidfile(self, pidfile):
+        try:
+            self.ssh_client.execute(f"rm -f \"{pidfile}\"", suppress_output=True)
+        except Exception:
+            pass
+
+    def use_detached(self) -> bool:
+        """Whether remote scripts run detached (nohup/setsid) and are polled for, rather than on a held channel."""
+        return bool(self.ssh_client and self.detached.get('enabled') and not self.remote_is_windows)
+
+    def _launch_detached(self, full_cmd, on_data, pidfile, sampled: bool) -> DetachedJob:
+        """Start full_cmd detached on the remote host and have the host's JobTracker follow it."""
+        key = uuid.uuid4().hex[:16]
+        job = DetachedJob(key, job_dir(self.workdir, key), on_data, cleanup=[] if sampled or not pidfile else [pidfile])
+        out, err = self.ssh_client.execute(launch_command(self.workdir, key, full_cmd) + " && echo started")
+        if not out.endswith("started"):
+            raise RuntimeError(f"Launching a detached job in {self.workdir} failed: {err}")
+        return self._job_tracker().track(job)
+
+    def _job_tracker(self):
+        return job_tracker_for(self.ssh_client, self.detached.get('poll_interval', DEFAULT_POLL_INTERVAL))
+
+    def _abandon_detached(self, job: DetachedJob, pidfile, grace) -> bool:
+        """
+        Terminate a detached job's script and stop following it; its files are removed on the host
+        once the SIGKILL deadline has passed. False if the host couldn't be reached (try again later).
+        """
+        paths = [quote_path(job.path)] + [f'"{path}"' for path in job.cleanup]
+        reap = shlex.quote(f"sleep {grace + 1}; rm -rf {' '.join(paths)}")
+        try:
+            self.ssh_client.execute(
+                f"{remote_terminate_command(pidfile, grace)}; nohup sh -c {reap} >/dev/null 2>&1 </dev/null &",
+                suppress_output=True
             )
+        except Exception:
+            return False
+        job.on_data = lambda stream, data: None
+        self._job_tracker().untrack(job.key)
+        return True
+
+    def _detached_result(self, job: DetachedJob, full_cmd, log: StepLog = None):
+        if job.lost and log:
+            log.feed('stderr', b"flowkestra: the detached job vanished without an exit status\n")
+        return self._result(full_cmd, job.returncode, log)
+
+    def _run_detached(self, full_cmd, on_data, pidfile, sampled, log, timeout, stop):
+        """Wait for a detached job in the calling thread; output arrives through the tracker."""
+        job = self._launch_detached(full_cmd, on_data, pidfile, sampled)
+        deadline = time.monotonic() + timeout if timeout else None
+        while not job.done.wait(STOP_POLL_SECONDS):
+            if stop is not None and stop.is_set() and self._abandon_detached(job, pidfile, self.stop_grace):
+                return self._stopped(full_cmd, log)
+            if deadline and time.monotonic() > deadline:
+                # If the host can't be reached, the tracker keeps following the job and reaps its files.
+                self._abandon_detached(job, pidfile, 0)
+                return self._timed_out(full_cmd, timeout, log)
+        return self._detached_result(job, full_cmd, log)
+
+    async def _run_detached_async(self, full_cmd, on_data, pidfile, sampled, log, timeout, stop):
+        """Coroutine version of _run_detached: waiting for the job takes no thread at all."""
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(None, self._launch_detached, full_cmd, on_data, pidfile, sampled)
+        done = loop.create_future()
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None)))
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            while not done.done():
+                wait = STOP_POLL_SECONDS if stop is not None else None
+                if deadline:
+                    remaining = max(0.0, deadline - time.monotonic())
+                    wait = remaining if wait is None else min(wait, remaining)
+                await asyncio.wait({done}, timeout=wait)
+                if done.done():
+                    break
+                if stop is not None and stop.is_set():
+                    if await loop.run_in_executor(None, self._abandon_detached, job, pidfile, self.stop_grace):
+                        return self._stopped(full_cmd, log)
+                if deadline and time.monotonic() >= deadline:
+                    await loop.run_in_executor(None, self._abandon_detached, job, pidfile, 0)
+                    return self._timed_out(full_cmd, timeout, log)
+        except asyncio.CancelledError:
+            # Detached jobs outlive the supervisor: stop following this one, leave it running.
+            job.on_data = lambda stream, data: None
+            raise
+        return self._detached_result(job, full_cmd, log)
+
+    @staticmethod
+    def _local_env(additional_env=None):
+        # Local execution: inherit from os.environ and add/override with additional_env
+        env = os.environ.copy()
+        if additional_env:
+            env.update(additional_env)
+        return env
 
-    def run_script(self, script_path, args=None, additional_env=None):
+    def run_script(self, script_path, args=None, additional_env=None, log: StepLog = None, timeout=None, on_sample=None,
+                   on_metric=None, stop=None, fork_server=None):
         """
         Run a Python script in local or remote environment.
-        Output is suppressed unless self.suppress_output is False.
+        Output is read incrementally and written to ``log``; it is also echoed to the
+        console unless self.suppress_output is True. Memory use is bounded by the log's tail.
         
         Args:
             script_path (str or Path)
             args (list of str, optional): Arguments to pass to the script.
             additional_env (dict, optional)
+            log (StepLog, optional): sink for the step's stdout/stderr
+            timeout (float, optional): kill the script after this many seconds
+            on_sample (callable, optional): receives the script's resource samples (needs sample_interval)
+            on_metric (callable, optional): receives each metric the script reports (needs metric_interval)
+            stop (Event, optional): when set, the script is terminated (SIGTERM, then SIGKILL
+                after stop_grace seconds)
+            fork_server (bool, optional): run through the fork server (True) or as a plain
+                subprocess (False); None follows the ``fork_server`` config
+
+        With ``detached`` enabled, a remote script is started detached from the SSH session and
+        its output is read by polling, so a dropped connection doesn't end the step.
+
+        Returns:
+            subprocess.CompletedProcess, subprocess.CalledProcessError on a non-zero exit,
+            subprocess.TimeoutExpired, or EarlyStopped if ``stop`` was set while it ran.
+            ``stdout`` holds the tail of the output kept by ``log``.
         """
-        script_path = Path(script_path).resolve()
-        
-        venv_python = self._get_venv_python()
-        
-        # Construct the command
-        cmd_parts = [str(venv_python), str(script_path)]
-        if args:
-            cmd_parts.extend(args)
-        
-        if self.ssh_client:
-            # Remote execution: join parts into a command string
-            cmd = " ".join(cmd_parts)
-            env_str = ""
-            if additional_env:
-                env_str = " ".join(f"{k}='{v}'" for k, v in additional_env.items())
-
-            full_cmd = f"cd {self.workdir} && {env_str} {cmd}" if env_str else f"cd {self.workdir} && {cmd}"
-            # Respect the suppress_output flag
-            out, err = self.ssh_client.execute(full_cmd, suppress_output=self.suppress_output)
-            return out, err
+        fork = self._use_fork_server(fork_server)
+        on_data = self._output_handler(log)
+        metrics_key, metrics_file, additional_env = self._follow_metrics(on_metric, additional_env)
+
+        # Everything after _follow_metrics runs under a finally that stops following, even if
+        # the script can't be started.
+        key = None
+        if self.ssh_client and self.use_detached():
+            try:
+                # Detached jobs are always stoppable: timeouts terminate them through the pidfile too.
+                key, pidfile = self._watch(on_sample, stoppable=True)
+                cmd_parts = self._command(script_path, args, fork=fork, pidfile=pidfile, env=additional_env)
+                full_cmd = self._remote_command(cmd_parts, additional_env, pidfile=pidfile, metrics_file=metrics_file)
+                return self._run_detached(full_cmd, on_data, pidfile, key is not None, log, timeout, stop)
+            finally:
+                self._unwatch(key)
+                self._unfollow_metrics(metrics_key, metrics_file)
+        elif self.ssh_client:
+            finished, stopped = threading.Event(), threading.Event()
+            try:
+                # A timeout needs the pidfile too: hanging up the channel doesn't signal a command without a pty.
+                key, pidfile = self._watch(on_sample, stoppable=stop is not None or bool(timeout))
+                cmd_parts = self._command(script_path, args, fork=fork, pidfile=pidfile, env=additional_env)
+                full_cmd = self._remote_command(cmd_parts, additional_env, pidfile=pidfile, metrics_file=metrics_file)
+                if stop is not None and pidfile:
+                    threading.Thread(
+                        target=self._stop_remote, args=(stop, pidfile, finished, stopped, key is not None), daemon=True
+                    ).start()
+                returncode = self.ssh_client.execute_streaming(full_cmd, on_data, timeout=timeout)
+                if returncode is None and pidfile and not stopped.is_set():
+                    self._terminate_remote(pidfile)
+            finally:
+                finished.set()
+                self._unwatch(key)
+                self._unfollow_metrics(metrics_key, metrics_file)
+            if pidfile and stop is None and key is None:
+                # Only kept for the timeout; the sampler and _stop_remote remove their own.
+                self._remove_remote_pidfile(pidfile)
+            if stopped.is_set():
+                return self._stopped(full_cmd, log)
+            if returncode is None:
+                return self._timed_out(full_cmd, timeout, log)
+            return self._result(full_cmd, returncode, log)
         else:
-            # Local execution: inherit from os.environ and add/override with additional_env
-            env = os.environ.copy()
-            if additional_env:
-                env.update(additional_env)
-
-            # If suppressing, capture output. If not, let it stream to console.
-            capture = self.suppress_output
-            
+            pidfile = self._local_pidfile() if fork and on_sample and self.sample_interval else None
             try:
+                cmd_parts = self._command(script_path, args, fork=fork, pidfile=pidfile, env=additional_env)
                 # When shell=False (safer), pass command as a list.
-                result = subprocess.run(
+                process = subprocess.Popen(
                     cmd_parts,
                     shell=False,
-                    check=True,
-                    env=env,
-                    text=True,
-                    capture_output=capture,
+                    env=self._local_env(additional_env),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
                     cwd=self.workdir
                 )
-                return result
-            except subprocess.CalledProcessError as e:
-                return e
\ No newline at end of file
+                pin_process(process.pid, self.cpu_cores)
+                key, _ = self._watch(on_sample, pid=pidfile or process.pid)
+                deadline = time.monotonic() + timeout if timeout else None
+                if not self._pump_local(process, on_data, deadline=deadline, stop=stop):
+                    if stop is not None and stop.is_set():
+                        # Keep draining the output while the script shuts down on SIGTERM.
+                        process.terminate()
+                        if not self._pump_local(process, on_data, deadline=time.monotonic() + self.stop_grace):
+                            process.kill()
+                        process.wait()
+                        return self._stopped(cmd_parts, log)
+                    process.kill()
+                    process.wait()
+                    return self._timed_out(cmd_parts, timeout, log)
+                returncode = process.wait()
+            finally:
+                self._unwatch(key)
+                self._unfollow_metrics(metrics_key, metrics_file)
+                if pidfile:
+                    Path(pidfile).unlink(missing_ok=True)
+            return self._result(cmd_parts, returncode, log)
+
+    async def run_script_async(self, script_path, args=None, additional_env=None, log: StepLog = None, timeout=None,
+                               on_sample=None, on_metric=None, stop=None, fork_server=None):
+        """
+        Coroutine version of run_script for local scripts and detached remote ones, driven by the
+        running event loop instead of a thread. Cancelling it kills a local script; a detached
+        one is left running.
+        """
+        if self.ssh_client and self.use_detached():
+            fork = self._use_fork_server(fork_server)
+            on_data = self._output_handler(log)
+            metrics_key, metrics_file, additional_env = self._follow_metrics(on_metric, additional_env)
+            key = None
+            try:
+                key, pidfile = self._watch(on_sample, stoppable=True)
+                cmd_parts = self._command(script_path, args, fork=fork, pidfile=pidfile, env=additional_env)
+                full_cmd = self._remote_command(cmd_parts, additional_env, pidfile=pidfile, metrics_file=metrics_file)
+                return await self._run_detached_async(full_cmd, on_data, pidfile, key is not None, log, timeout, stop)
+            finally:
+                self._unwatch(key)
+                self._unfollow_metrics(metrics_key, metrics_file)
+        if self.ssh_client:
+            raise RuntimeError("run_script_async only runs local or detached scripts; run remote ones with run_script")
+
+        fork = self._use_fork_server(fork_server)
+        pidfile = self._local_pidfile() if fork and on_sample and self.sample_interval else None
+        cmd_parts = self._command(script_path, args, fork=fork, pidfile=pidfile, env=additional_env)
+        on_data = self._output_handler(log)
+        metrics_key, metrics_file, additional_env = self._follow_metrics(on_metric, additional_env)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd_parts,
+                env=self._local_env(additional_env),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=self.workdir
+            )
+        except BaseException:
+            self._unfollow_metrics(metrics_key, metrics_file)
+            if pidfile:
+                Path(pidfile).unlink(missing_ok=True)
+            raise
+        pin_process(process.pid, self.cpu_cores)
+        key, _ = self._watch(on_sample, pid=pidfile or process.pid)
+
+        async def pump(stream, name, chunk_size=32768):
+            while True:
+                chunk = await stream.read(chunk_size)
+                if not chunk:
+                    return
+                on_data(name, chunk)
+
+        async def stop_requested():
+            while not stop.is_set():
+                await asyncio.sleep(STOP_POLL_SECONDS)
+
+        output = asyncio.ensure_future(asyncio.wait_for(
+            asyncio.gather(pump(process.stdout, 'stdout'), pump(process.stderr, 'stderr')),
+            timeout
+        ))
+        stopper = asyncio.ensure_future(stop_requested()) if stop is not None else None
+        try:
+            if stopper:
+                await asyncio.wait({output, stopper}, return_when=asyncio.FIRST_COMPLETED)
+                if not output.done():
+                    # The output keeps draining while the script shuts down on SIGTERM.
+                    await self._terminate_async(process, self.stop_grace)
+                    return self._stopped(cmd_parts, log)
+            await output
+            returncode = await process.wait()
+        except asyncio.TimeoutError:
+            await self._kill_async(process)
+            return self._timed_out(cmd_parts, timeout, log)
+        except asyncio.CancelledError:
+            await self._kill_async(process)
+            raise
+        finally:
+            for task in (output, stopper):
+                if task and not task.done():
+                    task.cancel()
+            self._unwatch(key)
+            self._unfollow_metrics(metrics_key, metrics_file)
+            if pidfile:
+                Path(pidfile).unlink(missing_ok=True)
+        return self._result(cmd_parts, returncode, log)
+
+    @staticmethod
+    async def _terminate_async(process, grace):
+        if process.returncode is None:
+            try:
+                process.terminate()
+                await asyncio.wait_for(process.wait(), grace)
+            except ProcessLookupError:
+                pass
+            except asyncio.TimeoutError:
+                process.kill()
+        await process.wait()
+
+    @staticmethod
+    async def _kill_async(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+
+    def _output_handler(self, log: StepLog = None):
+        def on_data(stream, data: bytes):
+            if log:
+                log.feed(stream, data)
+            if not self.suppress_output:
+                target = sys.stdout if stream == 'stdout' else sys.stderr
+                target.write(data.decode(errors="replace"))
+                target.flush()
+        return on_data
+
+    @staticmethod
+    def _pump_local(process: subprocess.Popen, on_data, chunk_size=32768, deadline=None, stop=None) -> bool:
+        """
+        Forward a local process's stdout/stderr to on_data as chunks arrive.
+        Returns False if the ``time.monotonic()`` deadline passed or ``stop`` was set before both
+        streams closed. It can be called again to keep forwarding after that.
+        """
+        streams = {pipe: name for pipe, name in ((process.stdout, 'stdout'), (process.stderr, 'stderr'))
+                   if not pipe.closed}
+        if os.name == 'nt':
+            # Windows pipes can't be used with selectors: one reader thread per stream.
+            def reader(pipe, name):
+                for chunk in iter(lambda: pipe.read1(chunk_size), b""):
+                    on_data(name, chunk)
+            threads = getattr(process, '_flowkestra_readers', None)
+            if threads is None:
+                threads = [threading.Thread(target=reader, args=item, daemon=True) for item in streams.items()]
+                process._flowkestra_readers = threads
+                for t in threads:
+                    t.start()
+            for t in threads:
+                while t.is_alive():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if (remaining is not None and remaining <= 0) or (stop is not None and stop.is_set()):
+                        return False
+                    t.join(STOP_POLL_SECONDS if remaining is None else min(remaining, STOP_POLL_SECONDS))
+            return True
+
+        selector = selectors.DefaultSelector()
+        for pipe, name in streams.items():
+            os.set_blocking(pipe.fileno(), False)
+            selector.register(pipe, selectors.EVENT_READ, name)
+        try:
+            while selector.get_map():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                if stop is not None:
+                    if stop.is_set():
+                        return False
+                    remaining = STOP_POLL_SECONDS if remaining is None else min(remaining, STOP_POLL_SECONDS)
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fileobj.fileno(), chunk_size)
+                    if chunk:
+                        on_data(key.data, chunk)
+                    else:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+            return True
+        finally:
+            selector.close()
+
+    @staticmethod
+    def _result(args, returncode, log: StepLog = None):
+        tail = "\n".join(log.tail()) if log else None
+        if returncode != 0:
+            return subprocess.CalledProcessError(returncode, args, output=tail)
+        return subprocess.CompletedProcess(args, returncode, stdout=tail)
+
+    @staticmethod
+    def _timed_out(args, timeout, log: StepLog = None):
+        tail = "\n".join(log.tail()) if log else None
+        return subprocess.TimeoutExpired(args, timeout, output=tail)
+
+    @staticmethod
+    def _stopped(args, log: StepLog = None):
+        tail = "\n".join(log.tail()) if log else None
+        return EarlyStopped(args, output=tail)
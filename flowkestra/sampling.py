@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import shlex
+import threading
+import statistics
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from flowkestra.utils import SSHClient
+
+# Where a remote step's shell records its pid before exec'ing the script (expanded remotely).
+REMOTE_PID_DIR = "${TMPDIR:-/tmp}"
+# Flag a step as I/O-heavy when it moves this many times the bytes of its peers.
+IO_HEAVY_FACTOR = 2.0
+
+
+def remote_pidfile(key: str) -> str:
+    return f"{REMOTE_PID_DIR}/flowkestra-{key}.pid"
+
+
+# ---------- /proc parsing (shared by local and remote sampling) ----------
+def parse_stat(line: str, page_size: int) -> Tuple[int, dict]:
+    """Parse one ``/proc/<pid>/stat`` line into (pid, {ppid, cpu_ticks, threads, rss_bytes})."""
+    head, _, rest = line.rpartition(")")
+    fields = rest.split()
+    # fields[0] is field 3 (state): utime..cstime are fields 14-17, threads 20, rss 24.
+    return int(head.split("(", 1)[0]), {
+        'ppid': int(fields[1]),
+        'cpu_ticks': sum(int(f) for f in fields[11:15]),
+        'threads': int(fields[17]),
+        'rss_bytes': int(fields[21]) * page_size,
+    }
+
+
+def process_trees(procs: Dict[int, dict], roots: Dict[str, int]) -> Dict[str, list]:
+    """The pids of each live root's process tree, root first."""
+    children = defaultdict(list)
+    for pid, proc in procs.items():
+        children[proc['ppid']].append(pid)
+    trees = {}
+    for key, root in roots.items():
+        if root not in procs:
+            continue
+        tree, pending = [], [root]
+        while pending:
+            pid = pending.pop()
+            tree.append(pid)
+            pending.extend(children.get(pid, []))
+        trees[key] = tree
+    return trees
+
+
+def aggregate(procs: Dict[int, dict], io: Dict[int, Dict[str, int]], roots: Dict[str, int], clk_tck: int) -> Dict[str, dict]:
+    """
+    Sum each root's process tree into one sample: cpu_seconds (children already waited for
+    included), rss_bytes, read_bytes, write_bytes, threads and procs. Roots that are gone are left out.
+    """
+    samples = {}
+    for key, tree in process_trees(procs, roots).items():
+        members = [procs[pid] for pid in tree]
+        ticks = [proc['cpu_ticks'] for proc in members if proc.get('cpu_ticks') is not None]
+        samples[key] = {
+            'cpu_seconds': sum(ticks) / clk_tck if ticks else None,
+            'rss_bytes': sum(proc.get('rss_bytes') or 0 for proc in members),
+            'read_bytes': sum(io.get(pid, {}).get('read_bytes', 0) for pid in tree),
+            'write_bytes': sum(io.get(pid, {}).get('write_bytes', 0) for pid in tree),
+            'threads': sum(proc.get('threads') or 0 for proc in members) or None,
+            'procs': len(tree),
+        }
+    return samples
+
+
+def sample_local(roots: Dict[str, int]) -> Dict[str, dict]:
+    """Sample local process trees from /proc. Empty where /proc is unavailable (macOS, Windows)."""
+    if not os.path.isdir("/proc/self"):
+        return {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    clk_tck = os.sysconf("SC_CLK_TCK")
+    procs, io = {}, {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                pid, proc = parse_stat(f.read(), page_size)
+        except (OSError, ValueError, IndexError):
+            continue  # exited meanwhile
+        procs[pid] = proc
+    # Only the watched trees' I/O counters are needed (and readable).
+    for pid in {pid for tree in process_trees(procs, roots).values() for pid in tree}:
+        try:
+            with open(f"/proc/{pid}/io") as f:
+                io[pid] = {k: int(v) for k, v in (line.split(":") for line in f) if k in ('read_bytes', 'write_bytes')}
+        except (OSError, ValueError):
+            continue
+    return aggregate(procs, io, roots, clk_tck)
+
+
+def _read_pidfile(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None  # not written yet
+
+
+def sample_remote(ssh_client: SSHClient, pidfiles: Dict[str, str], stale: Tuple[str, ...] = ()) -> Dict[str, dict]:
+    """
+    Sample every remote step of one host with a single command: their pidfiles, every
+    ``/proc/<pid>/stat`` and the readable ``/proc/<pid>/io`` counters (``ps`` rss elsewhere).
+    """
+    script = ["echo T $(getconf CLK_TCK 2>/dev/null || echo 100) $(getconf PAGESIZE 2>/dev/null || echo 4096)"]
+    script += [f"echo R {shlex.quote(key)} $(cat \"{path}\" 2>/dev/null)" for key, path in pidfiles.items()]
+    script += [
+        "if [ -d /proc/self ]; then "
+        "cat /proc/[0-9]*/stat 2>/dev/null | sed 's/^/S /'; "
+        "grep -H '^[rw][a-z]*_bytes' /proc/[0-9]*/io 2>/dev/null | sed 's/^/I /'; "
+        "else ps -A -o pid= -o ppid= -o rss= | sed 's/^/P /'; fi"
+    ]
+    if stale:
+        script.append("rm -f " + " ".join(f'"{path}"' for path in stale))
+    out, _ = ssh_client.execute("; ".join(script), suppress_output=True)
+
+    clk_tck, page_size = 100, 4096
+    roots, procs, io = {}, {}, defaultdict(dict)
+    for line in out.splitlines():
+        tag, _, rest = line.partition(" ")
+        try:
+            if tag == "T":
+                clk_tck, page_size = (int(v) for v in rest.split())
+            elif tag == "R" and len(rest.split()) == 2:
+                key, pid = rest.split()
+                roots[key] = int(pid)
+            elif tag == "S":
+                pid, proc = parse_stat(rest, page_size)
+                procs[pid] = proc
+            elif tag == "I":
+                # /proc/<pid>/io:read_bytes: <n>
+                path, name, value = rest.split(":")
+                io[int(path.split("/")[2])][name] = int(value)
+            elif tag == "P":
+                pid, ppid, rss_kb = (int(v) for v in rest.split())
+                procs[pid] = {'ppid': ppid, 'cpu_ticks': None, 'threads': None, 'rss_bytes': rss_kb * 1024}
+        except (ValueError, IndexError):
+            continue
+    return aggregate(procs, io, roots, clk_tck)
+
+
+# ---------- samplers ----------
+class ResourceSampler:
+    """
+    Periodically samples every step process watched on one host.
+
+    One background thread per host (and per worker process) reads all watched process trees
+    at once: ``/proc`` locally, a single batched command per interval for a remote host. Each
+    sample is handed to the watch's callback with rates derived from the previous one:
+    cpu_percent (100 = one core), read_rate and write_rate (bytes/s).
+    """
+
+    def __init__(self, ssh_client: SSHClient = None, interval: float = 5.0):
+        """
+        Args:
+            ssh_client (SSHClient, optional): host whose steps are sampled (local if omitted)
+            interval (float): seconds between samples
+        """
+        self.ssh_client = ssh_client
+        self.interval = interval
+        self._watches: Dict[str, dict] = {}
+        self._stale = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, key: str, root, callback: Callable[[dict], None]):
+        """
+        Start sampling a step.
+
+        Args:
+            key (str): unique id of the step run (the same key unwatches it)
+            root (int or str): local pid, or a pidfile (the remote one is written by the step's shell)
+            callback (callable): receives each sample dict, from the sampler thread
+        """
+        with self._lock:
+            # The step starts now: its first sample is measured against zero usage.
+            self._watches[key] = {
+                'root': root,
+                'callback': callback,
+                'last': {'ts': time.time(), 'cpu_seconds': 0.0, 'read_bytes': 0, 'write_bytes': 0},
+            }
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True, name="flowkestra-sampler")
+                self._thread.start()
+
+    def unwatch(self, key: str):
+        """Stop sampling a step. No callback for it runs after this returns."""
+        with self._lock:
+            watch = self._watches.pop(key, None)
+            if watch and self.ssh_client:
+                self._stale.append(watch['root'])
+
+    def _sample(self, roots: Dict[str, object], stale) -> Dict[str, dict]:
+        if self.ssh_client:
+            return sample_remote(self.ssh_client, roots, stale)
+        pids = {key: root if isinstance(root, int) else _read_pidfile(root) for key, root in roots.items()}
+        return sample_local({key: pid for key, pid in pids.items() if pid})
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                roots = {key: watch['root'] for key, watch in self._watches.items()}
+                stale, self._stale = tuple(self._stale), []
+                if not roots:
+                    self._thread = None
+            if not roots:
+                if stale:
+                    # Remove the finished steps' pidfiles before going idle.
+                    try:
+                        self.ssh_client.execute("rm -f " + " ".join(stale), suppress_output=True)
+                    except Exception:
+                        pass  # e.g. the host went down: only leftovers
+                return
+            try:
+                samples = self._sample(roots, stale)
+            except Exception:
+                # e.g. a dropped connection: skip this round, remove the stale pidfiles on the next
+                with self._lock:
+                    self._stale.extend(stale)
+                continue
+            now = time.time()
+            with self._lock:
+                for key, sample in samples.items():
+                    watch = self._watches.get(key)
+                    if watch:
+                        self._deliver(watch, dict(sample, ts=now))
+
+    @staticmethod
+    def _deliver(watch: dict, sample: dict):
+        last = watch['last']
+        elapsed = max(sample['ts'] - last['ts'], 1e-6)
+        if sample['cpu_seconds'] is not None and last['cpu_seconds'] is not None:
+            sample['cpu_percent'] = round(max(0.0, sample['cpu_seconds'] - last['cpu_seconds']) / elapsed * 100, 1)
+        sample['read_rate'] = max(0, sample['read_bytes'] - last['read_bytes']) / elapsed
+        sample['write_rate'] = max(0, sample['write_bytes'] - last['write_bytes']) / elapsed
+        watch['last'] = sample
+        try:
+            watch['callback'](sample)
+        except Exception:
+            pass  # a broken sink must not stop sampling for the other steps
+
+
+_samplers: Dict[Tuple[int, float], ResourceSampler] = {}
+_samplers_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # A forked worker process starts its own sampler threads.
+    global _samplers_lock
+    _samplers.clear()
+    _samplers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def sampler_for(ssh_client: SSHClient = None, interval: float = 5.0) -> ResourceSampler:
+    """The process-wide sampler of a host (local when ssh_client is None)."""
+    key = (id(ssh_client) if ssh_client else 0, interval)
+    with _samplers_lock:
+        if key not in _samplers:
+            _samplers[key] = ResourceSampler(ssh_client, interval)
+        return _samplers[key]
+
+
+class ResourceRecorder:
+    """
+    Sink for one step's samples: appends them to ``<step>.resources.jsonl`` next to the step
+    log and publishes them to the monitor as 'resources' events.
+    """
+
+    def __init__(self, path, reporter, step: str):
+        self.path = Path(path)
+        self.reporter = reporter
+        self.step = step
+        self.peak_rss_bytes = 0
+        self.cpu_seconds = None
+        self._file = None
+
+    def __call__(self, sample: dict):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(sample) + "\n")
+        self._file.flush()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, sample['rss_bytes'])
+        self.cpu_seconds = sample['cpu_seconds']
+        if self.reporter:
+            self.reporter.emit('resources', step=self.step, **sample)
+
+    def summary(self) -> dict:
+        """Totals reported with the step's timing."""
+        summary = {'peak_rss_bytes': self.peak_rss_bytes} if self.peak_rss_bytes else {}
+        if self.cpu_seconds is not None:
+            summary['cpu_seconds'] = round(self.cpu_seconds, 2)
+        return summary
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+# ---------- stragglers ----------
+def find_stragglers(table: Dict[str, dict], ratio=0.5, window=6, min_peers=3) -> Dict[str, dict]:
+    """
+    Instances whose recent CPU use is far below that of their peers.
+
+    Peers are the instances currently running a step of the same name (e.g. the trials of a
+    sweep). An instance is flagged when its mean cpu_percent over the last ``window`` samples
+    is below ``ratio`` times the median of the other peers'. ``io_heavy`` tells a trial waiting
+    on I/O apart from one starved of CPU (e.g. thrashing on an oversubscribed host).
+
+    Args:
+        table (dict): the status channel's table
+        ratio (float): fraction of the peer median below which an instance is flagged
+        window (int): number of recent samples averaged
+        min_peers (int): minimum number of instances running the step for a comparison
+    """
+    groups = defaultdict(dict)
+    for worker_id, row in table.items():
+        history = row.get('resource_history') or []
+        if not history:
+            continue
+        step = history[-1]['step']
+        if row.get('steps', {}).get(step, {}).get('state') != 'running':
+            continue
+        recent = [s for s in history[-window:] if s['step'] == step and s.get('cpu_percent') is not None]
+        if recent:
+            groups[step][worker_id] = (
+                statistics.mean(s['cpu_percent'] for s in recent),
+                statistics.mean(s['read_rate'] + s['write_rate'] for s in recent),
+            )
+
+    flagged = {}
+    for step, members in groups.items():
+        if len(members) < min_peers:
+            continue
+        for worker_id, (cpu, io_rate) in members.items():
+            peers = [values for other, values in members.items() if other != worker_id]
+            peer_cpu = statistics.median(c for c, _ in peers)
+            peer_io = statistics.median(i for _, i in peers)
+            if peer_cpu > 0 and cpu < ratio * peer_cpu:
+                flagged[worker_id] = {
+                    'step': step,
+                    'cpu_percent': round(cpu, 1),
+                    'peer_cpu_percent': round(peer_cpu, 1),
+                    'io_rate': io_rate,
+                    'io_heavy': io_rate > IO_HEAVY_FACTOR * peer_io and io_rate > 0,
+                }
+    return flagged
+
+
+def format_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "K", "M", "G"):
+        if value < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}T"
@@ -0,0 +1,83 @@
+import os
+import threading
+from typing import Optional
+
+
+def total_memory_gb() -> Optional[float]:
+    """Total physical memory of this host in GB, or None when it cannot be determined."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class ResourceScheduler:
+    """
+    Admission control for instances running on the supervisor's host.
+
+    Tracks CPU slots, memory and the number of concurrent runs. An instance is admitted
+    only when its declared requirements fit in what is currently free; capacity is
+    returned when it finishes. A request larger than the whole host is admitted when
+    nothing else is running, so it can never block the queue forever.
+    """
+
+    def __init__(self, cpu_slots: Optional[float] = None, memory_gb: Optional[float] = None,
+                 max_concurrent_runs: Optional[int] = None):
+        """
+        Args:
+            cpu_slots (float, optional): CPU capacity (default: number of cores)
+            memory_gb (float, optional): memory capacity (default: physical memory, unlimited if unknown)
+            max_concurrent_runs (int, optional): cap on running instances (default: unlimited)
+        """
+        self.cpu_slots = cpu_slots if cpu_slots is not None else (os.cpu_count() or 1)
+        self.memory_gb = memory_gb if memory_gb is not None else total_memory_gb()
+        self.max_concurrent_runs = max_concurrent_runs
+        self.used_cpus = 0.0
+        self.used_memory_gb = 0.0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def _fits(self, cpus: float, memory_gb: float) -> bool:
+        if self.running == 0:
+            return True
+        if self.max_concurrent_runs is not None and self.running >= self.max_concurrent_runs:
+            return False
+        if self.used_cpus + cpus > self.cpu_slots:
+            return False
+        if self.memory_gb is not None and self.used_memory_gb + memory_gb > self.memory_gb:
+            return False
+        return True
+
+    def try_acquire(self, cpus: float = 0, memory_gb: float = 0, local: bool = True) -> bool:
+        """
+        Reserve capacity for one instance. Remote instances only count against
+        max_concurrent_runs since their CPU and memory live on another host.
+        """
+        if not local:
+            cpus, memory_gb = 0, 0
+        with self._lock:
+            if not self._fits(cpus, memory_gb):
+                return False
+            self.used_cpus += cpus
+            self.used_memory_gb += memory_gb
+            self.running += 1
+            return True
+
+    def release(self, cpus: float = 0, memory_gb: float = 0, local: bool = True):
+        if not local:
+            cpus, memory_gb = 0, 0
+        with self._lock:
+            self.used_cpus = max(0.0, self.used_cpus - cpus)
+            self.used_memory_gb = max(0.0, self.used_memory_gb - memory_gb)
+            self.running = max(0, self.running - 1)
+
+    def usage(self) -> str:
+        memory = f"{self.used_memory_gb:g}/{self.memory_gb:.0f}GB" if self.memory_gb else f"{self.used_memory_gb:g}GB"
+        return f"cpu {self.used_cpus:g}/{self.cpu_slots:g}, mem {memory}, runs {self.running}"
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Dict, List, Literal, Any, Union
+from flowkestra.dag import resolve_dependencies, find_cycle
 
 
 
@@ -13,6 +14,8 @@ class SSHConfig(BaseModel):
         None, description="Path to the private key file"
     )
     port: int = Field(22, description="SSH port")
+    timeout: Optional[float] = Field(10, description="Connection timeout in seconds")
+    debug: bool = Field(False, description="Log SSH commands and transfers")
 
 
 class PipelineConfig(BaseModel):
@@ -20,19 +23,391 @@ class PipelineConfig(BaseModel):
     args: Optional[List[str]] = Field(
         default_factory=list, description="List of arguments for the script"
     )
+    depends_on: List[str] = Field(
+        default_factory=list, description="Steps that must succeed before this one starts"
+    )
+    cache: bool = Field(
+        False, description="Memoize this step: skip it and restore its outputs when its inputs are unchanged"
+    )
+    inputs: List[str] = Field(
+        default_factory=list, description="Files/dirs (relative to the synced code tree) that affect the step's result"
+    )
+    outputs: List[str] = Field(
+        default_factory=list, description="Files/dirs (relative to the step's workdir) stored and restored by the cache"
+    )
+    timeout: Optional[float] = Field(
+        None, gt=0, description="Kill the step and mark it failed after this many seconds"
+    )
+    fork_server: Optional[bool] = Field(
+        None, description="Run through the venv's fork server (true) or as a plain subprocess (false); default: fork_server.enabled"
+    )
+
+class ResourcesConfig(BaseModel):
+    cpus: float = Field(1, ge=0, description="CPU slots the instance occupies while running")
+    memory_gb: float = Field(0, ge=0, description="Memory the instance needs while running")
+    cores: Optional[Union[str, List[int]]] = Field(
+        None, description="Cores to pin a local instance to with the 'explicit' affinity layout (e.g. '0-7')"
+    )
 
 class InstanceConfig(BaseModel):
+    name: Optional[str] = Field(None, description="Readable instance name (used for log directories)")
     mode: str
     workdir: str
     target_workdir: str
     requirements: str
     pipelines: Dict[str, PipelineConfig]  # ensures pipelines is a dict, not a list
+    ssh: Optional[SSHConfig] = Field(
+        None, description="Connection settings, required when mode is 'remote' (unless a pool is given)"
+    )
+    pool: Optional[str] = Field(
+        None, description="Host pool (from host_pools) the remote instance is dispatched to instead of a fixed ssh host"
+    )
+    max_parallel_steps: int = Field(
+        1, ge=1, description="Maximum number of independent pipeline steps running at once"
+    )
+    resources: ResourcesConfig = Field(default_factory=ResourcesConfig)
+    priority: int = Field(0, description="Higher priority instances are admitted first")
+    keep: List[str] = Field(
+        default_factory=list, description="Workdir paths retained across runs on top of teardown.keep (e.g. 'data')"
+    )
+
+    @model_validator(mode="after")
+    def _check_pipeline_graph(self):
+        for name, step in self.pipelines.items():
+            unknown = [dep for dep in step.depends_on if dep not in self.pipelines]
+            if unknown:
+                raise ValueError(f"Pipeline step '{name}' depends on unknown step(s): {unknown}")
+        cycle = find_cycle(resolve_dependencies({n: p.model_dump() for n, p in self.pipelines.items()}))
+        if cycle:
+            raise ValueError(f"Pipeline dependency cycle: {' -> '.join(cycle)}")
+        return self
+
+class RangeSpec(BaseModel):
+    low: float
+    high: float
+    log: bool = Field(False, description="Sample uniformly in log space")
+    integer: bool = Field(False, description="Round samples to integers")
+
+class MatrixConfig(BaseModel):
+    mode: Literal["grid", "random", "list"] = Field(
+        "grid", description="'grid' takes the cartesian product, 'random' samples, 'list' uses trials as given"
+    )
+    parameters: Dict[str, Union[List[Any], RangeSpec]] = Field(
+        default_factory=dict, description="Values (grid/random) or ranges (random) per parameter"
+    )
+    trials: List[Dict[str, Any]] = Field(
+        default_factory=list, description="Explicit parameter sets for 'list' mode"
+    )
+    samples: int = Field(10, ge=1, description="Number of trials drawn in 'random' mode")
+    seed: Optional[int] = Field(None, description="Random seed for reproducible sampling")
+
+class SweepConfig(InstanceConfig):
+    name: str = Field(..., description="Sweep name, used as the prefix of trial names")
+    matrix: MatrixConfig
+
+class VenvCacheConfig(BaseModel):
+    enabled: bool = Field(
+        False, description="Share virtual environments across instances and runs on the same host"
+    )
+    cache_dir: str = Field(
+        "~/.cache/flowkestra/venvs", description="Cache root on each host (outside any workdir)"
+    )
+    max_entries: Optional[int] = Field(
+        8, description="Maximum number of cached environments per host"
+    )
+    max_size_gb: Optional[float] = Field(
+        None, description="Maximum total cache size per host in GB"
+    )
+    lock_timeout: int = Field(
+        1800, description="Seconds after a builder's last heartbeat before its lock is taken over as abandoned"
+    )
+
+class WheelhouseConfig(BaseModel):
+    enabled: bool = Field(
+        False, description="Build wheels once per (requirements, interpreter) and install them offline on every host"
+    )
+    cache_dir: str = Field(
+        "~/.cache/flowkestra/wheels", description="Wheelhouse root on the supervisor and on each host"
+    )
+    max_entries: Optional[int] = Field(
+        16, description="Maximum number of wheel sets kept per cache"
+    )
+    max_size_gb: Optional[float] = Field(
+        None, description="Maximum total wheelhouse size per cache in GB"
+    )
+    lock_timeout: int = Field(
+        1800, description="Seconds after a builder's last heartbeat before its lock is taken over as abandoned"
+    )
+    index_url: Optional[str] = Field(
+        None, description="Package index used to resolve requirements"
+    )
+    find_links: List[str] = Field(
+        default_factory=list, description="Local directories/URLs searched for packages; directories are synced to hosts that build wheels"
+    )
+    no_index: bool = Field(
+        False, description="Resolve only from find_links, e.g. a local directory index for offline builds"
+    )
+
+class DataStoreConfig(BaseModel):
+    enabled: bool = Field(
+        False, description="Transfer large input files once per host into a content-addressed store and link them into workdirs"
+    )
+    store_dir: str = Field(
+        "~/.cache/flowkestra/data", description="Store root on each host (outside any workdir)"
+    )
+    min_size_kb: float = Field(
+        1024, ge=0, description="Files at least this large go through the store; smaller ones are synced as usual"
+    )
+    link_mode: Literal["hardlink", "symlink"] = Field(
+        "hardlink", description="How blobs are materialized in workdirs (hardlinks fall back to copies across filesystems)"
+    )
+    max_size_gb: Optional[float] = Field(
+        None, description="Garbage-collect unreferenced blobs, oldest first, beyond this size per host"
+    )
+    lock_timeout: int = Field(
+        1800, description="Seconds after a holder's last heartbeat before the store lock is taken over as abandoned"
+    )
+
+class SyncConfig(BaseModel):
+    mode: Literal["full", "incremental"] = Field(
+        "full", description="'full' wipes and re-copies the workdir, 'incremental' transfers only changed files "
+                            "(the manifest lives in the workdir: needs clean_workdir_after_run: false to carry over)"
+    )
+    link_mode: Literal["copy", "hardlink", "reflink"] = Field(
+        "copy", description="How local incremental syncs materialize files; 'hardlink' (opt-in) shares inodes with the "
+                            "source, so in-place writes in the workdir change the source too"
+    )
+    transfer: Literal["auto", "tar", "sftp"] = Field(
+        "auto", description="Remote transfer: one tar stream over a single channel, or one SFTP put per file"
+    )
+    compression: Literal["auto", "none", "gzip", "xz"] = Field(
+        "auto", description="Compression of the remote tar stream ('auto' sends large, compressible payloads as fast gzip; xz is opt-in)"
+    )
+
+class SSHPoolConfig(BaseModel):
+    max_channels_per_host: int = Field(
+        8, description="Maximum concurrent channels (commands/transfers) on one host connection"
+    )
+    keepalive_interval: int = Field(
+        30, description="Seconds between SSH keepalive packets (0 disables)"
+    )
+    control_channels: int = Field(
+        2, ge=1, description="Channels per host kept free of long-running steps for stop, timeout and polling commands"
+    )
+
+    @model_validator(mode="after")
+    def _check_control_channels(self):
+        if self.control_channels >= self.max_channels_per_host:
+            raise ValueError(
+                f"ssh_pool.control_channels ({self.control_channels}) must be less than "
+                f"max_channels_per_host ({self.max_channels_per_host}), or no step could ever run"
+            )
+        return self
+
+class AffinityConfig(BaseModel):
+    layout: Literal["none", "even", "explicit", "numa"] = Field(
+        "none", description="How host cores are partitioned among running local instances ('none' disables pinning)"
+    )
+    cores: Optional[Union[str, List[int]]] = Field(
+        None, description="Cores available for partitioning (default: all cores this process may use)"
+    )
+
+class TeardownConfig(BaseModel):
+    keep: List[str] = Field(
+        default_factory=list, description="Workdir paths kept for the next run (e.g. 'venv', '.cache'); the rest is removed"
+    )
+    background: bool = Field(
+        True, description="Move removed files to a trash dir and delete them in a detached background process"
+    )
+
+class SamplingConfig(BaseModel):
+    enabled: bool = Field(
+        True, description="Sample CPU, memory, I/O and threads of running steps (/proc locally, one batched read per remote host)"
+    )
+    interval: float = Field(
+        5.0, gt=0, description="Seconds between samples"
+    )
+    straggler_ratio: float = Field(
+        0.5, gt=0, description="Flag an instance using less than this fraction of the CPU of its peers running the same step"
+    )
+    straggler_window: int = Field(
+        6, ge=1, description="Number of recent samples averaged for straggler detection"
+    )
+    min_peers: int = Field(
+        3, ge=2, description="Minimum number of instances running a step before they are compared"
+    )
+
+class ForkServerConfig(BaseModel):
+    enabled: bool = Field(
+        False, description="Start steps as forks of a warm interpreter per venv instead of a fresh python (not on Windows)"
+    )
+    preload: List[str] = Field(
+        default_factory=list, description="Modules the warm interpreter imports once (e.g. mlflow, pandas, sklearn)"
+    )
+    idle_timeout: float = Field(
+        600, gt=0, description="Seconds without steps after which a fork server exits"
+    )
+
+class DetachedConfig(BaseModel):
+    enabled: bool = Field(
+        False, description="Run remote steps detached (nohup/setsid) and poll for them instead of holding an SSH channel"
+    )
+    poll_interval: float = Field(
+        5.0, gt=0, description="Seconds between the batched status/output polls of each host's detached steps"
+    )
+
+class EarlyStoppingConfig(BaseModel):
+    enabled: bool = Field(
+        False, description="Stop trials whose reported metric falls behind their siblings, freeing capacity for queued ones"
+    )
+    metric: Optional[str] = Field(
+        None, description="Name of the metric scripts append to $FLOWKESTRA_METRICS_FILE as {\"name\", \"value\", \"step\"} JSON lines"
+    )
+    mode: Literal["min", "max"] = Field(
+        "min", description="Whether lower (min) or higher (max) metric values are better"
+    )
+    rule: Literal["median", "successive_halving"] = Field(
+        "median", description="Median stopping rule, or asynchronous successive halving over rungs"
+    )
+    min_iterations: int = Field(
+        1, ge=1, description="No trial is stopped before reporting this iteration; also the first successive-halving rung"
+    )
+    min_peers: int = Field(
+        3, ge=1, description="Minimum number of siblings that reached an iteration before the median rule applies"
+    )
+    eta: int = Field(
+        3, ge=2, description="Successive halving: rungs are eta times apart and the top 1/eta of a rung continues"
+    )
+    poll_interval: float = Field(
+        2.0, gt=0, description="Seconds between reads of the metric files and checks of the rules"
+    )
+    grace_seconds: float = Field(
+        10.0, ge=0, description="Seconds a stopped script gets to exit on SIGTERM before it is killed"
+    )
+
+    @model_validator(mode="after")
+    def _check_metric(self):
+        if self.enabled and not self.metric:
+            raise ValueError("early_stopping.metric is required when early stopping is enabled")
+        return self
+
+class PoolHostConfig(BaseModel):
+    name: Optional[str] = Field(None, description="Host name in the monitor and placement hints (default: hostname:port)")
+    ssh: SSHConfig
+    slots: float = Field(1, gt=0, description="CPU slots of the host shared by the instances placed on it")
+    memory_gb: Optional[float] = Field(None, gt=0, description="Memory of the host shared by its instances (unlimited if unset)")
+
+class HostPoolConfig(BaseModel):
+    hosts: List[PoolHostConfig] = Field(..., min_length=1, description="Hosts instances of the pool are dispatched to")
+    retry_interval: float = Field(
+        60, ge=0, description="Seconds an unreachable host is skipped before instances are placed on it again"
+    )
+    max_failures: int = Field(
+        3, ge=1, description="Times a host may be found unreachable before it is dropped for the rest of the run"
+    )
+
+class SchedulerConfig(BaseModel):
+    cpu_slots: Optional[float] = Field(
+        None, description="Local CPU capacity shared by running instances (default: number of cores)"
+    )
+    memory_gb: Optional[float] = Field(
+        None, description="Local memory capacity in GB (default: physical memory)"
+    )
+    max_concurrent_setups: int = Field(
+        4, ge=1, description="Maximum number of instances syncing/installing at the same time"
+    )
+    max_concurrent_runs: Optional[int] = Field(
+        None, ge=1, description="Maximum number of instances running at the same time"
+    )
+    order: Literal['config', 'longest_first', 'shortest_first'] = Field(
+        'longest_first', description="Admission order within a priority, by run time predicted from history (config: as listed)"
+    )
+
+class StepCacheConfig(BaseModel):
+    enabled: bool = Field(
+        True, description="Allow steps marked 'cache: true' to be memoized (overridden by --no-cache)"
+    )
+    cache_dir: str = Field(
+        "~/.cache/flowkestra/steps", description="Local directory holding cached step outputs"
+    )
+    max_size_gb: Optional[float] = Field(
+        10, description="Maximum total size of cached outputs, least recently used evicted first"
+    )
+
+class LogConfig(BaseModel):
+    dir: str = Field("./flowkestra_logs", description="Root of the per-instance, per-step log files")
+    max_bytes: int = Field(10 * 1024 * 1024, description="Rotate a step log once it exceeds this size")
+    backup_count: int = Field(3, description="Number of rotated log files kept per step")
+    tail_lines: int = Field(200, description="Recent lines kept in memory per step")
+
+class JournalConfig(BaseModel):
+    enabled: bool = Field(
+        True, description="Keep an append-only run journal (phases, setups, step results) so --resume can continue a run"
+    )
+    dir: Optional[str] = Field(
+        None, description="Root of the per-config run directories holding the journal (default: <logs.dir>/runs)"
+    )
+
+class HistoryConfig(BaseModel):
+    enabled: bool = Field(
+        True, description="Record step and instance durations to predict run times (admission order, --plan)"
+    )
+    file: str = Field(
+        "~/.cache/flowkestra/durations.json", description="Local file holding the duration history"
+    )
+    max_samples: int = Field(20, ge=1, description="Durations kept per step (or instance) and host")
+
+class MetricsConfig(BaseModel):
+    report_dir: Optional[str] = Field(
+        None, description="Where the per-run JSON timing report is written (default: logs.dir)"
+    )
+    prometheus_textfile: Optional[str] = Field(
+        None, description="Also write timings to this node_exporter textfile (e.g. /var/lib/node_exporter/flowkestra.prom)"
+    )
+    print_summary: bool = Field(True, description="Print p50/p95 phase timings at the end of the run")
 
 class ConfigSchema(BaseModel):
     mlflow_uri: str
     experiment_name: str
-    instances: List[InstanceConfig]
+    instances: List[InstanceConfig] = Field(default_factory=list)
+    sweeps: List[SweepConfig] = Field(
+        default_factory=list, description="Parameter sweeps expanded into trials sharing one code tree and environment"
+    )
     visualize_progress: bool = True
     clear_screen_on_update: bool = True
     clean_workdir_after_run: bool = True
-    suppress_runner_output: bool = True
\ No newline at end of file
+    suppress_runner_output: bool = True
+    engine: Literal['threads', 'asyncio'] = Field(
+        'threads', description="Execution engine: a thread/process per instance, or one asyncio event loop for all"
+    )
+    venv_cache: VenvCacheConfig = Field(default_factory=VenvCacheConfig)
+    wheelhouse: WheelhouseConfig = Field(default_factory=WheelhouseConfig)
+    sync: SyncConfig = Field(default_factory=SyncConfig)
+    data_store: DataStoreConfig = Field(default_factory=DataStoreConfig)
+    ssh_pool: SSHPoolConfig = Field(default_factory=SSHPoolConfig)
+    scheduler: SchedulerConfig = Field(default_factory=SchedulerConfig)
+    affinity: AffinityConfig = Field(default_factory=AffinityConfig)
+    teardown: TeardownConfig = Field(default_factory=TeardownConfig)
+    step_cache: StepCacheConfig = Field(default_factory=StepCacheConfig)
+    logs: LogConfig = Field(default_factory=LogConfig)
+    metrics: MetricsConfig = Field(default_factory=MetricsConfig)
+    journal: JournalConfig = Field(default_factory=JournalConfig)
+    history: HistoryConfig = Field(default_factory=HistoryConfig)
+    sampling: SamplingConfig = Field(default_factory=SamplingConfig)
+    early_stopping: EarlyStoppingConfig = Field(default_factory=EarlyStoppingConfig)
+    fork_server: ForkServerConfig = Field(default_factory=ForkServerConfig)
+    detached: DetachedConfig = Field(default_factory=DetachedConfig)
+    host_pools: Dict[str, HostPoolConfig] = Field(
+        default_factory=dict, description="Named pools of remote hosts that instances with a 'pool' are balanced across"
+    )
+
+    @model_validator(mode="after")
+    def _check_pools(self):
+        for instance in [*self.instances, *self.sweeps]:
+            if instance.pool is None:
+                continue
+            if instance.pool not in self.host_pools:
+                raise ValueError(f"Instance uses unknown host pool '{instance.pool}'")
+            if instance.mode != 'remote':
+                raise ValueError(f"Instance with host pool '{instance.pool}' must use mode 'remote'")
+        return self
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import uuid
+import shlex
+import shutil
+import tarfile
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+
+from flowkestra.utils import SSHClient, quote_path
+from flowkestra.sync import file_digest, tar_upload
+
+LAST_USED_MARKER = ".flowkestra-last-used"
+META_NAME = ".flowkestra-step.json"
+
+
+def extract_archive(archive: tarfile.TarFile, dest: Path):
+    """
+    Extract a (streamed) tar archive into dest, refusing members that would land outside it:
+    absolute paths, '..' components, links pointing out of dest and device files.
+    Raises tarfile.TarError on such a member.
+    """
+    if hasattr(tarfile, "data_filter"):
+        archive.extractall(dest, filter="data")
+        return
+    # Pythons without extraction filters (before 3.8.17/3.9.17/3.10.12/3.11.4): check by hand.
+    root = os.path.realpath(dest)
+
+    def inside(path) -> bool:
+        return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+    for member in archive:
+        target = os.path.join(root, member.name)
+        if os.path.isabs(member.name) or not inside(target):
+            raise tarfile.TarError(f"Refusing to extract {member.name!r} outside {dest}")
+        if member.issym() and not inside(os.path.join(os.path.dirname(target), member.linkname)):
+            raise tarfile.TarError(f"Refusing to extract link {member.name!r} -> {member.linkname!r}")
+        if member.islnk() and not inside(os.path.join(root, member.linkname)):
+            raise tarfile.TarError(f"Refusing to extract link {member.name!r} -> {member.linkname!r}")
+        if member.isdev():
+            raise tarfile.TarError(f"Refusing to extract device file {member.name!r}")
+        archive.extract(member, root)
+
+
+class CachedResult:
+    """Result of a pipeline step that was restored from the step cache instead of being run."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.returncode = 0
+
+    def __repr__(self):
+        return f"CachedResult(key={self.key!r})"
+
+
+class StepCache:
+    """
+    Local content-addressed cache of pipeline step outputs.
+
+    A step's key hashes its script content, args, environment (requirements content),
+    declared input files/dirs and the host it runs on. On a hit the declared outputs are
+    restored into the step's working directory instead of running the script. Entries are
+    evicted least recently used first once the cache exceeds ``max_size_gb``.
+    """
+
+    def __init__(self, cache_dir, max_size_gb=None, suppress_output=True):
+        """
+        Args:
+            cache_dir (str): local cache root (``~`` is expanded)
+            max_size_gb (float, optional): maximum total size of the cache
+            suppress_output (bool): If True, do not print cache hits and stores.
+        """
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_size_gb = max_size_gb
+        self.suppress_output = suppress_output
+
+    def _log(self, msg: str):
+        if not self.suppress_output:
+            print(msg)
+
+    # ---------- keys ----------
+    @staticmethod
+    def _hash_local_paths(base_dir: Path, paths: List[str]) -> str:
+        digest = hashlib.sha256()
+        for rel in sorted(paths):
+            target = base_dir / rel
+            files = sorted(p for p in target.glob("**/*") if p.is_file()) if target.is_dir() else [target]
+            for path in files:
+                digest.update(path.relative_to(base_dir).as_posix().encode())
+                digest.update(file_digest(path).encode() if path.exists() else b"missing")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _hash_remote_paths(ssh_client: SSHClient, base_dir: Path, paths: List[str]) -> str:
+        if not paths:
+            return hashlib.sha256().hexdigest()
+        out, _ = ssh_client.execute(
+            f"cd {quote_path(base_dir)} && find {' '.join(shlex.quote(p) for p in sorted(paths))} -type f -print0 2>/dev/null | sort -z | xargs -0 -r sha256sum",
+            suppress_output=True
+        )
+        return hashlib.sha256(out.encode()).hexdigest()
+
+    def key_for(self, step: dict, script_path: Path, requirements_path: Path, code_dir: Path,
+                ssh_client: SSHClient = None) -> str:
+        """
+        Args:
+            step (dict): pipeline step config (script, args, inputs, ...)
+            script_path (Path): local copy of the step's script
+            requirements_path (Path): local copy of the environment's requirements file
+            code_dir (Path): directory the step's inputs are relative to (local or remote)
+            ssh_client (SSHClient, optional): if provided, inputs are hashed on the remote host
+        """
+        inputs = step.get('inputs') or []
+        if ssh_client:
+            inputs_hash = self._hash_remote_paths(ssh_client, code_dir, inputs)
+            host = f"{ssh_client.config.username}@{ssh_client.config.hostname}:{ssh_client.config.port}"
+        else:
+            inputs_hash = self._hash_local_paths(code_dir, inputs)
+            host = "local"
+
+        payload = {
+            'script': file_digest(script_path),
+            'args': step.get('args') or [],
+            'env': file_digest(requirements_path) if requirements_path.exists() else None,
+            'inputs': inputs_hash,
+            'outputs': sorted(step.get('outputs') or []),
+            'host': host,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:24]
+
+    # ---------- restore / store ----------
+    def restore(self, key: str, workdir: Path, ssh_client: SSHClient = None) -> bool:
+        """Copy a cached entry's outputs into workdir. Returns False on a cache miss."""
+        entry = self.cache_dir / key
+        if not (entry / META_NAME).exists():
+            return False
+
+        rel_paths = [
+            p.relative_to(entry).as_posix() for p in entry.glob("**/*")
+            if p.is_file() and p.name not in (META_NAME, LAST_USED_MARKER)
+        ]
+        if ssh_client:
+            tar_upload(ssh_client, entry, workdir, rel_paths)
+        else:
+            for rel_path in rel_paths:
+                dest_path = Path(workdir) / rel_path
+                dest_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(entry / rel_path, dest_path)
+
+        (entry / LAST_USED_MARKER).touch()
+        self._log(f"[StepCache] Restored {len(rel_paths)} output file(s) from {key}")
+        return True
+
+    def store(self, key: str, step_name: str, outputs: List[str], workdir: Path, ssh_client: SSHClient = None) -> bool:
+        """
+        Save the declared outputs of a finished step under key. Returns False if an output is
+        missing, or if there are none: an entry without outputs would skip the step for nothing.
+        """
+        if not outputs:
+            self._log(f"[StepCache] Not caching '{step_name}': it declares no outputs")
+            return False
+        entry = self.cache_dir / key
+        staging = self.cache_dir / f"{key}.tmp-{uuid.uuid4().hex[:8]}"
+        staging.mkdir(parents=True, exist_ok=True)
+        try:
+            if ssh_client:
+                def extract(stdout):
+                    with tarfile.open(fileobj=stdout, mode="r|") as archive:
+                        extract_archive(archive, staging)
+
+                try:
+                    err, exit_status = ssh_client.read_stream(
+                        f"cd {quote_path(workdir)} && tar -cf - -- {' '.join(shlex.quote(rel) for rel in outputs)}", extract
+                    )
+                except tarfile.TarError as e:
+                    err, exit_status = str(e), None
+                if exit_status != 0:
+                    self._log(f"[StepCache] Not caching '{step_name}': {err}")
+                    return False
+            else:
+                for rel in outputs:
+                    src = Path(workdir) / rel
+                    if src.is_dir():
+                        shutil.copytree(src, staging / rel, dirs_exist_ok=True)
+                    elif src.exists():
+                        (staging / rel).parent.mkdir(parents=True, exist_ok=True)
+                        shutil.copy2(src, staging / rel)
+                    else:
+                        self._log(f"[StepCache] Not caching '{step_name}': output {rel} was not produced")
+                        return False
+
+            (staging / META_NAME).write_text(json.dumps({'step': step_name, 'outputs': outputs, 'created': time.time()}))
+            (staging / LAST_USED_MARKER).touch()
+            if (entry / META_NAME).exists():
+                # Another worker stored the same key meanwhile: its outputs are as good as ours.
+                self._log(f"[StepCache] '{step_name}' is already cached as {key}")
+                return True
+            shutil.rmtree(entry, ignore_errors=True)
+            try:
+                os.replace(staging, entry)
+            except OSError:
+                # Lost the race to a concurrent store of the same key (its entry is left in place).
+                if not (entry / META_NAME).exists():
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self._log(f"[StepCache] Stored outputs of '{step_name}' as {key}")
+        self.evict(keep={key})
+        return True
+
+    # ---------- eviction ----------
+    def evict(self, keep=()):
+        """Remove least recently used entries until the cache fits in max_size_gb."""
+        if not self.max_size_gb or not self.cache_dir.exists():
+            return
+        entries = []
+        for entry in self.cache_dir.iterdir():
+            if not (entry / META_NAME).exists():
+                continue
+            marker = entry / LAST_USED_MARKER
+            last_used = marker.stat().st_mtime if marker.exists() else 0
+            size = sum(p.stat().st_size for p in entry.glob("**/*") if p.is_file())
+            entries.append((last_used, size, entry))
+
+        max_bytes = self.max_size_gb * 1024 ** 3
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= max_bytes:
+                break
+            if entry.name in keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def build_step_cache(cache_config: Optional[dict], suppress_output=True) -> Optional[StepCache]:
+    """Create a StepCache from the ``step_cache`` config section, or None when disabled."""
+    if not cache_config or not cache_config.get('enabled'):
+        return None
+    return StepCache(
+        cache_dir=cache_config['cache_dir'],
+        max_size_gb=cache_config.get('max_size_gb'),
+        suppress_output=suppress_output
+    )
@@ -2,17 +2,32 @@ import yaml
 import threading
 import multiprocessing
 from flowkestra.worker import Worker
+from flowkestra.utils import ssh_pool
+from flowkestra.scheduler import ResourceScheduler
+from flowkestra.affinity import build_cpu_allocator
+from flowkestra.sampling import find_stragglers, format_bytes
+from flowkestra.early_stopping import build_early_stopper, metric_curves
+from flowkestra.host_pool import HostUnreachable, build_host_pools
+from flowkestra.journal import FINISHED_STATUSES, build_run_journal, config_hash, origin_fingerprint
+from flowkestra.planning import ANY_HOST, admission_order, build_duration_history, print_plan, simulate_schedule
+from flowkestra.sweep import expand_sweep
+from flowkestra.logs import build_log_store
+from flowkestra.events import StatusChannel
+from flowkestra.async_engine import AsyncEngine
+from flowkestra.metrics import build_report, write_json_report, write_prometheus_textfile, print_summary
 import uuid
 from flowkestra.schema import ConfigSchema
 from typing import Dict, Any, List, Union, Tuple
 import time
 import os 
+import hashlib
+import statistics
 from concurrent.futures import ThreadPoolExecutor
 import requests
 
 
 class Supervisor:
-    def __init__(self, config_path: str, visualize_progress=None, clear_screen_on_update=None, clean_workdir_after_run=None, suppress_runner_output=None):
+    def __init__(self, config_path: str, visualize_progress=None, clear_screen_on_update=None, clean_workdir_after_run=None, suppress_runner_output=None, use_step_cache=None, engine=None, resume=False, dry_run=False):
         self.config = self._load_config(config_path)
         self.mlflow_uri = self.config.get('mlflow_uri', "http://localhost:5000")
         self.experiment_name = self.config.get('experiment_name', "default_experiment")
@@ -22,15 +37,71 @@ class Supervisor:
         self.clear_screen_on_update = clear_screen_on_update if clear_screen_on_update is not None else self.config.get('clear_screen_on_update', True)
         self.clean_workdir_after_run = clean_workdir_after_run if clean_workdir_after_run is not None else self.config.get('clean_workdir_after_run', True)
         self.suppress_runner_output = suppress_runner_output if suppress_runner_output is not None else self.config.get('suppress_runner_output', True)
+        self.engine = engine if engine is not None else self.config.get('engine', 'threads')
+        self.step_cache_config = dict(self.config.get('step_cache') or {})
+        if use_step_cache is not None:
+            self.step_cache_config['enabled'] = use_step_cache
 
-        self.manager = multiprocessing.Manager()
-        self.worker_state = self.manager.dict()
+        log_dir = (self.config.get('logs') or {}).get('dir', './flowkestra_logs')
+        self.run_stamp = time.strftime('%Y%m%d-%H%M%S')
+        # A dry run (--plan) only predicts the schedule: no events file, journal or MLflow check.
+        self.dry_run = dry_run
+        self.status_channel = StatusChannel(
+            events_file=None if dry_run else os.path.join(os.path.expanduser(log_dir), f"events-{self.run_stamp}.jsonl")
+        )
+        # Plain in-process table folded from worker events; call status_channel.drain() before reading.
+        self.worker_state = self.status_channel.table
+        self.workers: Dict[str, Worker] = {}
         self.concurrency_units: List[Union[threading.Thread, multiprocessing.Process]] = []
         self.all_finished = threading.Event() 
         self._print_timing = 5
-        if not self._check_mlflow_server(self.mlflow_uri):
+        self._admission_interval = 0.5
+        self.instance_configs: Dict[str, Dict[str, Any]] = {}
+        # One synced code tree + environment per sweep (and pool host), shared by its trials there
+        self.sweep_leaders: Dict[Tuple[str, str], Worker] = {}
+        self._sweep_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._sweep_locks_guard = threading.Lock()
+
+        scheduler_config = self.config.get('scheduler') or {}
+        self.max_concurrent_setups = scheduler_config.get('max_concurrent_setups', 4)
+        self.scheduler = ResourceScheduler(
+            cpu_slots=scheduler_config.get('cpu_slots'),
+            memory_gb=scheduler_config.get('memory_gb'),
+            max_concurrent_runs=scheduler_config.get('max_concurrent_runs')
+        )
+        # Past step and instance durations, used to order the queue and to predict the schedule
+        self.history = build_duration_history(self.config.get('history'))
+        self.admission_policy = scheduler_config.get('order', 'longest_first')
+        # Host each instance was set up on, as recorded in the history
+        self._history_hosts: Dict[str, str] = {}
+        self.cpu_allocator = build_cpu_allocator(self.config.get('affinity'), cpu_slots=self.scheduler.cpu_slots)
+        self.sampling_config = self.config.get('sampling') or {}
+        # Instances currently far below their peers, and the (instance, step) pairs already reported
+        self.stragglers: Dict[str, Dict[str, Any]] = {}
+        self._reported_stragglers = set()
+        self.early_stopping_config = self.config.get('early_stopping') or {}
+        self.early_stopper = build_early_stopper(self.early_stopping_config)
+        # Instances asked to stop early, with the rule's reason
+        self.stopped_early: Dict[str, str] = {}
+        self._last_early_stopping_check = 0.0
+        # Instances with a 'pool' are placed on one of its hosts when they are dispatched
+        self.host_pools = build_host_pools(self.config.get('host_pools'))
+        # Append-only record of the run; with resume=True the previous one is continued
+        self.resume = resume
+        self.journal = None if dry_run else build_run_journal(self.config.get('journal'), config_path, log_dir, resume=resume)
+        # Journal key of each instance id (ids are new on every run, keys are stable)
+        self.instance_keys: Dict[str, str] = {}
+        self.resumed_finished = 0
+        self._origin_fingerprints: Dict[str, str] = {}
+        if self.journal:
+            self.status_channel.subscribe(self._journal_event)
+        pool_config = self.config.get('ssh_pool') or {}
+        ssh_pool.max_channels_per_host = pool_config.get('max_channels_per_host', ssh_pool.max_channels_per_host)
+        ssh_pool.keepalive_interval = pool_config.get('keepalive_interval', ssh_pool.keepalive_interval)
+        ssh_pool.control_channels = pool_config.get('control_channels', ssh_pool.control_channels)
+        if not dry_run and not self._check_mlflow_server(self.mlflow_uri):
             raise RuntimeError(f"MLflow server not reachable at {self.mlflow_uri}")
-        self._initialize_workers()
+        self._register_instances()
 
     def _check_mlflow_server(self, uri: str) -> bool:
         """
@@ -42,44 +113,217 @@ class Supervisor:
         except requests.RequestException as e:
             raise RuntimeError(f"Failed to connect to MLflow server at {uri}")
         
-    def _initialize_workers(self):
-        def init_worker(cfg):
+    def _register_instances(self):
+        # Register every instance up front so queued ones show in the monitor.
+        keys = set()
+        for cfg in self.config['instances']:
             unique_id = str(uuid.uuid4())
-            self.worker_state[unique_id] = self.manager.dict({
-                'id': unique_id,
-                'obj': None,
-                'status': 'initializing'
-            })
-            worker = self._assign_worker(unique_id, cfg)
-            self.worker_state[unique_id]['obj'] = worker
-
-        with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(init_worker, cfg) for cfg in self.config['instances']]
-
-            if self.visualize_progress:
-                # Periodically print status until all workers are done
-                while not all(f.done() for f in futures):
-                    time.sleep(self._print_timing)
-                    if self.clear_screen_on_update:
-                        self.clear_screen()
-                    
-                    self.print_status_table_setup(f"Worker Monitor ({self.experiment_name})")
-                    print("", end="", flush=True) 
-                
-                if self.clear_screen_on_update:
-                    self.clear_screen()
-                
-                self.print_status_table_setup(f"Worker Monitor ({self.experiment_name})")
+            if self.journal:
+                digest = config_hash(cfg)
+                key = base = f"{cfg.get('trial') or cfg.get('name') or 'instance'}-{digest[:12]}"
+                while key in keys:
+                    key = f"{base}-{len(keys)}"
+                keys.add(key)
+                previous = self.journal.instance(key, digest)
+                if previous and previous.get('status') in FINISHED_STATUSES:
+                    # Finished before the restart: nothing left to do.
+                    self.resumed_finished += 1
+                    continue
+                self.instance_keys[unique_id] = key
+                self.journal.record('instance', key, config_hash=digest)
+            self.instance_configs[unique_id] = cfg
+            self.status_channel.register(unique_id, status='queued', phase='queued')
+        if self.resumed_finished:
+            print(f"Resuming: skipping {self.resumed_finished} instance(s) finished before the restart")
+
+    def _journal_event(self, event: Dict[str, Any], row: Dict[str, Any]):
+        """Status channel listener: journal phase transitions, step results and final statuses."""
+        key = self.instance_keys.get(event['worker_id'])
+        if not key:
+            return
+        if event['kind'] == 'phase':
+            self.journal.record('phase', key, phase=event['value'])
+            if event['value'] == 'done':
+                self.journal.record('end', key, status=row.get('status'))
+        elif event['kind'] == 'step_end':
+            self.journal.record('step', key, step=event['step'], state=event['state'], exit_code=event['exit_code'])
+
+    def _origin_fingerprint(self, origin_dir) -> str:
+        origin_dir = os.path.abspath(origin_dir)
+        if origin_dir not in self._origin_fingerprints:
+            self._origin_fingerprints[origin_dir] = origin_fingerprint(origin_dir)
+        return self._origin_fingerprints[origin_dir]
+
+    def _setup_context(self, unique_id, cfg: Dict[str, Any]) -> Dict[str, str]:
+        """Where an instance is set up, to match against a journaled setup: host and origin contents."""
+        ssh = self._ssh_config(unique_id, cfg) if cfg['mode'] == 'remote' else None
+        return {'host': (ssh or {}).get('hostname', ''), 'origin': self._origin_fingerprint(cfg['workdir'])}
+
+    def _resume_for(self, key, digest, context: Dict[str, str]):
+        """What setup can adopt from the journaled run of key, or None (set up from scratch)."""
+        if not (self.journal and self.resume and key):
+            return None
+        previous = self.journal.instance(key, digest)
+        setup = (previous or {}).get('setup')
+        if not setup or any(setup.get(k) != v for k, v in context.items()):
+            return None
+        done = [step for step, info in previous['steps'].items() if info['state'] == 'done']
+        return {'venv_path': setup['venv_path'], 'steps': done}
+
+    def _journal_setup(self, key, worker: Worker, context: Dict[str, str]):
+        if self.journal and key and not worker.resumed:
+            self.journal.record('setup', key, venv_path=str(worker.runner.venv_path), **context)
+
+    def _setup_instance(self, unique_id) -> Worker:
+        """
+        Create and set up one instance's worker. Called per instance from a bounded pool by
+        the execution engines, so an instance can start running as soon as its own setup is done.
+        """
+        self._set_phase(unique_id, 'setup')
+        cfg = self.instance_configs[unique_id]
+        key = self.instance_keys.get(unique_id)
+        try:
+            context = self._setup_context(unique_id, cfg) if self.journal else {}
+            resume = self._resume_for(key, config_hash(cfg), context)
+            if cfg.get('sweep'):
+                leader = self._sweep_leader(unique_id, cfg)
+                # A trial's outputs are only still valid in a code tree that was itself kept.
+                worker = self._assign_worker(unique_id, cfg, shared_from=leader, resume=resume if leader.resumed else None)
             else:
-                # If no visualization, just wait for all initialization futures to complete
-                for f in futures:
-                    f.result() # This will also raise any exceptions from init_worker
+                worker = self._assign_worker(unique_id, cfg, resume=resume)
+            worker.setup()
+            self._journal_setup(key, worker, context)
+        except Exception as e:
+            host = self.host_pools.host_of(unique_id) if cfg.get('pool') else None
+            if host:
+                # Tell a dead host (work moves elsewhere) from a broken instance (it fails).
+                try:
+                    ssh_pool.get(host.ssh, connect=True)
+                except Exception as probe_error:
+                    raise HostUnreachable(host, probe_error) from e
+            raise
+        if cfg.get('pool'):
+            self.host_pools.record(unique_id, self._affinity_keys(unique_id))
+        self._history_hosts[unique_id] = self._history_host(unique_id, cfg)
+        self.workers[unique_id] = worker
+        self._set_phase(unique_id, 'ready')
+        return worker
+
+    def _setup_failed(self, worker_id, error: BaseException) -> bool:
+        """
+        Handle a failed setup. Returns True if the instance went back to the queue to be placed
+        on another host of its pool (its host was unreachable), False if it is done.
+        """
+        if self.host_pools:
+            self.host_pools.release(worker_id)
+        if isinstance(error, HostUnreachable):
+            self.host_pools.mark_unreachable(error.host)
+            self.status_channel.reporter(worker_id).status(f"requeued: {error.host.name} unreachable")
+            self._set_phase(worker_id, 'queued')
+            return True
+        self.status_channel.reporter(worker_id).status(f"setup failed: {error}")
+        self._set_phase(worker_id, 'done')
+        return False
+
+    def _dispatch_setups(self, queue: List[str], setups: Dict[str, Any], submit):
+        """
+        Submit the setup of every queued instance that has none yet: right away for instances
+        with a fixed host, once placed on a host with free capacity for pooled ones. Instances
+        set up on a pool host that has since gone down are moved back to be placed elsewhere.
+
+        Args:
+            queue (list): ids of the instances not started yet, in admission order
+            setups (dict): worker_id -> setup future, updated in place
+            submit (callable): submit(worker_id) -> future of self._setup_instance(worker_id)
+        """
+        for worker_id in list(queue):
+            cfg = self.instance_configs[worker_id]
+            if worker_id in setups:
+                setup = setups[worker_id]
+                if (cfg.get('pool') and setup.done() and not setup.exception()
+                        and self.host_pools.is_down(self.host_pools.host_of(worker_id))):
+                    host = self.host_pools.host_of(worker_id)
+                    del setups[worker_id]
+                    self.workers.pop(worker_id, None)
+                    self.host_pools.release(worker_id)
+                    self.status_channel.reporter(worker_id).status(f"requeued: {host.name} unreachable")
+                    self._set_phase(worker_id, 'queued')
+                continue
+            if not cfg.get('pool'):
+                setups[worker_id] = submit(worker_id)
+                continue
+            if self.host_pools.exhausted(cfg['pool']):
+                queue.remove(worker_id)
+                self._setup_failed(worker_id, RuntimeError(f"no reachable host left in pool '{cfg['pool']}'"))
+                continue
+            request = self._resource_request(worker_id)
+            host = self.host_pools.place(
+                cfg['pool'], worker_id, request['cpus'], request['memory_gb'], self._affinity_keys(worker_id)
+            )
+            if host:
+                self.status_channel.reporter(worker_id).emit('placement', pool=cfg['pool'], host=host.name)
+                setups[worker_id] = submit(worker_id)
+
+    def _affinity_keys(self, worker_id) -> List[str]:
+        """What a host may already hold for this instance: its code tree, venv, data and sweep."""
+        cfg = self.instance_configs[worker_id]
+        keys = [f"code:{cfg['workdir']}->{cfg['target_workdir']}"]
+        try:
+            with open(os.path.join(cfg['workdir'], cfg['requirements']), 'rb') as f:
+                keys.append(f"venv:{hashlib.sha256(f.read()).hexdigest()[:16]}")
+        except OSError:
+            pass
+        if (self.config.get('data_store') or {}).get('enabled'):
+            keys.append(f"data:{os.path.abspath(cfg['workdir'])}")
+        if cfg.get('sweep'):
+            keys.append(f"sweep:{cfg['sweep']}")
+        return keys
+
+    def _set_phase(self, worker_id, phase: str):
+        self.status_channel.reporter(worker_id).phase(phase)
+
+    def _sweep_leader(self, unique_id, cfg: Dict[str, Any]) -> Worker:
+        """
+        Return the worker holding the sweep's shared code tree and environment, setting it up
+        on the first trial that asks. Other trials of the sweep wait for it instead of syncing.
+        """
+        host = self.host_pools.host_of(unique_id) if cfg.get('pool') else None
+        key = (cfg['sweep'], host.name if host else '')
+        with self._sweep_locks_guard:
+            lock = self._sweep_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self.sweep_leaders:
+                journal_key = f"sweep:{cfg['sweep']}@{key[1]}"
+                digest = config_hash({k: cfg.get(k) for k in ('mode', 'workdir', 'target_workdir', 'requirements')})
+                context = self._setup_context(unique_id, cfg) if self.journal else {}
+                resume = self._resume_for(journal_key, digest, context)
+                if self.journal:
+                    self.journal.record('instance', journal_key, config_hash=digest)
+                # The leader reports its progress through the first trial's status row.
+                leader = self._assign_worker(unique_id, {**cfg, 'pipelines': {}}, resume=resume)
+                leader.setup()
+                self._journal_setup(journal_key, leader, context)
+                self.sweep_leaders[key] = leader
+            return self.sweep_leaders[key]
+
+    def _instance_name(self, worker_id) -> str:
+        cfg = self.instance_configs.get(worker_id, {})
+        return cfg.get('trial') or cfg.get('name') or worker_id
+
+    def tail(self, worker_id, step_name, n=20) -> List[str]:
+        """Return the last n log lines of an instance's step (works for local and remote workers)."""
+        return build_log_store(self.config.get('logs'), self._instance_name(worker_id)).tail(step_name, n)
 
     def _load_config(self, yaml_path: str) -> dict:
         with open(yaml_path, 'r') as f:
             raw_config = yaml.safe_load(f)
         validated_config = ConfigSchema(**raw_config)
-        return validated_config.model_dump()
+        config = validated_config.model_dump()
+        for sweep in config.get('sweeps', []):
+            config['instances'].extend(expand_sweep(sweep))
+        if not config['instances']:
+            raise ValueError("Config defines no instances or sweeps to run")
+        return config
 
     def clear_screen(self):
         """Clears the terminal screen."""
@@ -90,22 +334,38 @@ class Supervisor:
         else:
             os.system('clear')
 
-    def _assign_worker(self, id, config: Dict[str, Any]) -> Tuple[str, Worker]:
+    def _assign_worker(self, id, config: Dict[str, Any], shared_from: Worker = None, resume: Dict[str, Any] = None) -> Worker:
         unique_id = id
         worker = None
 
         # Arguments common to all worker types
         worker_args = {
             'worker_id': unique_id,
-            'workdir': config['target_workdir'],
+            'workdir': config['scratch_dir'] if shared_from else config['target_workdir'],
             'origin_dir': config['workdir'],
-            'main_states': self.worker_state,
+            'reporter': self.status_channel.reporter(id),
             'requirements': config['requirements'],
             'pipelines': config.get('pipelines'),
             'experiment_name': self.experiment_name,
             'mlflow_uri': self.mlflow_uri,
             'clean_workdir_after_run': self.clean_workdir_after_run,
-            'suppress_output': self.suppress_runner_output
+            'suppress_output': self.suppress_runner_output,
+            'venv_cache': self.config.get('venv_cache'),
+            'wheelhouse': self.config.get('wheelhouse'),
+            'teardown': self.config.get('teardown'),
+            'keep': config.get('keep'),
+            'sync': self.config.get('sync'),
+            'data_store': self.config.get('data_store'),
+            'sampling': self.config.get('sampling'),
+            'early_stopping': self.config.get('early_stopping'),
+            'fork_server': self.config.get('fork_server'),
+            'detached': self.config.get('detached'),
+            'max_parallel_steps': config.get('max_parallel_steps', 1),
+            'shared_from': shared_from,
+            'resume': resume,
+            'step_cache': self.step_cache_config,
+            'logs': self.config.get('logs'),
+            'instance_name': self._instance_name(id)
         }
 
         if config['mode'] == 'local':
@@ -113,7 +373,7 @@ class Supervisor:
         
         elif config['mode'] == 'remote':
             # This assumes your Worker class can handle ssh_config when provided
-            worker = Worker(**worker_args, ssh_config=config.get('ssh'))
+            worker = Worker(**worker_args, ssh_config=self._ssh_config(id, config))
             
         else:
             raise ValueError(f"Unknown worker mode: {config['mode']}")
@@ -123,30 +383,11 @@ class Supervisor:
         
         return worker
 
-    def print_status_table_setup(self, title: str):
-        """Prints the worker status table once."""
-        MAX_ID_WIDTH = 6
-        
-        print(f"--- {title} ---")
-        print(f"[Monitor] Snapshot Time: {time.strftime('%H:%M:%S')}")
-        
-        # Table Header
-        header = f"| {'ID':<{MAX_ID_WIDTH}} | {'STATUS':<22} |"
-        separator = f"+{'-' * (MAX_ID_WIDTH + 2)}+{'-' * 24}+"
-        
-        print(separator)
-        print(header)
-        print(separator)
-        
-        # Print row for each concurrency unit
-        for wid, state in self.worker_state.items():
-            worker_id = wid
-            display_id = worker_id[:MAX_ID_WIDTH]
-            status = self.worker_state[worker_id]['status'] if worker_id in self.worker_state else "Unknown"
-            row = f"| {display_id:<{MAX_ID_WIDTH}} | {status:<22} |"
-            print(row)
-            
-        print(separator)
+    def _ssh_config(self, worker_id, config: Dict[str, Any]):
+        """The instance's own ssh host, or the pool host it was placed on."""
+        if config.get('pool'):
+            return self.host_pools.host_of(worker_id).ssh
+        return config.get('ssh')
 
     def print_status_table(self, title: str):
         """Prints the worker status table once."""
@@ -156,47 +397,113 @@ class Supervisor:
         print(f"[Monitor] Snapshot Time: {time.strftime('%H:%M:%S')}")
         
         # Table Header
-        header = f"| {'ID':<{MAX_ID_WIDTH}} | {'STATUS':<22} |"
-        separator = f"+{'-' * (MAX_ID_WIDTH + 2)}+{'-' * 24}+"
+        header = f"| {'ID':<{MAX_ID_WIDTH}} | {'PHASE':<8} | {'STATUS':<22} | {'CPU%':>6} | {'RSS':>7} | {'LAST OUTPUT':<40} |"
+        separator = f"+{'-' * (MAX_ID_WIDTH + 2)}+{'-' * 10}+{'-' * 24}+{'-' * 8}+{'-' * 9}+{'-' * 42}+"
         
         print(separator)
         print(header)
         print(separator)
         
-        alive_count = 0
-        
-        # Print row for each concurrency unit
-        for unit in self.concurrency_units:
-            worker_id = unit.name
+        # Print row for each instance, including the ones still queued
+        stragglers = self._check_stragglers()
+        table = self.status_channel.table
+        phases = [table.get(wid, {}).get('phase') for wid in self.instance_configs]
+        started = sum(1 for phase in phases if phase in ('running', 'done'))
+        alive_count = phases.count('running')
+        for worker_id in self.instance_configs:
             display_id = worker_id[:MAX_ID_WIDTH]
-            
-            is_alive = unit.is_alive()
-            status = self.worker_state[worker_id]['status'] if worker_id in self.worker_state else "Unknown"
-            
-            if is_alive:
-                alive_count += 1
+            state = table.get(worker_id, {})
+            phase = state.get('phase', "unknown")
+            status = state.get('status', "Unknown")
+            last_log = state.get('last_log', "")[:40]
+            cpu, rss = self._resource_columns(state)
+            if worker_id in stragglers:
+                cpu = f"{cpu}!"
 
-            row = f"| {display_id:<{MAX_ID_WIDTH}} | {status:<22} |"
+            row = f"| {display_id:<{MAX_ID_WIDTH}} | {phase:<8} | {status:<22} | {cpu:>6} | {rss:>7} | {last_log:<40} |"
             print(row)
             
         print(separator)
-        print(f"[Monitor] Workers Alive: {alive_count}/{len(self.concurrency_units)}")
+        print(f"[Monitor] Workers Alive: {alive_count}/{started} "
+              f"(queued: {len(self.instance_configs) - started}) | {self.scheduler.usage()}")
+        for worker_id, info in stragglers.items():
+            kind = "I/O-heavy" if info['io_heavy'] else "CPU-starved"
+            print(f"[Monitor] Straggler {worker_id[:MAX_ID_WIDTH]} ({kind}): step '{info['step']}' at "
+                  f"{info['cpu_percent']:.0f}% CPU vs {info['peer_cpu_percent']:.0f}% for its peers")
+        if self.host_pools:
+            for name, usage in self.host_pools.usage().items():
+                print(f"[Monitor] Pool {name}: {usage}")
+        if self.stopped_early:
+            print(f"[Monitor] Stopped early: {len(self.stopped_early)} (compute reclaimed for queued instances)")
+
+    @staticmethod
+    def _resource_columns(state: Dict[str, Any]) -> Tuple[str, str]:
+        """Live CPU% and RSS of an instance's running step, '-' when it has none."""
+        sample = state.get('resources')
+        if not sample or state.get('steps', {}).get(sample['step'], {}).get('state') != 'running':
+            return "-", "-"
+        cpu = sample.get('cpu_percent')
+        return (f"{cpu:.0f}" if cpu is not None else "-"), format_bytes(sample.get('rss_bytes'))
+
+    def _check_stragglers(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Flag running instances whose CPU use is far below that of their peers running the same
+        step. Each (instance, step) is reported once as a 'straggler' event.
+        """
+        flagged = find_stragglers(
+            self.status_channel.snapshot(),
+            ratio=self.sampling_config.get('straggler_ratio', 0.5),
+            window=self.sampling_config.get('straggler_window', 6),
+            min_peers=self.sampling_config.get('min_peers', 3)
+        )
+        for worker_id, info in flagged.items():
+            if (worker_id, info['step']) not in self._reported_stragglers:
+                self._reported_stragglers.add((worker_id, info['step']))
+                self.status_channel.reporter(worker_id).emit('straggler', **info)
+        self.stragglers = flagged
+        return flagged
     
+    def _apply_early_stopping(self):
+        """
+        Ask the running trials the early-stopping rules select to stop, comparing each with its
+        siblings (same sweep, or all plain instances). Checked at most once per poll interval;
+        a stopped instance frees its capacity for the queued ones like any finished instance.
+        """
+        now = time.monotonic()
+        if not self.early_stopper or now - self._last_early_stopping_check < self.early_stopping_config.get('poll_interval', 2.0):
+            return
+        self._last_early_stopping_check = now
+
+        table = self.status_channel.snapshot()
+        groups: Dict[str, List[str]] = {}
+        for worker_id, cfg in self.instance_configs.items():
+            groups.setdefault(cfg.get('sweep') or '', []).append(worker_id)
+        for members in groups.values():
+            curves = metric_curves({wid: table.get(wid, {}) for wid in members}, self.early_stopper.metric)
+            running = [
+                wid for wid in members
+                if table.get(wid, {}).get('phase') == 'running' and wid not in self.stopped_early
+            ]
+            for worker_id, reason in self.early_stopper.decide(curves, running).items():
+                self.stopped_early[worker_id] = reason
+                self.workers[worker_id].request_stop()
+                self.status_channel.reporter(worker_id).emit('early_stop', reason=reason)
+
     def monitor_workers(self):
         """
         Runs in a separate thread and updates worker status 
         in-place by clearing the screen before each table print.
         """
-        if not self.visualize_progress:
-            # If visualization is off, just wait for the signal to finish.
-            self.all_finished.wait()
-            return
-        
         while not self.all_finished.is_set():
             finished_early = self.all_finished.wait(self._print_timing) 
             
             if finished_early:
                 break
+
+            if not self.visualize_progress:
+                # Nothing to draw, but stragglers are still reported (to the events file).
+                self._check_stragglers()
+                continue
             
             if self.clear_screen_on_update:
                 self.clear_screen()
@@ -205,33 +512,165 @@ class Supervisor:
             print("", end="", flush=True) 
             
         # --- FINAL STATE ---
+        if not self.visualize_progress:
+            return
         if self.clear_screen_on_update:
             self.clear_screen()
         
         self.print_status_table("Final State (All Workers Finished)")
 
-    def run_all(self):
-        # 1. Initialize concurrency units
-        for worker_id, worker_info in self.worker_state.items():
-            worker: Worker = worker_info['obj'] 
-
-            # Use multiprocessing for local workers (no SSH client)
-            # and threading for remote workers.
-            if worker.ssh_client is None:
-                unit = multiprocessing.Process(
-                    target=worker.run, 
-                    name=str(worker_id)
-                )
-            else:
-                unit = threading.Thread(
-                    target=worker.run, 
-                    name=str(worker_id)
-                )
+    def _start_unit(self, worker_id) -> Union[threading.Thread, multiprocessing.Process]:
+        worker: Worker = self.workers[worker_id]
+
+        # Use multiprocessing for local workers (no SSH client)
+        # and threading for remote workers.
+        if worker.ssh_client is None:
+            unit = multiprocessing.Process(
+                target=worker.run, 
+                name=str(worker_id)
+            )
+        else:
+            unit = threading.Thread(
+                target=worker.run, 
+                name=str(worker_id)
+            )
 
-            unit.start()
-            self.concurrency_units.append(unit)
+        unit.start()
+        self.concurrency_units.append(unit)
+        return unit
+
+    def _history_host(self, worker_id, cfg: Dict[str, Any]) -> str:
+        """Host name durations are recorded under; ANY_HOST for a pooled instance not placed yet."""
+        if cfg['mode'] == 'local':
+            return 'local'
+        if cfg.get('pool') and not self.host_pools.host_of(worker_id):
+            return ANY_HOST
+        ssh = self._ssh_config(worker_id, cfg) or {}
+        return f"{ssh.get('hostname')}:{ssh.get('port', 22)}"
+
+    def _estimates(self) -> Dict[str, Any]:
+        """worker_id -> predicted {'setup', 'run'} seconds from the duration history, or None."""
+        if not self.history:
+            return {wid: None for wid in self.instance_configs}
+        return {
+            wid: self.history.estimate(cfg, self._history_host(wid, cfg))
+            for wid, cfg in self.instance_configs.items()
+        }
+
+    def _admission_order(self) -> List[str]:
+        """
+        Instance ids sorted by descending priority, then by predicted run time as set by
+        scheduler.order (longest or shortest first), config order breaking ties.
+        """
+        runs = {wid: estimate and estimate['run'] for wid, estimate in self._estimates().items()}
+        return admission_order(self.instance_configs, runs, self.admission_policy)
 
-        # --- 2. Start the Monitor Thread ---
+    def plan(self) -> Dict[str, Dict[str, float]]:
+        """
+        Predict when each instance would be set up, start and end, and the run's makespan,
+        from the duration history and the scheduler's capacity. Nothing is run.
+        """
+        estimates = self._estimates()
+        known = [estimate for estimate in estimates.values() if estimate]
+        fallback = {
+            part: statistics.median(estimate[part] for estimate in known) if known else 0.0
+            for part in ('setup', 'run')
+        }
+        scheduler = ResourceScheduler(
+            cpu_slots=self.scheduler.cpu_slots,
+            memory_gb=self.scheduler.memory_gb,
+            max_concurrent_runs=self.scheduler.max_concurrent_runs
+        )
+        schedule = simulate_schedule(
+            self._admission_order(),
+            {wid: estimates[wid] or fallback for wid in self.instance_configs},
+            {wid: self._resource_request(wid) for wid in self.instance_configs},
+            scheduler,
+            self.max_concurrent_setups
+        )
+        print(f"--- Predicted schedule ({self.experiment_name}, {self.admission_policy}) ---")
+        print_plan(
+            schedule,
+            {wid: self._instance_name(wid) for wid in self.instance_configs},
+            unknown=[wid for wid, estimate in estimates.items() if not estimate]
+        )
+        return schedule
+
+    def _resource_request(self, worker_id) -> Dict[str, Any]:
+        cfg = self.instance_configs[worker_id]
+        resources = cfg.get('resources') or {}
+        return {
+            'cpus': resources.get('cpus', 1),
+            'memory_gb': resources.get('memory_gb', 0),
+            'local': cfg['mode'] == 'local'
+        }
+
+    def _acquire(self, worker_id) -> bool:
+        """Reserve scheduler capacity (and cores, for local instances) so worker_id can start."""
+        request = self._resource_request(worker_id)
+        if not self.scheduler.try_acquire(**request):
+            return False
+        if self.cpu_allocator and request['local']:
+            resources = self.instance_configs[worker_id].get('resources') or {}
+            cores = self.cpu_allocator.allocate(worker_id, cpus=request['cpus'], cores=resources.get('cores'))
+            self.workers[worker_id].pin_cpus(cores)
+        return True
+
+    def _release(self, worker_id):
+        self.scheduler.release(**self._resource_request(worker_id))
+        if self.host_pools:
+            self.host_pools.release(worker_id)
+        if self.cpu_allocator:
+            self.cpu_allocator.release(worker_id)
+
+    def _run_admission_loop(self):
+        """
+        Set instances up in a bounded pool and start each one as soon as its own setup is done
+        and capacity frees up, until every instance is done.
+        """
+        queue = self._admission_order()
+        running: Dict[str, Union[threading.Thread, multiprocessing.Process]] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_setups) as setup_pool:
+            setups = {}
+
+            while queue or running:
+                # Keep the event pipe flowing: a child process can't exit while its queue is unflushed.
+                self.status_channel.drain()
+                # Submitted in admission order, so higher-priority instances are set up first.
+                self._dispatch_setups(queue, setups, lambda worker_id: setup_pool.submit(self._setup_instance, worker_id))
+                for worker_id in list(queue):
+                    setup = setups.get(worker_id)
+                    if setup is None or not setup.done():
+                        continue
+                    if setup.exception():
+                        del setups[worker_id]
+                        if not self._setup_failed(worker_id, setup.exception()):
+                            queue.remove(worker_id)
+                    elif self._acquire(worker_id):
+                        queue.remove(worker_id)
+                        self._set_phase(worker_id, 'running')
+                        running[worker_id] = self._start_unit(worker_id)
+
+                self._apply_early_stopping()
+                for worker_id, unit in list(running.items()):
+                    if not unit.is_alive():
+                        unit.join()
+                        del running[worker_id]
+                        self._release(worker_id)
+                        self._set_phase(worker_id, 'done')
+
+                time.sleep(self._admission_interval)
+
+    def run_all(self):
+        if self.engine == 'asyncio':
+            AsyncEngine(self).run()
+        else:
+            self._run_threaded()
+        self._finish_run()
+
+    def _run_threaded(self):
+        # --- 1. Start the Monitor Thread ---
         monitor_thread = threading.Thread(
             target=self.monitor_workers, 
             daemon=True,
@@ -239,13 +678,41 @@ class Supervisor:
         )
         monitor_thread.start()
 
-        # --- 3. Wait for all worker units (Threads/Processes) to complete ---
-        for unit in self.concurrency_units:
-            unit.join()
+        # --- 2. Admit queued instances as capacity frees up, until all complete ---
+        self._run_admission_loop()
 
-        # --- 4. Signal the monitor thread to stop ---
+        # --- 3. Signal the monitor thread to stop ---
         self.all_finished.set()
         
         monitor_thread.join()
 
+    def _finish_run(self):
+        for leader in self.sweep_leaders.values():
+            leader.close()
+        ssh_pool.close_all()
+        self.status_channel.close()
+        if self.journal:
+            self.journal.close()
+        if self.history:
+            # Resumed instances skipped part of their work: only their steps are representative.
+            resumed = [wid for wid, worker in self.workers.items() if worker.resumed]
+            self.history.record_run(self.instance_configs, self.status_channel.snapshot(), self._history_hosts, skip=resumed)
+            self.history.save()
+
         print("\nAll jobs were completed.")
+        self.report_timings()
+
+    def report_timings(self) -> Dict[str, Any]:
+        """Write the per-run timing report (JSON, optionally Prometheus) and print the summary."""
+        metrics_config = self.config.get('metrics') or {}
+        report_dir = metrics_config.get('report_dir') or (self.config.get('logs') or {}).get('dir', './flowkestra_logs')
+        names = {wid: self._instance_name(wid) for wid in self.instance_configs}
+        report = build_report(self.status_channel.snapshot(), names)
+
+        path = write_json_report(report, os.path.join(os.path.expanduser(report_dir), f"timings-{self.run_stamp}.json"))
+        if metrics_config.get('prometheus_textfile'):
+            write_prometheus_textfile(report, metrics_config['prometheus_textfile'])
+        if metrics_config.get('print_summary', True):
+            print_summary(report)
+            print(f"Timing report written to {path}")
+        return report
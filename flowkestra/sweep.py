@@ -0,0 +1,89 @@
+import re
+import math
+import random
+import itertools
+from pathlib import PurePosixPath
+from typing import Any, Dict, List
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def _sample(spec, rng: random.Random):
+    """Draw one value from a list (uniform choice) or a {low, high, log, integer} range."""
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    low, high = spec['low'], spec['high']
+    if spec.get('log'):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return int(round(value)) if spec.get('integer') else value
+
+
+def expand_matrix(matrix: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Turn a sweep's matrix section into a list of parameter dicts, one per trial."""
+    mode = matrix.get('mode', 'grid')
+    parameters = matrix.get('parameters') or {}
+
+    if mode == 'list':
+        return [dict(trial) for trial in matrix.get('trials') or []]
+
+    if mode == 'grid':
+        names = list(parameters)
+        for name in names:
+            if not isinstance(parameters[name], list):
+                raise ValueError(f"Grid sweep parameter '{name}' must be a list of values")
+        return [dict(zip(names, values)) for values in itertools.product(*(parameters[n] for n in names))]
+
+    if mode == 'random':
+        rng = random.Random(matrix.get('seed'))
+        return [
+            {name: _sample(spec, rng) for name, spec in parameters.items()}
+            for _ in range(matrix.get('samples', 10))
+        ]
+
+    raise ValueError(f"Unknown sweep mode: {mode}")
+
+
+def _substitute(arg: str, params: Dict[str, Any]) -> str:
+    return PLACEHOLDER.sub(lambda m: str(params[m.group(1)]) if m.group(1) in params else m.group(0), arg)
+
+
+def expand_sweep(sweep: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Expand one sweep into instance configs, one per trial.
+
+    ``{name}`` placeholders in pipeline args are replaced by the trial's parameters.
+    Every trial keeps the sweep's ``target_workdir`` as its shared code/environment tree
+    and gets its own ``scratch_dir`` under ``<target_workdir>/trials/<trial>``.
+    """
+    base = {k: v for k, v in sweep.items() if k not in ('name', 'matrix')}
+    trials = expand_matrix(sweep['matrix'])
+
+    referenced = {
+        m.group(1)
+        for step in sweep['pipelines'].values()
+        for arg in step.get('args') or []
+        for m in PLACEHOLDER.finditer(arg)
+    }
+    for params in trials:
+        unused = set(params) - referenced
+        if unused:
+            raise ValueError(f"Sweep '{sweep['name']}' parameters not used in any args: {sorted(unused)}")
+
+    instances = []
+    for index, params in enumerate(trials):
+        trial_name = f"{sweep['name']}-{index:03d}"
+        pipelines = {
+            step_name: {**step, 'args': [_substitute(arg, params) for arg in step.get('args') or []]}
+            for step_name, step in sweep['pipelines'].items()
+        }
+        instances.append({
+            **base,
+            'pipelines': pipelines,
+            'sweep': sweep['name'],
+            'trial': trial_name,
+            'params': params,
+            'scratch_dir': str(PurePosixPath(sweep['target_workdir']) / "trials" / trial_name),
+        })
+    return instances
@@ -0,0 +1,375 @@
+import os
+import gzip
+import json
+import stat
+import zlib
+import shlex
+import shutil
+import tarfile
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Collection, Dict, List, Optional
+
+from flowkestra.utils import SSHClient, quote_path
+
+MANIFEST_NAME = ".flowkestra-manifest.json"
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+# Below this payload size latency dominates and compression only costs CPU.
+COMPRESS_MIN_BYTES = 1024 * 1024
+# 'auto' compresses only payloads whose sample shrinks to at most this fraction (e.g. not weights).
+COMPRESS_MAX_RATIO = 0.7
+COMPRESS_SAMPLE_BYTES = 1024 * 1024
+# Per core, zlib level 1 packs source trees at ~60 MB/s to about a quarter of their size; level 9
+# (tarfile's own gzip) and xz manage ~6 and ~1.5 MB/s, slower than sending raw over most links.
+# See benchmarks/sync_compression.py.
+GZIP_LEVEL = 1
+# tarfile mode and tar flag per compression; gzip is applied by tar_stream at GZIP_LEVEL.
+TAR_MODES = {'none': ('w|', ''), 'gzip': ('w|', 'z'), 'xz': ('w|xz', 'J')}
+# Stats the files named in the manifest of the current directory and prints the regular ones as
+# "path\tsize\tmtime" lines, with the remote's own python3. Only those paths matter to a sync, so
+# the rest of the workdir (a retained venv, step outputs) is never walked.
+STAT_MANIFEST_PY = (
+    "import json, os, stat\n"
+    "try:\n"
+    f"    paths = json.load(open({MANIFEST_NAME!r}))\n"
+    "except (OSError, ValueError):\n"
+    "    paths = {}\n"
+    "for path in paths:\n"
+    "    try:\n"
+    "        st = os.lstat(path)\n"
+    "    except OSError:\n"
+    "        continue\n"
+    "    if stat.S_ISREG(st.st_mode):\n"
+    "        print(path, st.st_size, st.st_mtime, sep='\\t')\n"
+)
+
+
+def file_digest(path, chunk_size=1024 * 1024) -> str:
+    """Return the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_source_manifest(origin_dir: Path, previous: Optional[Dict[str, dict]] = None,
+                          exclude: Optional[Collection[str]] = None) -> Dict[str, dict]:
+    """
+    Describe every file under origin_dir as ``{rel_path: {size, mtime, sha256}}``.
+
+    Hashes from ``previous`` are reused for files whose size and mtime did not change,
+    so an unchanged tree is only stat'ed, never re-read. Paths in ``exclude`` are skipped.
+    """
+    previous = previous or {}
+    exclude = exclude or ()
+    manifest = {}
+    for src_path in origin_dir.glob("**/*"):
+        if not src_path.is_file():
+            continue
+        rel_path = src_path.relative_to(origin_dir).as_posix()
+        if rel_path == MANIFEST_NAME or rel_path in exclude:
+            continue
+        st = src_path.stat()
+        entry = {'size': st.st_size, 'mtime': int(st.st_mtime)}
+        old = previous.get(rel_path)
+        if old and old['size'] == entry['size'] and old['mtime'] == entry['mtime']:
+            entry['sha256'] = old['sha256']
+        else:
+            entry['sha256'] = file_digest(src_path)
+        manifest[rel_path] = entry
+    return manifest
+
+
+def reflink_or_copy(src_path: Path, dest_path: Path):
+    """Clone src into dest with a copy-on-write reflink when the filesystem supports it, else copy."""
+    try:
+        import fcntl
+        with open(src_path, "rb") as src, open(dest_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(src_path, dest_path)
+    except (ImportError, OSError):
+        shutil.copy2(src_path, dest_path)
+
+
+def sample_files(paths) -> bytes:
+    """Up to COMPRESS_SAMPLE_BYTES read from the start of paths, to judge their compressibility."""
+    chunks, size = [], 0
+    for path in paths:
+        if size >= COMPRESS_SAMPLE_BYTES:
+            break
+        try:
+            with open(path, "rb") as f:
+                chunk = f.read(min(64 * 1024, COMPRESS_SAMPLE_BYTES - size))
+        except OSError:
+            continue
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks)
+
+
+def choose_compression(total_bytes: int, compression="auto", sample: Optional[bytes] = None) -> str:
+    """
+    Resolve 'auto' into 'gzip' (at GZIP_LEVEL) or 'none': payloads under COMPRESS_MIN_BYTES and
+    payloads whose sample doesn't compress well are sent raw. xz is never chosen automatically;
+    on links faster than the compressor (a gigabit LAN) 'none' is the better setting.
+    """
+    if compression != "auto":
+        return compression
+    if total_bytes < COMPRESS_MIN_BYTES or not sample:
+        return "none"
+    if len(zlib.compress(sample, GZIP_LEVEL)) > COMPRESS_MAX_RATIO * len(sample):
+        return "none"
+    return "gzip"
+
+
+@contextmanager
+def tar_stream(fileobj, compression="none"):
+    """A streaming tarfile writing into fileobj, compressed as 'none', 'gzip' (at GZIP_LEVEL) or 'xz'."""
+    gz = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) if compression == "gzip" else None
+    try:
+        with tarfile.open(fileobj=gz or fileobj, mode=TAR_MODES[compression][0]) as archive:
+            yield archive
+    finally:
+        if gz:
+            gz.close()
+
+
+def remote_has_tar(ssh_client: SSHClient) -> bool:
+    # Collected with the other host facts, so it costs no extra round trip.
+    return ssh_client.host_facts().get('tar') == 'yes'
+
+
+def tar_upload(ssh_client: SSHClient, origin_dir: Path, workdir: Path, rel_paths: List[str], compression="none"):
+    """Pack rel_paths into one tar stream and extract it on the remote through a single channel."""
+    tar_flag = TAR_MODES[compression][1]
+
+    def write_archive(stdin):
+        with tar_stream(stdin, compression) as archive:
+            for rel_path in rel_paths:
+                archive.add(str(origin_dir / rel_path), arcname=rel_path, recursive=False)
+
+    workdir = quote_path(workdir)
+    _, err, exit_status = ssh_client.pipe(
+        f"mkdir -p {workdir} && cd {workdir} && tar -x{tar_flag}f -",
+        write_archive
+    )
+    if exit_status != 0:
+        raise RuntimeError(f"Remote tar extraction into {workdir} failed: {err}")
+
+
+def sftp_upload(ssh_client: SSHClient, origin_dir: Path, workdir: Path, rel_paths: List[str]):
+    """Upload rel_paths one file at a time over SFTP."""
+    remote_dirs = {str((workdir / p).parent) for p in rel_paths} | {str(workdir)}
+    ssh_client.execute("mkdir -p " + " ".join(quote_path(d) for d in sorted(remote_dirs)), suppress_output=True)
+    for rel_path in rel_paths:
+        ssh_client.upload(str(origin_dir / rel_path), str(workdir / rel_path), preserve_times=True)
+
+
+def upload_tree(ssh_client: SSHClient, origin_dir, workdir, rel_paths: Optional[List[str]] = None,
+                transfer="auto", compression="auto", suppress_output=True) -> dict:
+    """
+    Upload files from origin_dir to a remote workdir.
+
+    Args:
+        ssh_client (SSHClient): connected client for the target host
+        origin_dir (str or Path): local source tree
+        workdir (str or Path): remote target directory
+        rel_paths (list of str, optional): files to send, relative to origin_dir (default: all files)
+        transfer (str): 'tar' streams everything through one channel, 'sftp' sends one file per put,
+            'auto' uses tar when the remote has it
+        compression (str): 'none', 'gzip', 'xz' or 'auto' (gzip for large, compressible payloads)
+        suppress_output (bool): If True, do not print transfer details.
+    """
+    origin_dir = Path(origin_dir)
+    workdir = Path(workdir)
+    if rel_paths is None:
+        rel_paths = [p.relative_to(origin_dir).as_posix() for p in origin_dir.glob("**/*") if p.is_file()]
+    total_bytes = sum((origin_dir / p).stat().st_size for p in rel_paths)
+    stats = {'files': len(rel_paths), 'bytes': total_bytes, 'transfer': 'none'}
+    if not rel_paths:
+        return stats
+
+    if transfer == "auto":
+        transfer = "tar" if remote_has_tar(ssh_client) else "sftp"
+    if transfer == "tar":
+        sample = sample_files(origin_dir / p for p in rel_paths) if compression == "auto" else None
+        compression = choose_compression(total_bytes, compression, sample)
+        tar_upload(ssh_client, origin_dir, workdir, rel_paths, compression)
+        stats['transfer'] = f"tar/{compression}"
+    else:
+        sftp_upload(ssh_client, origin_dir, workdir, rel_paths)
+        stats['transfer'] = "sftp"
+
+    if not suppress_output:
+        print(f"Uploaded {stats['files']} files ({stats['bytes']} bytes) to {workdir} via {stats['transfer']}")
+    return stats
+
+
+class IncrementalSync:
+    """
+    Sync origin_dir into workdir (local or remote) transferring only new or changed files.
+
+    A manifest of path, size, mtime and content hash is kept inside the target workdir.
+    On each sync the source tree is compared against it: changed files are transferred,
+    files removed from the source are deleted, and everything else is left in place.
+    Files that were never part of the manifest (e.g. training outputs) are not touched.
+
+    The manifest goes away with the workdir: with ``clean_workdir_after_run`` (the default)
+    every run starts from an empty target and transfers everything, so incremental syncs only
+    pay off with ``clean_workdir_after_run: false``.
+
+    ``link_mode='hardlink'`` makes local target files share their inode with the source: a step
+    that writes into a synced file in place also changes the source tree. It is opt-in.
+    """
+
+    def __init__(self, origin_dir, workdir, ssh_client: SSHClient = None, link_mode="copy", transfer="auto",
+                 compression="auto", suppress_output=True, exclude: Optional[Collection[str]] = None):
+        """
+        Args:
+            origin_dir (str or Path): local source tree
+            workdir (str or Path): target directory (local or remote)
+            ssh_client (SSHClient, optional): if provided, the target is remote
+            link_mode (str): 'copy', 'hardlink' (shares inodes with the source) or 'reflink' for local targets
+            transfer (str): remote transfer method, see upload_tree
+            compression (str): remote tar compression, see upload_tree
+            suppress_output (bool): If True, do not print sync progress.
+            exclude (collection of str, optional): origin-relative files left out of the sync
+                (e.g. those materialized from the data store)
+        """
+        self.origin_dir = Path(origin_dir)
+        self.workdir = Path(workdir)
+        self.ssh_client = ssh_client
+        self.link_mode = link_mode
+        self.transfer = transfer
+        self.compression = compression
+        self.suppress_output = suppress_output
+        self.exclude = set(exclude or ())
+        self.manifest_path = self.workdir / MANIFEST_NAME
+
+    # ---------- manifest ----------
+    @staticmethod
+    def _parse_manifest(data: str) -> Dict[str, dict]:
+        try:
+            return json.loads(data) if data else {}
+        except ValueError:
+            # A corrupt manifest only costs us a full re-sync.
+            return {}
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        if self.manifest_path.exists():
+            return self._parse_manifest(self.manifest_path.read_text())
+        return {}
+
+    def _save_manifest(self, manifest: Dict[str, dict]):
+        data = json.dumps(manifest, sort_keys=True)
+        if self.ssh_client:
+            self.ssh_client.pipe(f"cat > {quote_path(self.manifest_path)}", lambda stdin: stdin.write(data.encode()))
+        else:
+            self.manifest_path.write_text(data)
+
+    def _remote_state(self):
+        """Read the remote manifest and the state of its files in a single batch: (manifest, target state)."""
+        python = self.ssh_client.host_facts().get('python')
+        if python:
+            list_files = f"{shlex.quote(python)} -c {shlex.quote(STAT_MANIFEST_PY)}"
+        else:
+            # No python3 on the host (it can't build a venv either): fall back to listing with GNU find.
+            list_files = "find . -type f -printf '%P\\t%s\\t%T@\\n'"
+        manifest, listing = self.ssh_client.run_batch([
+            f"cat {quote_path(self.manifest_path)} 2>/dev/null",
+            f"cd {quote_path(self.workdir)} 2>/dev/null && {list_files}",
+        ], stop_on_error=False)
+        state = {}
+        for line in listing.stdout.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 3:
+                state[parts[0]] = (int(parts[1]), int(float(parts[2])))
+        return self._parse_manifest(manifest.stdout), state
+
+    def _target_state(self, rel_paths) -> Dict[str, tuple]:
+        """
+        Return ``{rel_path: (size, mtime)}`` of the rel_paths that are files in the target. Only
+        the previous manifest's paths are asked for: a path it lacks is transferred anyway.
+        """
+        state = {}
+        for rel_path in rel_paths:
+            try:
+                st = os.lstat(self.workdir / rel_path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                state[rel_path] = (st.st_size, int(st.st_mtime))
+        return state
+
+    # ---------- transfer ----------
+    def _transfer_local(self, rel_path: str):
+        src_path = self.origin_dir / rel_path
+        dest_path = self.workdir / rel_path
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        if dest_path.exists() or dest_path.is_symlink():
+            dest_path.unlink()
+        if self.link_mode == "hardlink":
+            try:
+                os.link(src_path, dest_path)
+                return
+            except OSError:
+                # Cross-device or unsupported filesystem: fall back to a copy.
+                pass
+        if self.link_mode == "reflink":
+            reflink_or_copy(src_path, dest_path)
+        else:
+            shutil.copy2(src_path, dest_path)
+
+    def run(self) -> dict:
+        """Perform the sync and return counters of what was done."""
+        if self.ssh_client:
+            old_manifest, target = self._remote_state()
+        else:
+            old_manifest = self._load_manifest()
+            target = self._target_state(old_manifest)
+        new_manifest = build_source_manifest(self.origin_dir, previous=old_manifest, exclude=self.exclude)
+
+        to_transfer = []
+        unchanged = 0
+        for rel_path, entry in new_manifest.items():
+            old = old_manifest.get(rel_path)
+            in_target = target.get(rel_path)
+            if (old and old['sha256'] == entry['sha256']
+                    and in_target == (entry['size'], entry['mtime'])):
+                unchanged += 1
+                continue
+            to_transfer.append(rel_path)
+        to_delete = [p for p in old_manifest if p not in new_manifest and p in target]
+
+        if self.ssh_client:
+            workdir = quote_path(self.workdir)
+            commands = [f"mkdir -p {workdir}"]
+            if to_delete:
+                commands.append(f"cd {workdir} && rm -f -- " + " ".join(shlex.quote(p) for p in to_delete))
+            self.ssh_client.run_batch(commands).raise_for_status()
+            upload_tree(
+                self.ssh_client, self.origin_dir, self.workdir, to_transfer,
+                transfer=self.transfer, compression=self.compression
+            )
+        else:
+            self.workdir.mkdir(parents=True, exist_ok=True)
+            for rel_path in to_delete:
+                (self.workdir / rel_path).unlink()
+            for rel_path in to_transfer:
+                self._transfer_local(rel_path)
+
+        self._save_manifest(new_manifest)
+
+        stats = {
+            'files': len(to_transfer),
+            'bytes': sum(new_manifest[p]['size'] for p in to_transfer),
+            'deleted': len(to_delete),
+            'unchanged': unchanged,
+        }
+        if not self.suppress_output:
+            print(f"Incremental sync {self.origin_dir} -> {self.workdir}: "
+                  f"{stats['files']} transferred, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
+        return stats
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import uuid
+import shlex
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from flowkestra.utils import SSHClient
+
+TRASH_DIR_NAME = ".flowkestra-trash"
+# Trash left behind by a crashed run is reaped by the next teardown on the same parent dir.
+STALE_TRASH_MINUTES = 60
+
+
+class WorkdirCleaner:
+    """
+    Empties a workdir off the critical path.
+
+    Everything except the retained paths is renamed into a trash directory next to the
+    workdir (same filesystem, so each move is a cheap rename) and the trash is deleted by a
+    detached background process: a local ``python`` reaper or a remote ``nohup rm -rf``.
+    Retained paths (e.g. ``venv``, caches, datasets) survive for the next run.
+    """
+
+    def __init__(self, keep: Optional[List[str]] = None, background: bool = True):
+        """
+        Args:
+            keep (list of str, optional): workdir-relative paths to retain (nested paths allowed)
+            background (bool): delete the trash in a detached process instead of waiting for it
+        """
+        self.keep = {Path(p).as_posix().strip("/") for p in (keep or []) if p.strip("/")}
+        self.background = background
+        # Directories that contain a retained path: only their other children are removed.
+        self.ancestors = {""}
+        for path in self.keep:
+            parts = path.split("/")
+            self.ancestors.update("/".join(parts[:i]) for i in range(1, len(parts)))
+
+    def _doomed(self, list_dir: Callable[[str], List[str]]) -> List[str]:
+        """Workdir-relative paths to remove, given ``list_dir(rel_dir) -> child names``."""
+        doomed = []
+        for rel_dir in sorted(self.ancestors):
+            for name in list_dir(rel_dir):
+                rel = f"{rel_dir}/{name}" if rel_dir else name
+                if rel not in self.keep and rel not in self.ancestors:
+                    doomed.append(rel)
+        return doomed
+
+    @staticmethod
+    def _trash_dir(workdir: Path) -> Path:
+        return workdir.parent / TRASH_DIR_NAME / f"{workdir.name}-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    def clean(self, workdir, ssh_client: SSHClient = None, ensure_exists: bool = False) -> int:
+        """
+        Remove the workdir's contents except retained paths. Returns the number of entries removed.
+
+        Args:
+            workdir (str or Path): directory to empty (local or remote)
+            ssh_client (SSHClient, optional): if provided, the workdir is on the remote host
+            ensure_exists (bool): also create the workdir (in the same round trip when remote)
+        """
+        workdir = Path(workdir)
+        if ssh_client:
+            return self._clean_remote(workdir, ssh_client, ensure_exists)
+        return self._clean_local(workdir, ensure_exists)
+
+    # ---------- local ----------
+    def _clean_local(self, workdir: Path, ensure_exists: bool) -> int:
+        def list_dir(rel_dir):
+            target = workdir / rel_dir
+            return sorted(os.listdir(target)) if target.is_dir() and not target.is_symlink() else []
+
+        doomed = self._doomed(list_dir)
+        if doomed:
+            trash = self._trash_dir(workdir)
+            for rel in doomed:
+                (trash / rel).parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.rename(workdir / rel, trash / rel)
+                except OSError:
+                    # e.g. a mount point inside the workdir: delete it in place instead.
+                    if (workdir / rel).is_dir():
+                        shutil.rmtree(workdir / rel, ignore_errors=True)
+                    else:
+                        (workdir / rel).unlink()
+            self._reap_local(trash)
+        if ensure_exists:
+            workdir.mkdir(parents=True, exist_ok=True)
+        return len(doomed)
+
+    def _reap_local(self, trash: Path):
+        if not self.background:
+            shutil.rmtree(trash, ignore_errors=True)
+            # Same as the background reaper below: trash left by a crashed run goes too.
+            for path in trash.parent.iterdir():
+                try:
+                    stale = time.time() - path.stat().st_mtime > STALE_TRASH_MINUTES * 60
+                except OSError:
+                    continue
+                if stale:
+                    shutil.rmtree(path, ignore_errors=True)
+            return
+        script = (
+            "import os, sys, time, shutil\n"
+            "shutil.rmtree(sys.argv[1], ignore_errors=True)\n"
+            "root = os.path.dirname(sys.argv[1])\n"
+            "for name in os.listdir(root):\n"
+            "    path = os.path.join(root, name)\n"
+            "    if time.time() - os.path.getmtime(path) > int(sys.argv[2]) * 60:\n"
+            "        shutil.rmtree(path, ignore_errors=True)\n"
+        )
+        # Detached so the deletion outlives the worker process that started it.
+        detach = {'creationflags': subprocess.DETACHED_PROCESS} if os.name == 'nt' else {'start_new_session': True}
+        subprocess.Popen(
+            [sys.executable, "-c", script, str(trash), str(STALE_TRASH_MINUTES)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **detach
+        )
+
+    # ---------- remote ----------
+    @staticmethod
+    def _remote_path(base: Path, rel: str = "") -> str:
+        # The base stays unquoted so a '~' in target_workdir still expands, as elsewhere.
+        return f"{base}/{shlex.quote(rel)}" if rel else str(base)
+
+    def _clean_remote(self, workdir: Path, ssh_client: SSHClient, ensure_exists: bool) -> int:
+        ancestors = sorted(self.ancestors)
+        listings = ssh_client.run_batch(
+            [f"cd {self._remote_path(workdir, rel_dir)} 2>/dev/null && ls -A1" for rel_dir in ancestors],
+            stop_on_error=False
+        )
+        children = {rel_dir: result.stdout.splitlines() if result.exit_code == 0 else []
+                    for rel_dir, result in zip(ancestors, listings)}
+        doomed = self._doomed(lambda rel_dir: children.get(rel_dir, []))
+
+        trash = self._trash_dir(workdir)
+        trash_rel = lambda rel: f"{trash.name}/{rel}"
+        commands = []
+        if doomed:
+            parents = sorted({str(Path(trash_rel(rel)).parent.as_posix()) for rel in doomed})
+            commands.append("mkdir -p " + " ".join(self._remote_path(trash.parent, p) for p in parents))
+            commands += [
+                f"mv -- {self._remote_path(workdir, rel)} {self._remote_path(trash.parent, trash_rel(rel))}"
+                for rel in doomed
+            ]
+            reap = (
+                f"rm -rf {self._remote_path(trash.parent, trash.name)}; "
+                f"find {trash.parent} -mindepth 1 -maxdepth 1 -mmin +{STALE_TRASH_MINUTES} -exec rm -rf {{}} +"
+            )
+            if self.background:
+                # Detached from the channel: nothing of ours waits for the deletion to finish.
+                commands.append(f"nohup sh -c {shlex.quote(reap)} >/dev/null 2>&1 </dev/null &")
+            else:
+                commands.append(reap)
+        if ensure_exists:
+            commands.append(f"mkdir -p {workdir}")
+        if commands:
+            ssh_client.run_batch(commands).raise_for_status()
+        return len(doomed)
+
+
+def build_workdir_cleaner(teardown_config: Optional[dict], keep: Optional[List[str]] = None) -> WorkdirCleaner:
+    """
+    Create a WorkdirCleaner from the ``teardown`` config section.
+
+    Args:
+        teardown_config (dict, optional): the ``teardown`` section
+        keep (list of str, optional): the instance's own retained paths, added to the section's
+    """
+    teardown_config = teardown_config or {}
+    return WorkdirCleaner(
+        keep=list(teardown_config.get('keep') or []) + list(keep or []),
+        background=teardown_config.get('background', True)
+    )
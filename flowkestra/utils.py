@@ -1,21 +1,102 @@
-from typing import Optional
+import os
+import re
+import time
+import uuid
+import shlex
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
 import paramiko
 from flowkestra.schema import SSHConfig
 
+def quote_path(path) -> str:
+    """shlex.quote a remote path, leaving a leading ``~/`` for the remote shell to expand."""
+    path = str(path)
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+class CommandResult:
+    """Outcome of one command of a batch. ``exit_code`` is None if the command never ran."""
+
+    def __init__(self, command: str, exit_code: Optional[int] = None, stdout: str = "", stderr: str = "",
+                 duration: Optional[float] = None):
+        self.command = command
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+
+    def __repr__(self):
+        return f"CommandResult(command={self.command!r}, exit_code={self.exit_code}, duration={self.duration})"
+
+
+class RemoteCommandError(RuntimeError):
+    def __init__(self, result: CommandResult, host: str = ""):
+        self.result = result
+        super().__init__(
+            f"Remote command failed{f' on {host}' if host else ''} (exit {result.exit_code}): "
+            f"{result.command}{f': {result.stderr}' if result.stderr else ''}"
+        )
+
+
+class BatchResult(list):
+    """Per-command results of SSHClient.run_batch, in submission order."""
+
+    host = ""
+
+    @property
+    def ok(self) -> bool:
+        return all(r.exit_code == 0 for r in self)
+
+    @property
+    def failed(self) -> Optional[CommandResult]:
+        """The first command that failed or never ran, if any."""
+        return next((r for r in self if r.exit_code != 0), None)
+
+    def raise_for_status(self) -> "BatchResult":
+        if self.failed:
+            raise RemoteCommandError(self.failed, self.host)
+        return self
+
+
 class SSHClient:
-    def __init__(self, config: SSHConfig):
+    def __init__(self, config: Union[SSHConfig, dict], max_channels: int = 8, keepalive_interval: int = 30,
+                 control_channels: int = 2):
         """
         SSH client wrapper using SSHConfig schema.
+
+        A single authenticated transport is shared by every caller; each command or
+        transfer runs on its own channel, with at most ``max_channels`` open at once.
+        Long-running step commands (execute_streaming) may hold all but ``control_channels``
+        of them, so short control commands (stop, timeout kill, polls, sampling) never queue
+        behind steps that run for hours.
         """
-        self.config = config
+        self.config = SSHConfig(**config) if isinstance(config, dict) else config
         self.client: Optional[paramiko.SSHClient] = None
         self.sftp: Optional[paramiko.SFTPClient] = None
+        self.keepalive_interval = keepalive_interval
+        self.facts: Dict[str, str] = {}
+        self._channel_slots = threading.BoundedSemaphore(max_channels)
+        self._step_slots = threading.BoundedSemaphore(max(1, max_channels - control_channels))
+        self._lock = threading.RLock()
+        # Separate from _lock: fact collection waits for a channel slot, and _lock must
+        # never be held while waiting for one.
+        self._facts_lock = threading.Lock()
 
     # ---------- internal helpers ----------
     def _log(self, msg: str):
         if self.config.debug:
             print(msg)
 
+    @contextmanager
+    def _channel(self):
+        """Hold one of the host's channel slots, reconnecting first if the transport died."""
+        with self._channel_slots:
+            self._ensure_connected()
+            yield
+
     # ---------- connection ----------
     def connect(self):
         """Establish SSH connection."""
@@ -32,45 +113,263 @@ class SSHClient:
                 key_filename=self.config.key_filename,
                 timeout=self.config.timeout,
             )
+            if self.keepalive_interval:
+                self.client.get_transport().set_keepalive(self.keepalive_interval)
             self._log("[SSH] Connected successfully!")
         except Exception as e:
             raise RuntimeError(f"SSH connection failed: {e}")
 
+    def is_alive(self) -> bool:
+        """Health check: True if the underlying transport is still active."""
+        transport = self.client.get_transport() if self.client else None
+        return bool(transport and transport.is_active())
+
+    def _ensure_connected(self):
+        with self._lock:
+            if self.is_alive():
+                return
+            if self.client:
+                self._log("[SSH] Transport lost, reconnecting...")
+                self.close()
+            self.connect()
+
     # ---------- command execution ----------
-    def execute(self, command: str):
+    def execute(self, command: str, suppress_output: bool = True):
         """Execute a command remotely and return (stdout, stderr)."""
-        if not self.client:
-            raise RuntimeError("SSH client not connected. Call connect() first.")
+        with self._channel():
+            self._log(f"[SSH] Executing command: {command}")
+            stdin, stdout, stderr = self.client.exec_command(command)
 
-        self._log(f"[SSH] Executing command: {command}")
-        stdin, stdout, stderr = self.client.exec_command(command)
-
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
+            output = stdout.read().decode().strip()
+            error = stderr.read().decode().strip()
 
+        if not suppress_output and output:
+            print(output)
         if error:
             self._log(f"[SSH] Error: {error}")
 
         return output, error
 
+    def execute_streaming(self, command: str, on_data, chunk_size: int = 32768, poll_interval: float = 0.1,
+                          timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Execute a long-running command remotely, passing output to ``on_data(stream, bytes)`` as
+        it arrives ('stdout' or 'stderr') instead of buffering it. Returns the exit status, or None
+        if ``timeout`` seconds passed first (the channel is then closed, hanging up on the command).
+
+        The command holds one of the host's step slots while it runs. When none is free, the
+        wait is reported through on_data, and ``timeout`` counts from when the command starts.
+        """
+        if not self._step_slots.acquire(blocking=False):
+            on_data('stderr', (
+                f"[flowkestra] waiting for a free SSH channel on {self.config.hostname} "
+                f"(ssh_pool.max_channels_per_host; detached steps hold none)\n"
+            ).encode())
+            self._step_slots.acquire()
+        try:
+            return self._stream(command, on_data, chunk_size, poll_interval, timeout)
+        finally:
+            self._step_slots.release()
+
+    def _stream(self, command: str, on_data, chunk_size: int, poll_interval: float, timeout: Optional[float]) -> Optional[int]:
+        with self._channel():
+            deadline = time.monotonic() + timeout if timeout else None
+            self._log(f"[SSH] Executing command (streaming): {command}")
+            stdin, stdout, stderr = self.client.exec_command(command)
+            channel = stdout.channel
+            stdin.channel.shutdown_write()
+
+            while True:
+                if deadline and time.monotonic() > deadline:
+                    self._log(f"[SSH] Timed out after {timeout}s: {command}")
+                    channel.close()
+                    return None
+                received = False
+                if channel.recv_ready():
+                    on_data('stdout', channel.recv(chunk_size))
+                    received = True
+                if channel.recv_stderr_ready():
+                    on_data('stderr', channel.recv_stderr(chunk_size))
+                    received = True
+                if not received:
+                    if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                        break
+                    time.sleep(poll_interval)
+
+            return channel.recv_exit_status()
+
+    def pipe(self, command: str, writer):
+        """
+        Execute a command remotely, streaming data into its stdin on a single channel.
+
+        ``writer(stdin)`` receives a writable file object; stdin is closed once it returns.
+        Returns (stdout, stderr, exit_status).
+        """
+        with self._channel():
+            self._log(f"[SSH] Streaming into command: {command}")
+            stdin, stdout, stderr = self.client.exec_command(command)
+            try:
+                writer(stdin)
+            finally:
+                stdin.channel.shutdown_write()
+
+            output = stdout.read().decode().strip()
+            error = stderr.read().decode().strip()
+            exit_status = stdout.channel.recv_exit_status()
+
+        if error:
+            self._log(f"[SSH] Error: {error}")
+
+        return output, error, exit_status
+
+    def read_stream(self, command: str, reader):
+        """
+        Execute a command remotely, handing its binary stdout to ``reader(stdout)`` as a stream.
+        Returns (stderr, exit_status).
+        """
+        with self._channel():
+            self._log(f"[SSH] Streaming from command: {command}")
+            stdin, stdout, stderr = self.client.exec_command(command)
+            stdin.channel.shutdown_write()
+            reader(stdout)
+
+            error = stderr.read().decode().strip()
+            exit_status = stdout.channel.recv_exit_status()
+
+        if error:
+            self._log(f"[SSH] Error: {error}")
+
+        return error, exit_status
+
+    def _execute_status(self, command: str) -> Tuple[str, str, int]:
+        """Execute a command on its own channel and return (stdout, stderr, exit_status)."""
+        with self._channel():
+            self._log(f"[SSH] Executing command: {command}")
+            stdin, stdout, stderr = self.client.exec_command(command)
+            stdin.channel.shutdown_write()
+            output = stdout.read().decode().strip()
+            error = stderr.read().decode().strip()
+            return output, error, stdout.channel.recv_exit_status()
+
+    @staticmethod
+    def _batch_script(commands: List[str], marker: str, stop_on_error: bool) -> str:
+        lines = ["__fk_now() { date +%s%N 2>/dev/null; }"]
+        for i, command in enumerate(commands):
+            lines += [
+                f"printf '\\n{marker} begin {i}\\n'; printf '\\n{marker} begin {i}\\n' >&2",
+                "__fk_start=$(__fk_now)",
+                # Subshell: a 'cd' or 'exit' in one command doesn't leak into the next. stdin is
+                # the script itself, so commands must not read from it.
+                f"( {command}\n) </dev/null",
+                "__fk_rc=$?",
+                f"printf '\\n{marker} end {i} %s %s %s\\n' \"$__fk_rc\" \"$__fk_start\" \"$(__fk_now)\"; "
+                f"printf '\\n{marker} end {i}\\n' >&2",
+            ]
+            if stop_on_error:
+                lines.append('[ "$__fk_rc" -eq 0 ] || exit "$__fk_rc"')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _parse_ns(value: str) -> Optional[float]:
+        # date(1) without %N support (BSD/macOS) prints a literal 'N': fall back to whole seconds.
+        try:
+            return int(value[:-1]) * 1e9 if value.endswith("N") else int(value)
+        except ValueError:
+            return None
+
+    def run_batch(self, commands: List[str], stop_on_error: bool = True, suppress_output: bool = True) -> BatchResult:
+        """
+        Run several commands as one shell script on a single channel (one round trip instead of
+        one per command) and return a BatchResult with each command's exit code, output and
+        duration. With ``stop_on_error`` the script stops at the first failing command; the
+        remaining ones are reported with ``exit_code=None``.
+        """
+        results = BatchResult(CommandResult(command) for command in commands)
+        results.host = self.config.hostname
+        if not commands:
+            return results
+
+        if self.host_facts().get('os') == 'windows':
+            # No POSIX shell to run the script: fall back to one channel per command.
+            for result in results:
+                start = time.perf_counter()
+                result.stdout, result.stderr, result.exit_code = self._execute_status(result.command)
+                result.duration = time.perf_counter() - start
+                if stop_on_error and result.exit_code != 0:
+                    break
+        else:
+            marker = f"__FLOWKESTRA_{uuid.uuid4().hex}"
+            script = self._batch_script(commands, marker, stop_on_error)
+            self._log(f"[SSH] Executing batch of {len(commands)} command(s): {commands}")
+            out, err, _ = self.pipe("sh -s", lambda stdin: stdin.write(script.encode()))
+
+            begin = re.compile(rf"{marker} begin (\d+)\n(.*?)\n{marker} end \1( (\S+) (\S*) (\S*))?", re.S)
+            for match in begin.finditer(out):
+                result = results[int(match.group(1))]
+                result.stdout = match.group(2).strip()
+                result.exit_code = int(match.group(4))
+                start, end = self._parse_ns(match.group(5)), self._parse_ns(match.group(6))
+                if start is not None and end is not None:
+                    result.duration = (end - start) / 1e9
+            for match in begin.finditer(err):
+                results[int(match.group(1))].stderr = match.group(2).strip()
+
+        for result in results:
+            if not suppress_output and result.stdout:
+                print(result.stdout)
+            if result.exit_code:
+                self._log(f"[SSH] Error (exit {result.exit_code}) in '{result.command}': {result.stderr}")
+        return results
+
+    # ---------- host facts ----------
+    def host_facts(self, refresh: bool = False) -> Dict[str, str]:
+        """
+        Return cached facts about the host: ``os`` ('windows' or the uname kernel name),
+        ``python`` (path of python3), ``tar`` ('yes' if available) and ``free_disk_kb``
+        (free space in the home directory).
+        Collected with a single round trip and reused by every worker on the host.
+        """
+        with self._facts_lock:
+            if self.facts and not refresh:
+                return self.facts
+
+            out, _ = self.execute(
+                "echo \"os=$(uname -s)\"; echo \"python=$(command -v python3)\"; "
+                "echo \"tar=$(command -v tar >/dev/null 2>&1 && echo yes)\"; "
+                "echo \"free_disk_kb=$(df -Pk ~ | tail -1 | awk '{print $4}')\"",
+                suppress_output=True
+            )
+            facts = dict(line.split("=", 1) for line in out.splitlines() if "=" in line)
+            if not facts.get('os'):
+                # Not a POSIX shell; 'ver' is specific to Windows.
+                out, _ = self.execute("ver", suppress_output=True)
+                facts = {'os': 'windows' if 'windows' in out.lower() else 'unknown'}
+            self.facts = facts
+            return self.facts
+
     # ---------- file operations ----------
     def _ensure_sftp(self):
-        if not self.client:
-            raise RuntimeError("SSH client not connected.")
-        if not self.sftp:
-            self.sftp = self.client.open_sftp()
+        with self._lock:
+            self._ensure_connected()
+            if not self.sftp or self.sftp.get_channel().closed:
+                self.sftp = self.client.open_sftp()
 
-    def upload(self, local_path: str, remote_path: str):
-        """Upload file to remote server."""
-        self._ensure_sftp()
-        self._log(f"[SFTP] Uploading {local_path} → {remote_path}")
-        self.sftp.put(local_path, remote_path)
+    def upload(self, local_path: str, remote_path: str, preserve_times: bool = False):
+        """Upload file to remote server, optionally keeping the local access/modification times."""
+        with self._channel_slots:
+            self._ensure_sftp()
+            self._log(f"[SFTP] Uploading {local_path} → {remote_path}")
+            self.sftp.put(local_path, remote_path)
+            if preserve_times:
+                st = os.stat(local_path)
+                self.sftp.utime(remote_path, (st.st_atime, st.st_mtime))
 
     def download(self, remote_path: str, local_path: str):
         """Download file from remote server."""
-        self._ensure_sftp()
-        self._log(f"[SFTP] Downloading {remote_path} → {local_path}")
-        self.sftp.get(remote_path, local_path)
+        with self._channel_slots:
+            self._ensure_sftp()
+            self._log(f"[SFTP] Downloading {remote_path} → {local_path}")
+            self.sftp.get(remote_path, local_path)
 
     # ---------- cleanup ----------
     def close(self):
@@ -78,6 +377,58 @@ class SSHClient:
         self._log("[SSH] Closing connection...")
         if self.sftp:
             self.sftp.close()
+            self.sftp = None
         if self.client:
             self.client.close()
+            self.client = None
         self._log("[SSH] Connection closed.")
+
+
+class SSHConnectionPool:
+    """
+    Process-wide pool of SSH connections keyed by (hostname, port, username).
+
+    Every worker targeting the same host gets the same SSHClient, so N instances on
+    one host share one TCP connection, one authentication and one SFTP session.
+    """
+
+    def __init__(self, max_channels_per_host: int = 8, keepalive_interval: int = 30, control_channels: int = 2):
+        self.max_channels_per_host = max_channels_per_host
+        self.keepalive_interval = keepalive_interval
+        self.control_channels = control_channels
+        self._clients: Dict[Tuple[str, int, str], SSHClient] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(config: SSHConfig) -> Tuple[str, int, str]:
+        return (config.hostname, config.port, config.username)
+
+    def get(self, config: Union[SSHConfig, dict], connect: bool = True) -> SSHClient:
+        """
+        Return the shared client for this host. With ``connect=False`` the connection is left
+        to the client's first command (every channel reconnects on demand).
+        """
+        config = SSHConfig(**config) if isinstance(config, dict) else config
+        key = self._key(config)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = SSHClient(
+                    config,
+                    max_channels=self.max_channels_per_host,
+                    keepalive_interval=self.keepalive_interval,
+                    control_channels=self.control_channels
+                )
+                self._clients[key] = client
+        if connect:
+            client._ensure_connected()
+        return client
+
+    def close_all(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+ssh_pool = SSHConnectionPool()
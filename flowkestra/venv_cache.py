@@ -0,0 +1,404 @@
+import os
+import sys
+import time
+import uuid
+import shutil
+import socket
+import hashlib
+import platform
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from flowkestra.utils import SSHClient, quote_path
+
+COMPLETE_MARKER = ".flowkestra-complete"
+LAST_USED_MARKER = ".flowkestra-last-used"
+# Size of the entry in bytes, recorded once when it is built so eviction never walks the venvs.
+SIZE_MARKER = ".flowkestra-size"
+# One file per user of an entry, kept fresh by its holder; eviction skips entries with a fresh lease.
+LEASES_DIR = ".flowkestra-leases"
+# Serializes eviction against leasing, so an entry can't go between being found and being leased.
+EVICT_LOCK = ".evict.lock"
+
+
+def touch(path: Path, ssh_client: SSHClient = None):
+    """Refresh the mtime of an existing file or directory (local or remote)."""
+    if ssh_client:
+        ssh_client.execute(f"touch -c {path}", suppress_output=True)
+    else:
+        os.utime(path)
+
+
+def tree_size(path) -> int:
+    """Total size in bytes of the files under path (symlinks not followed)."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class _Heartbeat:
+    """
+    Touches a path every ``interval`` seconds from a daemon thread until stopped (or the path is
+    gone), so that a lock or lease held for longer than lock_timeout isn't taken for abandoned.
+    """
+
+    def __init__(self, path: Path, ssh_client: SSHClient = None, interval: float = 450):
+        self.path = path
+        self.ssh_client = ssh_client
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat {path.name}", daemon=True)
+        self._thread.start()
+
+    def _beat(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                touch(self.path, self.ssh_client)
+            except FileNotFoundError:
+                # Released, e.g. by a forked worker process holding a copy of it.
+                return
+            except Exception:
+                # A missed beat only matters if the next ones fail too, for lock_timeout seconds.
+                pass
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def heartbeat_interval(lock_timeout) -> float:
+    """Touch a held lock often enough that it never looks lock_timeout seconds old."""
+    return max(1.0, lock_timeout / 4)
+
+
+def try_lock(lock_path: Path, ssh_client: SSHClient = None, lock_timeout=1800) -> bool:
+    """
+    Try to take an atomic ``mkdir`` lock (local or remote). A lock whose mtime is older than
+    lock_timeout seconds is considered abandoned by a dead worker and taken over; holders keep
+    theirs fresh with a heartbeat (see hold_lock).
+    """
+    if ssh_client:
+        out, _ = ssh_client.execute(
+            f"mkdir -p {lock_path.parent} && "
+            f"find {lock_path} -maxdepth 0 -mmin +{max(1, lock_timeout // 60)} -exec rmdir {{}} \\; 2>/dev/null; "
+            f"mkdir {lock_path} 2>/dev/null && echo acquired",
+            suppress_output=True
+        )
+        return "acquired" in out
+
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if time.time() - lock_path.stat().st_mtime > lock_timeout:
+            # A worker died while holding the lock; take it over.
+            lock_path.rmdir()
+    except FileNotFoundError:
+        pass
+    try:
+        lock_path.mkdir()
+        return True
+    except FileExistsError:
+        return False
+
+
+def unlock(lock_path: Path, ssh_client: SSHClient = None):
+    if ssh_client:
+        ssh_client.execute(f"rmdir {lock_path} 2>/dev/null || true", suppress_output=True)
+    else:
+        try:
+            lock_path.rmdir()
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def hold_lock(lock_path: Path, ssh_client: SSHClient = None, lock_timeout=1800, poll_interval=2):
+    """
+    Wait for and hold a ``mkdir`` lock for the duration of the block, however long it takes.
+    Waiting lasts as long as the holder keeps its lock fresh; a dead holder's lock is taken
+    over lock_timeout seconds after its last heartbeat.
+    """
+    while not try_lock(lock_path, ssh_client, lock_timeout):
+        time.sleep(poll_interval)
+    heartbeat = _Heartbeat(lock_path, ssh_client, heartbeat_interval(lock_timeout))
+    try:
+        yield
+    finally:
+        heartbeat.stop()
+        unlock(lock_path, ssh_client)
+
+
+class VenvCache:
+    """
+    Host-level cache of virtual environments keyed by the content of the
+    requirements file, the interpreter version and the platform.
+
+    Entries live outside any instance workdir, so cleaning a workdir never
+    touches them. A build is guarded by an atomic ``mkdir`` lock so that
+    concurrent workers on the same host wait for one build instead of racing.
+    Workers lease the entries they use (see lease) and eviction leaves leased
+    entries alone.
+    """
+
+    def __init__(self, cache_dir, ssh_client: SSHClient = None, max_entries=8, max_size_gb=None,
+                 lock_timeout=1800, suppress_output=True):
+        """
+        Args:
+            cache_dir (str): cache root (local or remote, ``~`` is expanded)
+            ssh_client (SSHClient, optional): if provided, the cache lives on the remote host
+            max_entries (int): maximum number of cached environments kept after a build
+            max_size_gb (float, optional): maximum total size of the cache
+            lock_timeout (int): seconds after which a build lock or lease that stopped being
+                refreshed is considered stale
+            suppress_output (bool): If True, suppress stdout/stderr from cache commands.
+        """
+        self.ssh_client = ssh_client
+        self.cache_dir = Path(cache_dir) if ssh_client else Path(cache_dir).expanduser()
+        self.max_entries = max_entries
+        self.max_size_gb = max_size_gb
+        self.lock_timeout = lock_timeout
+        self.suppress_output = suppress_output
+        self._poll_interval = 2
+        self._leases: Dict[Path, tuple] = {}
+
+    # ---------- keys ----------
+    def _interpreter_tag(self) -> str:
+        if self.ssh_client:
+            out, _ = self.ssh_client.execute(
+                "python3 -c \"import sys, platform; print(sys.version.split()[0], sys.platform, platform.machine())\"",
+                suppress_output=True
+            )
+            return out.strip()
+        return f"{platform.python_version()} {sys.platform} {platform.machine()}"
+
+    def _read_requirements(self, requirements) -> bytes:
+        if self.ssh_client:
+            out, _ = self.ssh_client.execute(f"cat {requirements}", suppress_output=True)
+            return out.encode()
+        return Path(requirements).read_bytes()
+
+    def key_for(self, requirements) -> str:
+        """Return the cache key for a requirements file on this host."""
+        digest = hashlib.sha256()
+        digest.update(self._read_requirements(requirements))
+        digest.update(b"\0")
+        digest.update(self._interpreter_tag().encode())
+        return digest.hexdigest()[:16]
+
+    # ---------- locking ----------
+    def _try_lock(self, lock_path: Path) -> bool:
+        return try_lock(lock_path, self.ssh_client, self.lock_timeout)
+
+    def _unlock(self, lock_path: Path):
+        unlock(lock_path, self.ssh_client)
+
+    # ---------- entries ----------
+    def _is_complete(self, venv_path: Path) -> bool:
+        if self.ssh_client:
+            out, _ = self.ssh_client.execute(
+                f"test -f {venv_path / COMPLETE_MARKER} && echo yes", suppress_output=True
+            )
+            return "yes" in out
+        return (venv_path / COMPLETE_MARKER).exists()
+
+    def _touch(self, venv_path: Path, marker: str):
+        if self.ssh_client:
+            self.ssh_client.execute(f"touch {venv_path / marker}", suppress_output=True)
+        else:
+            (venv_path / marker).touch()
+
+    def _record_size(self, venv_path: Path):
+        if self.ssh_client:
+            venv = quote_path(venv_path)
+            self.ssh_client.execute(
+                f"echo $(( $(du -sk {venv} | cut -f1) * 1024 )) > {venv}/{SIZE_MARKER}", suppress_output=True
+            )
+        else:
+            (venv_path / SIZE_MARKER).write_text(str(tree_size(venv_path)))
+
+    def _entry_size(self, venv_path: Path) -> int:
+        """An entry's recorded size; entries built before sizes were recorded are measured once."""
+        try:
+            return int((venv_path / SIZE_MARKER).read_text())
+        except (OSError, ValueError):
+            size = tree_size(venv_path)
+            try:
+                (venv_path / SIZE_MARKER).write_text(str(size))
+            except OSError:
+                pass
+            return size
+
+    def _remove(self, venv_path: Path):
+        if self.ssh_client:
+            self.ssh_client.execute(f"rm -rf {venv_path}", suppress_output=True)
+        else:
+            shutil.rmtree(venv_path, ignore_errors=True)
+
+    def ensure(self, requirements, build: Callable[[Path], None], key: Optional[str] = None,
+               lease: bool = False) -> Path:
+        """
+        Return the path of a ready environment for ``requirements``, building it once if needed.
+
+        Args:
+            requirements (str or Path): requirements file (local or remote)
+            build (callable): ``build(venv_path)`` creates the venv and installs requirements
+            key (str, optional): use this entry key instead of deriving it from ``requirements``
+            lease (bool): keep the entry from being evicted until ``release()``
+        """
+        key = key or self.key_for(requirements)
+        venv_path = self.cache_dir / key
+        lock_path = self.cache_dir / f"{key}.lock"
+
+        while True:
+            while not self._is_complete(venv_path):
+                if self._try_lock(lock_path):
+                    heartbeat = _Heartbeat(lock_path, self.ssh_client, heartbeat_interval(self.lock_timeout))
+                    try:
+                        # Another worker may have finished between our check and the lock.
+                        if not self._is_complete(venv_path):
+                            self._remove(venv_path)
+                            build(venv_path)
+                            self._record_size(venv_path)
+                            self._touch(venv_path, COMPLETE_MARKER)
+                    finally:
+                        heartbeat.stop()
+                        self._unlock(lock_path)
+                    break
+                # The builder keeps its lock fresh: wait for it, or take over once it died.
+                time.sleep(self._poll_interval)
+
+            with hold_lock(self.cache_dir / EVICT_LOCK, self.ssh_client, self.lock_timeout, poll_interval=0.5):
+                # Another worker's eviction may have removed the entry since we found it complete.
+                if not self._is_complete(venv_path):
+                    continue
+                if lease:
+                    self.lease(venv_path)
+                self._touch(venv_path, LAST_USED_MARKER)
+                self.evict(keep={key})
+            return venv_path
+
+    # ---------- leases ----------
+    def lease(self, venv_path: Path):
+        """
+        Mark venv_path as in use until ``release()``: eviction skips it while the lease is fresh.
+        The lease file is refreshed by a heartbeat, so a dead worker's lease expires after lock_timeout.
+        """
+        venv_path = Path(venv_path)
+        if venv_path in self._leases:
+            return
+        lease_path = venv_path / LEASES_DIR / f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if self.ssh_client:
+            self.ssh_client.execute(f"mkdir -p {lease_path.parent} && touch {lease_path}", suppress_output=True)
+        else:
+            lease_path.parent.mkdir(exist_ok=True)
+            lease_path.touch()
+        heartbeat = _Heartbeat(lease_path, self.ssh_client, heartbeat_interval(self.lock_timeout))
+        self._leases[venv_path] = (lease_path, heartbeat)
+
+    def release(self, venv_path: Optional[Path] = None):
+        """Give up the lease on venv_path (default: every lease taken through this cache)."""
+        paths = [Path(venv_path)] if venv_path is not None else list(self._leases)
+        for path in paths:
+            lease_path, heartbeat = self._leases.pop(path, (None, None))
+            if lease_path is None:
+                continue
+            heartbeat.stop()
+            if self.ssh_client:
+                self.ssh_client.execute(f"rm -f {lease_path}", suppress_output=True)
+            else:
+                lease_path.unlink(missing_ok=True)
+
+    def _is_leased(self, venv_path: Path) -> bool:
+        leases_dir = venv_path / LEASES_DIR
+        if not leases_dir.exists():
+            return False
+        fresh_after = time.time() - self.lock_timeout
+        for lease_path in leases_dir.iterdir():
+            try:
+                if lease_path.stat().st_mtime > fresh_after:
+                    return True
+            except FileNotFoundError:
+                # Released while we looked.
+                pass
+        return False
+
+    # ---------- eviction ----------
+    def _list_entries(self):
+        """
+        Return a list of (last_used, size_bytes, path, leased) for complete entries. Sizes come
+        from each entry's SIZE_MARKER: listing the cache reads a few small files per entry.
+        """
+        entries = []
+        if self.ssh_client:
+            out, _ = self.ssh_client.execute(
+                f"for d in {self.cache_dir}/*/; do "
+                f"[ -f \"$d{COMPLETE_MARKER}\" ] || continue; "
+                f"leased=0; [ -n \"$(find \"$d{LEASES_DIR}\" -type f -mmin -{max(1, self.lock_timeout // 60)} 2>/dev/null | head -1)\" ] "
+                f"&& leased=1; "
+                f"size=$(cat \"$d{SIZE_MARKER}\" 2>/dev/null) || "
+                f"{{ size=$(( $(du -sk \"$d\" | cut -f1) * 1024 )); echo $size > \"$d{SIZE_MARKER}\"; }}; "
+                f"echo \"$(stat -c %Y \"$d{LAST_USED_MARKER}\" 2>/dev/null || echo 0) $size $leased $d\"; "
+                f"done",
+                suppress_output=True
+            )
+            for line in out.splitlines():
+                parts = line.split(" ", 3)
+                if len(parts) == 4 and parts[1].isdigit():
+                    entries.append((float(parts[0]), int(parts[1]), Path(parts[3].rstrip("/")), parts[2] == "1"))
+            return entries
+
+        if not self.cache_dir.exists():
+            return entries
+        for venv_path in self.cache_dir.iterdir():
+            if not (venv_path / COMPLETE_MARKER).exists():
+                continue
+            last_used_file = venv_path / LAST_USED_MARKER
+            last_used = last_used_file.stat().st_mtime if last_used_file.exists() else 0
+            entries.append((last_used, self._entry_size(venv_path), venv_path, self._is_leased(venv_path)))
+        return entries
+
+    def evict(self, keep=()):
+        """
+        Remove least recently used entries until the cache fits its limits. Entries in ``keep``
+        or with a fresh lease count towards the limits but stay; call it under the EVICT_LOCK
+        (as ensure does).
+        """
+        if self.max_entries is None and not self.max_size_gb:
+            return
+        entries = sorted(self._list_entries(), key=lambda e: e[0])
+        max_bytes = self.max_size_gb * 1024 ** 3 if self.max_size_gb else None
+        total = sum(entry[1] for entry in entries)
+        count = len(entries)
+
+        for _, size, venv_path, leased in entries:
+            over_count = self.max_entries is not None and count > self.max_entries
+            over_size = max_bytes is not None and total > max_bytes
+            if not (over_count or over_size):
+                break
+            if venv_path.name in keep or leased:
+                continue
+            if not self.suppress_output:
+                print(f"Evicting cache entry {venv_path}")
+            self._remove(venv_path)
+            count -= 1
+            total -= size
+
+
+def build_venv_cache(cache_config: Optional[dict], ssh_client: SSHClient = None, suppress_output=True) -> Optional[VenvCache]:
+    """Create a VenvCache from the ``venv_cache`` config section, or None when disabled."""
+    if not cache_config or not cache_config.get('enabled'):
+        return None
+    return VenvCache(
+        cache_dir=cache_config['cache_dir'],
+        ssh_client=ssh_client,
+        max_entries=cache_config.get('max_entries'),
+        max_size_gb=cache_config.get('max_size_gb'),
+        lock_timeout=cache_config.get('lock_timeout', 1800),
+        suppress_output=suppress_output
+    )
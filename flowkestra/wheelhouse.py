@@ -0,0 +1,229 @@
+import sys
+import shlex
+import tarfile
+import hashlib
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+from flowkestra.utils import SSHClient, quote_path
+from flowkestra.venv_cache import VenvCache, hold_lock
+from flowkestra.sync import IncrementalSync, upload_tree
+
+# Prints the interpreter, platform, machine and libc wheels are built for. The libc (glibc and its
+# version, or musl) tells manylinux from musllinux hosts, whose wheels don't install on each other.
+TARGET_TAG_PY = (
+    "import sys, glob, platform\n"
+    "libc, version = platform.libc_ver()\n"
+    "libc = f'{libc}-{version}' if libc else 'musl' if glob.glob('/lib/ld-musl-*') else 'unknown'\n"
+    "print(sys.version.split()[0], sys.platform, platform.machine(), libc)\n"
+)
+FIND_LINKS_DIR = "find-links"
+
+
+class Wheelhouse:
+    """
+    Build-once, install-everywhere wheel sets.
+
+    Wheels for a requirements file are resolved and built once per (requirements content,
+    target interpreter/platform) and kept in a local on-disk cache. When the target matches
+    the supervisor's interpreter they are built here; otherwise the first host that needs them
+    builds them and they are pulled back; local find_links directories are synced to it first.
+    Each host then receives a copy through the sync path and installs with
+    ``pip install --no-index --find-links``, so nothing is downloaded twice.
+    Both the local cache and the per-host copies use VenvCache's locking and LRU eviction.
+    """
+
+    def __init__(self, cache_dir, max_entries=16, max_size_gb=None, lock_timeout=1800,
+                 index_url=None, find_links=None, no_index=False, transfer="auto", compression="auto",
+                 suppress_output=True):
+        """
+        Args:
+            cache_dir (str): wheelhouse root, locally and on each host (``~`` is expanded)
+            max_entries (int): maximum number of wheel sets kept per cache
+            max_size_gb (float, optional): maximum total size per cache
+            lock_timeout (int): seconds after a builder's last heartbeat before its lock is taken over
+            index_url (str, optional): package index used to resolve requirements
+            find_links (list of str, optional): extra local directories/URLs searched for packages;
+                directories are synced to hosts that build wheels
+            no_index (bool): resolve only from find_links (fully offline builds)
+            transfer (str): how wheels are pushed to hosts ('auto', 'tar' or 'sftp')
+            compression (str): compression of the tar stream ('auto', 'none', 'gzip', 'xz')
+            suppress_output (bool): If True, suppress output from pip and transfers.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_size_gb = max_size_gb
+        self.lock_timeout = lock_timeout
+        self.index_url = index_url
+        self.find_links = find_links or []
+        self.no_index = no_index
+        self.transfer = transfer
+        self.compression = compression
+        self.suppress_output = suppress_output
+
+    def _store(self, ssh_client: SSHClient = None) -> VenvCache:
+        return VenvCache(
+            self.cache_dir,
+            ssh_client=ssh_client,
+            max_entries=self.max_entries,
+            max_size_gb=self.max_size_gb,
+            lock_timeout=self.lock_timeout,
+            suppress_output=self.suppress_output
+        )
+
+    def _index_args(self, find_links: List[str]) -> List[str]:
+        args = []
+        if self.index_url:
+            args += ["--index-url", self.index_url]
+        if self.no_index:
+            args.append("--no-index")
+        for link in find_links:
+            args += ["--find-links", link]
+        return args
+
+    def _find_links(self, ssh_client: SSHClient = None) -> List[str]:
+        """
+        find_links as seen by the builder. find_links usually name supervisor-side directories:
+        for a build on a host they are synced (incrementally) into the host's wheelhouse first.
+        """
+        links = []
+        for link in self.find_links:
+            if "://" in link:
+                links.append(link)
+                continue
+            path = Path(link).expanduser()
+            if not ssh_client:
+                links.append(str(path))
+                continue
+            if not path.is_dir():
+                raise ValueError(
+                    f"wheelhouse.find_links entry {link} is not a local directory or URL; "
+                    f"it can't be used for builds on {ssh_client.config.hostname}"
+                )
+            remote_dir = Path(self.cache_dir) / FIND_LINKS_DIR / hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:16]
+            with hold_lock(remote_dir.with_suffix(".lock"), ssh_client, self.lock_timeout, poll_interval=0.5):
+                IncrementalSync(
+                    path, remote_dir, ssh_client=ssh_client, transfer=self.transfer,
+                    compression=self.compression, suppress_output=self.suppress_output
+                ).run()
+            links.append(str(remote_dir))
+        return links
+
+    def target_tag(self, ssh_client: SSHClient = None) -> str:
+        """Interpreter version, platform, machine and libc of the target (local or remote)."""
+        if ssh_client:
+            out, _ = ssh_client.execute(f"python3 -c {shlex.quote(TARGET_TAG_PY)}", suppress_output=True)
+            return out.strip()
+        return subprocess.run([sys.executable, "-c", TARGET_TAG_PY], capture_output=True, text=True, check=True).stdout.strip()
+
+    @staticmethod
+    def key_for(requirements_text: str, target_tag: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(requirements_text.strip().encode())
+        digest.update(b"\0")
+        digest.update(target_tag.encode())
+        return digest.hexdigest()[:16]
+
+    # ---------- builds ----------
+    def _build_here(self, requirements: Path, wheel_dir: Path):
+        """Resolve and build every wheel with the supervisor's own interpreter."""
+        output = subprocess.DEVNULL if self.suppress_output else None
+        wheel_dir.mkdir(parents=True, exist_ok=True)
+        subprocess.run(
+            [sys.executable, "-m", "pip", "wheel", "--quiet", "-r", str(requirements), "-w", str(wheel_dir)]
+            + self._index_args(self._find_links()),
+            check=True,
+            stdout=output,
+            stderr=output
+        )
+
+    def _build_on_host(self, ssh_client: SSHClient, pip, remote_requirements, remote_dir: Path):
+        """Build the wheels on the host with the instance's freshly created venv."""
+        args = " ".join(quote_path(a) for a in self._index_args(self._find_links(ssh_client)))
+        out, err = ssh_client.execute(
+            f"mkdir -p {remote_dir} && {pip} wheel --quiet -r {remote_requirements} -w {remote_dir} {args} "
+            f"&& echo flowkestra-wheels-built",
+            suppress_output=self.suppress_output
+        )
+        if "flowkestra-wheels-built" not in out:
+            raise RuntimeError(f"Building wheels on {ssh_client.config.hostname} failed: {err}")
+
+    @staticmethod
+    def _pull(ssh_client: SSHClient, remote_dir: Path, wheel_dir: Path):
+        """Copy a host-built wheel set back into the local cache."""
+        wheel_dir.mkdir(parents=True, exist_ok=True)
+
+        def extract(stdout):
+            with tarfile.open(fileobj=stdout, mode="r|") as archive:
+                archive.extractall(wheel_dir)
+
+        err, exit_status = ssh_client.read_stream(f"cd {remote_dir} && tar -cf - --exclude='.flowkestra-*' .", extract)
+        if exit_status != 0:
+            raise RuntimeError(f"Fetching wheels from {remote_dir} failed: {err}")
+
+    def _push(self, ssh_client: SSHClient, wheel_dir: Path, remote_dir: Path):
+        ssh_client.execute(f"mkdir -p {remote_dir}", suppress_output=True)
+        upload_tree(
+            ssh_client,
+            wheel_dir,
+            remote_dir,
+            rel_paths=[p.name for p in wheel_dir.iterdir() if p.suffix == ".whl"],
+            transfer=self.transfer,
+            compression=self.compression,
+            suppress_output=self.suppress_output
+        )
+
+    # ---------- entry point ----------
+    def prepare(self, requirements, ssh_client: SSHClient = None, pip=None, remote_requirements=None) -> Path:
+        """
+        Return a directory of wheels for ``requirements`` that pip on the target can install from.
+
+        Args:
+            requirements (str or Path): local copy of the requirements file
+            ssh_client (SSHClient, optional): target host; wheels are built or copied there
+            pip (str or Path, optional): pip of the target venv, used when the host has to build
+            remote_requirements (str or Path, optional): the requirements file's path on the host
+        """
+        requirements = Path(requirements)
+        local_store = self._store()
+        remote_store = self._store(ssh_client) if ssh_client else None
+        local_tag = self.target_tag()
+        target_tag = self.target_tag(ssh_client) if ssh_client else local_tag
+        key = self.key_for(requirements.read_text(), target_tag)
+
+        if target_tag == local_tag:
+            build = lambda wheel_dir: self._build_here(requirements, wheel_dir)
+        else:
+            # The supervisor can't build for this interpreter: let the first host do it.
+            def build(wheel_dir):
+                remote_store.ensure(
+                    None,
+                    lambda remote_dir: self._build_on_host(ssh_client, pip, remote_requirements, remote_dir),
+                    key=key
+                )
+                self._pull(ssh_client, remote_store.cache_dir / key, wheel_dir)
+
+        wheel_dir = local_store.ensure(None, build, key=key)
+        if not remote_store:
+            return wheel_dir
+        return remote_store.ensure(None, lambda remote_dir: self._push(ssh_client, wheel_dir, remote_dir), key=key)
+
+
+def build_wheelhouse(config: Optional[dict], sync_config: Optional[dict] = None, suppress_output=True) -> Optional[Wheelhouse]:
+    """Create a Wheelhouse from the ``wheelhouse`` config section, or None when disabled."""
+    if not config or not config.get('enabled'):
+        return None
+    sync_config = sync_config or {}
+    return Wheelhouse(
+        cache_dir=config['cache_dir'],
+        max_entries=config.get('max_entries'),
+        max_size_gb=config.get('max_size_gb'),
+        lock_timeout=config.get('lock_timeout', 1800),
+        index_url=config.get('index_url'),
+        find_links=config.get('find_links'),
+        no_index=config.get('no_index', False),
+        transfer=sync_config.get('transfer', 'auto'),
+        compression=sync_config.get('compression', 'auto'),
+        suppress_output=suppress_output
+    )
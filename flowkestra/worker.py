@@ -1,108 +1,497 @@
 import os
+import time
+import asyncio
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from flowkestra.runner import Runner
 from pathlib import Path
 import shutil
-from flowkestra.utils import SSHClient
+from flowkestra.utils import ssh_pool
 from flowkestra.schema import SSHConfig
+from flowkestra.venv_cache import build_venv_cache
+from flowkestra.wheelhouse import build_wheelhouse
+from flowkestra.sync import IncrementalSync, upload_tree
+from flowkestra.data_store import build_data_store
+from flowkestra.dag import resolve_dependencies, downstream_of
+from flowkestra.step_cache import build_step_cache, CachedResult
+from flowkestra.logs import build_log_store
+from flowkestra.events import StatusReporter
+from flowkestra.metrics import PhaseTimer
+from flowkestra.affinity import thread_env
+from flowkestra.sampling import ResourceRecorder
+from flowkestra.early_stopping import EarlyStopped, STOP_GRACE_SECONDS
+from flowkestra.teardown import build_workdir_cleaner
 from typing import Optional
 
 class Worker:
-    def __init__(self, worker_id, workdir, origin_dir, main_states, requirements, pipelines, experiment_name=None ,mlflow_uri=None, ssh_config: Optional[SSHConfig] = None, suppress_output=True, clean_workdir_after_run=True):
+    def __init__(self, worker_id, workdir, origin_dir, reporter: StatusReporter, requirements, pipelines, experiment_name=None ,mlflow_uri=None, ssh_config: Optional[SSHConfig] = None, suppress_output=True, clean_workdir_after_run=True, venv_cache=None, sync=None, max_parallel_steps=1, shared_from: Optional["Worker"] = None, step_cache=None, logs=None, instance_name=None, wheelhouse=None, teardown=None, keep=None, data_store=None, sampling=None, early_stopping=None, fork_server=None, detached=None, resume=None):
+        """
+        Args:
+            shared_from (Worker, optional): an already set up worker whose synced code tree and
+                environment this one reuses; ``workdir`` is then only a scratch directory.
+            resume (dict, optional): what an interrupted run left behind, from the run journal:
+                ``{'venv_path', 'steps'}``. If the workdir and venv are still there, setup adopts
+                them instead of cleaning and syncing, and the listed finished steps are not re-run.
+        """
 
         self.worker_id = worker_id
         self.origin_dir = Path(origin_dir)
         self.workdir = Path(workdir)
+        self.code_dir = shared_from.workdir if shared_from else self.workdir
         self.requirements = self.workdir / requirements
+        self.requirements_name = requirements
         self.pipelines = pipelines
+        self.max_parallel_steps = max_parallel_steps
+        self.step_status = {name: 'pending' for name in pipelines}
         self.mlflow_uri = mlflow_uri if mlflow_uri else "http://localhost:5000"
         self.experiment_name = experiment_name if experiment_name else "default_experiment"
-        self.main_states = main_states
+        self.reporter = reporter
+        self.timer = PhaseTimer(reporter)
         self.clean_workdir_after_run = clean_workdir_after_run
+        self.cleaner = build_workdir_cleaner(teardown, keep)
+        self.sync_config = sync or {}
+        self.sync_stats = {}
+        self.step_cache = build_step_cache(step_cache, suppress_output)
+        self.logs = build_log_store(logs, instance_name or worker_id)
+        self._last_log_update = 0.0
+        self._log_update_interval = 1.0
+        # Resource totals of the last run of each step, reported with its timing
+        self.step_resources = {}
+        sampling = sampling or {}
+        early_stopping = early_stopping or {}
+        # Set by the supervisor (from any process) to stop this instance early.
+        self.stop_event = multiprocessing.Event() if early_stopping.get('enabled') else None
+        self.shared_from = shared_from
+        self.resume = resume
+        # True once setup adopted the workdir and environment of an interrupted run
+        self.resumed = False
         if ssh_config:
-            self.ssh_client = SSHClient(ssh_config)
+            # Shared per (hostname, port, username) across all workers of this process;
+            # the connection itself is opened on first use, during setup().
+            self.ssh_client = ssh_pool.get(ssh_config, connect=False)
         else:
             self.ssh_client = None
+        self.data_store = build_data_store(data_store, self.ssh_client, self.sync_config, suppress_output)
 
         # Initialize Runner (local or remote)
         self.runner = Runner(
             workdir=self.workdir, 
             ssh_client=self.ssh_client,
-            suppress_output=suppress_output
+            suppress_output=suppress_output,
+            venv_cache=build_venv_cache(venv_cache, self.ssh_client, suppress_output),
+            timer=self.timer,
+            wheelhouse=build_wheelhouse(wheelhouse, self.sync_config, suppress_output),
+            sample_interval=sampling.get('interval', 5.0) if sampling.get('enabled', True) else None,
+            metric_interval=early_stopping.get('poll_interval', 2.0) if self.stop_event else None,
+            stop_grace=early_stopping.get('grace_seconds', STOP_GRACE_SECONDS),
+            fork_server=fork_server,
+            detached=detached
         )
 
-        self.main_states[self.worker_id]['status'] = 'synchronizing'
-        self._clean_workdir()
+    def setup(self):
+        """
+        Prepare the workdir and environment: clean, sync origin_dir and build (or reuse) the venv.
+        Kept out of the constructor so the supervisor can schedule it and overlap it with other
+        instances' runs. A worker created with ``shared_from`` only prepares its scratch dir.
+        """
+        if self.resume and self._resume_setup():
+            return
+        if self.shared_from:
+            self._prepare_scratch(self.shared_from)
+            return
+
+        self.reporter.status('synchronizing')
+        # Incremental sync diffs against what is already in the workdir, so keep it.
+        if self.sync_config.get('mode') != 'incremental':
+            with self.timer.phase('clean'):
+                self._clean_workdir()
 
         # Now sync origin_dir into the clean directory
-        self._sync_workdir()
-        self.main_states[self.worker_id]['status'] = 'environment setup'
+        with self.timer.phase('sync') as info:
+            self._sync_workdir()
+            info.update(files=self.sync_stats.get('files', 0), bytes=self.sync_stats.get('bytes', 0))
+        self.reporter.status('environment setup')
 
         # # Setup environment
-        self.runner.setup_environment(self.requirements)
-        self.main_states[self.worker_id]['status'] = 'ready'
+        with self.timer.phase('environment'):
+            self.runner.setup_environment(self.requirements, local_requirements=self.origin_dir / self.requirements_name)
+        self.reporter.status('ready')
         
+    def _resume_setup(self) -> bool:
+        """Adopt the workdir and venv of an interrupted run and skip its finished steps, if still there."""
+        venv_path = self.shared_from.runner.venv_path if self.shared_from else self.resume.get('venv_path')
+        if not venv_path:
+            return False
+        with self.timer.phase('resume') as info:
+            if self.shared_from:
+                self.runner.remote_is_windows = self.shared_from.runner.remote_is_windows
+            # The synced code must still be there too (not just an emptied workdir).
+            required = [self.code_dir / step['script'] for step in self.pipelines.values()]
+            if not self.shared_from:
+                required.append(self.requirements)
+            info['reused'] = self.runner.reuse_environment(venv_path, required)
+        if not info['reused']:
+            return False
+        self.resumed = True
+        for step_name in self.resume.get('steps', []):
+            if self.step_status.get(step_name) == 'pending':
+                self.step_status[step_name] = 'done'
+                self.reporter.step_end(step_name, 0, 'done')
+        self.reporter.status('ready')
+        return True
+
+    def _prepare_scratch(self, shared_from: "Worker"):
+        """Reuse shared_from's code and environment, only creating a fresh scratch workdir."""
+        self.runner.venv_path = shared_from.runner.venv_path
+        self.runner.remote_is_windows = shared_from.runner.remote_is_windows
+        self.cleaner.clean(self.workdir, self.runner.ssh_client, ensure_exists=True)
+        self.reporter.status('ready')
+
     def _sync_workdir(self):
-        """Copy origin_dir contents to workdir (local or remote)."""
-        if self.runner.ssh_client:
-            # Remote: use SFTP
-            self.runner.ssh_client.open_sftp()
-            for src_path in self.origin_dir.glob("**/*"):
-                if src_path.is_file():
-                    rel_path = src_path.relative_to(self.origin_dir)
-                    dest_path = self.workdir / rel_path
-                    # Ensure remote directories exist
-                    remote_dir = dest_path.parent
-                    self.runner.ssh_client.execute(f"mkdir -p {remote_dir}")
-                    self.runner.ssh_client.upload(str(src_path), str(dest_path))
+        """
+        Copy origin_dir contents to workdir (local or remote). With the data store enabled,
+        large files are linked from the host's store instead of being copied.
+        """
+        # Large files are transferred once per host and linked; everything else syncs as usual.
+        stored = self.data_store.select(self.origin_dir) if self.data_store else {}
+
+        if self.sync_config.get('mode') == 'incremental':
+            self.sync_stats = IncrementalSync(
+                self.origin_dir,
+                self.workdir,
+                ssh_client=self.runner.ssh_client,
+                link_mode=self.sync_config.get('link_mode', 'copy'),
+                transfer=self.sync_config.get('transfer', 'auto'),
+                compression=self.sync_config.get('compression', 'auto'),
+                suppress_output=self.runner.suppress_output,
+                exclude=stored
+            ).run()
+        elif self.runner.ssh_client:
+            # Remote: one tar stream when available, per-file SFTP otherwise
+            self.sync_stats = upload_tree(
+                self.runner.ssh_client,
+                self.origin_dir,
+                self.workdir,
+                rel_paths=[
+                    p.relative_to(self.origin_dir).as_posix() for p in self.origin_dir.glob("**/*")
+                    if p.is_file() and p.relative_to(self.origin_dir).as_posix() not in stored
+                ],
+                transfer=self.sync_config.get('transfer', 'auto'),
+                compression=self.sync_config.get('compression', 'auto'),
+                suppress_output=self.runner.suppress_output
+            )
         else:
             # Local copy
             self.workdir.mkdir(parents=True, exist_ok=True)
+            self.sync_stats = {'files': 0, 'bytes': 0}
             for src_path in self.origin_dir.glob("**/*"):
-                if src_path.is_file():
+                if src_path.is_file() and src_path.relative_to(self.origin_dir).as_posix() not in stored:
                     dest_path = self.workdir / src_path.relative_to(self.origin_dir)
                     dest_path.parent.mkdir(parents=True, exist_ok=True)
                     shutil.copy2(src_path, dest_path)
+                    self.sync_stats['files'] += 1
+                    self.sync_stats['bytes'] += src_path.stat().st_size
 
-    def run(self):
-        """Run all pipeline scripts in sequence with prepared environment."""
-        additional_env = {
+        if stored:
+            with self.timer.phase('sync/data_store') as info:
+                self.sync_stats['data_store'] = self.data_store.stage(self.origin_dir, self.workdir, stored)
+                info.update(self.sync_stats['data_store'])
+
+    def pin_cpus(self, cores):
+        """Pin this (local) instance's steps to cores and size their thread pools to match."""
+        self.runner.cpu_cores = list(cores) if cores else None
+
+    def _step_env(self):
+        env = {
             "MLFLOW_TRACKING_URI": self.mlflow_uri,
             "MLFLOW_EXPERIMENT_NAME": self.experiment_name
         }
+        if self.runner.cpu_cores:
+            # Each runtime would otherwise start one thread per host core.
+            env.update(thread_env(self.runner.cpu_cores))
+        return env
 
-        self.main_states[self.worker_id]['status'] = 'training'
-        results = {}
-        for step_name, pipeline_config in self.pipelines.items():
-            script_path = self.workdir / pipeline_config['script']
-            script_args = pipeline_config.get('args')
-            
+    def run(self):
+        """Run the pipeline steps as a DAG with prepared environment."""
+        self.reporter.status('training')
+        results = self._run_pipeline_graph(self._step_env())
+        self._finish()
+        return results
+
+    async def run_async(self, executor, remote_executor=None):
+        """
+        Coroutine version of run() for the asyncio engine. Local and detached steps are driven
+        by the event loop; other remote steps block on their SSH channel for their whole run and
+        go to ``remote_executor`` (the host's own pool, default: ``executor``), while short
+        blocking work (cache, cleanup) runs on ``executor``.
+        """
+        loop = asyncio.get_running_loop()
+        self.reporter.status('training')
+        try:
+            results = await self._run_pipeline_graph_async(self._step_env(), executor, remote_executor or executor)
+        except asyncio.CancelledError:
+            self.reporter.status('cancelled')
+            raise
+        await loop.run_in_executor(executor, self._finish)
+        return results
+
+    def request_stop(self):
+        """Stop this instance early: its running steps are terminated and no further step starts."""
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def _stopping(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _finish(self):
+        failed = any(status == 'failed' for status in self.step_status.values())
+        stopped = any(status == 'stopped' for status in self.step_status.values())
+        self.reporter.status('failed' if failed else 'stopped early' if stopped else 'completed')
+        self.runner.release_environment()
+        if self.clean_workdir_after_run:
+            with self.timer.phase('cleanup'):
+                self._clean_workdir()
+
+    def _run_step(self, step_name, additional_env):
+        with self.timer.phase(f"step:{step_name}") as info:
+            result = self._execute_step(step_name, additional_env)
+            info['cached'] = isinstance(result, CachedResult)
+            info.update(self.step_resources.pop(step_name, {}))
+        return result
+
+    async def _run_step_async(self, step_name, additional_env, executor, remote_executor):
+        loop = asyncio.get_running_loop()
+        if self.runner.ssh_client and not self.runner.use_detached():
+            # Remote steps block on their SSH channel: they run on the host's pool, off the shared one.
+            return await loop.run_in_executor(remote_executor, self._run_step, step_name, additional_env)
+
+        with self.timer.phase(f"step:{step_name}") as info:
+            cache_key, cached = await loop.run_in_executor(executor, self._cache_lookup, step_name)
+            info['cached'] = cached is not None
+            if cached:
+                return cached
+
+            log = self.logs.open(step_name, on_line=self._report_log_line)
+            recorder = self._resource_recorder(step_name)
+            try:
+                result = await self.runner.run_script_async(
+                    self.code_dir / self.pipelines[step_name]['script'],
+                    args=self.pipelines[step_name].get('args'),
+                    additional_env=additional_env,
+                    log=log,
+                    timeout=self.pipelines[step_name].get('timeout'),
+                    on_sample=recorder,
+                    on_metric=self._metric_sink(step_name),
+                    stop=self.stop_event,
+                    fork_server=self.pipelines[step_name].get('fork_server')
+                )
+            finally:
+                log.close()
+                recorder.close()
+            info.update(recorder.summary())
+
+            await loop.run_in_executor(executor, self._cache_store, step_name, cache_key, result)
+        return result
+
+    def _execute_step(self, step_name, additional_env):
+        cache_key, cached = self._cache_lookup(step_name)
+        if cached:
+            return cached
+
+        pipeline_config = self.pipelines[step_name]
+        log = self.logs.open(step_name, on_line=self._report_log_line)
+        recorder = self._resource_recorder(step_name)
+        try:
             result = self.runner.run_script(
-                script_path, 
-                args=script_args, 
-                additional_env=additional_env
+                self.code_dir / pipeline_config['script'], 
+                args=pipeline_config.get('args'), 
+                additional_env=additional_env,
+                log=log,
+                timeout=pipeline_config.get('timeout'),
+                on_sample=recorder,
+                on_metric=self._metric_sink(step_name),
+                stop=self.stop_event,
+                fork_server=pipeline_config.get('fork_server')
             )
-            results[step_name] = result
-        
-        self.main_states[self.worker_id]['status'] = 'completed'
-        if self.clean_workdir_after_run:
-            self._clean_workdir()
+        finally:
+            log.close()
+            recorder.close()
+        self.step_resources[step_name] = recorder.summary()
+
+        self._cache_store(step_name, cache_key, result)
+        return result
+
+    def _cache_lookup(self, step_name):
+        """Return (cache_key, CachedResult or None); the key is None when the step isn't cached."""
+        pipeline_config = self.pipelines[step_name]
+        if not (self.step_cache and pipeline_config.get('cache')):
+            return None, None
+        # Script and requirements are synced from origin_dir, so hash the local copies.
+        cache_key = self.step_cache.key_for(
+            pipeline_config,
+            script_path=self.origin_dir / pipeline_config['script'],
+            requirements_path=self.origin_dir / self.requirements_name,
+            code_dir=self.code_dir,
+            ssh_client=self.runner.ssh_client
+        )
+        if self.step_cache.restore(cache_key, self.workdir, self.runner.ssh_client):
+            return cache_key, CachedResult(cache_key)
+        return cache_key, None
+
+    def _cache_store(self, step_name, cache_key, result):
+        if cache_key and not self._step_failed(result):
+            try:
+                self.step_cache.store(
+                    cache_key, step_name, self.pipelines[step_name].get('outputs') or [], self.workdir, self.runner.ssh_client
+                )
+            except Exception as e:
+                # The step itself succeeded: a cache that can't keep its outputs only costs a rerun later.
+                self.reporter.log(f"[StepCache] Could not cache '{step_name}': {e}")
+
+    def _resource_recorder(self, step_name) -> ResourceRecorder:
+        """Sink for a step's resource samples: a JSONL time series beside its log, plus monitor events."""
+        return ResourceRecorder(self.logs.resources_path_for(step_name), self.reporter, step_name)
+
+    def _metric_sink(self, step_name):
+        """Sink for the metrics a step reports: each becomes a 'metric' event for the early-stopping rules."""
+        if self.stop_event is None:
+            return None
+        counts = {}
+
+        def on_metric(metric):
+            name = str(metric['name'])
+            # Reports without a "step" are numbered in order of arrival.
+            iteration = metric.get('step', counts.get(name, 0))
+            counts[name] = counts.get(name, 0) + 1
+            self.reporter.emit('metric', step=step_name, name=name, value=float(metric['value']), iteration=iteration)
+        return on_metric
+
+    def _report_log_line(self, line):
+        """Publish the latest output line for the monitor, at most once per interval."""
+        now = time.monotonic()
+        if now - self._last_log_update >= self._log_update_interval:
+            self._last_log_update = now
+            self.reporter.log(line)
+
+    def tail(self, step_name, n=20):
+        """Return the last n lines logged by a step."""
+        return self.logs.tail(step_name, n)
+
+    @staticmethod
+    def _step_failed(result) -> bool:
+        return isinstance(result, (subprocess.CalledProcessError, Exception))
+
+    def _ready_steps(self, deps, running_count):
+        """Pending steps whose dependencies all succeeded, in config order, up to the free parallel slots."""
+        if self._stopping():
+            # Stopped early: nothing else starts.
+            for step_name, status in self.step_status.items():
+                if status == 'pending':
+                    self.step_status[step_name] = 'skipped'
+                    self.reporter.step_end(step_name, None, 'skipped')
+            return []
+        ready = []
+        for step_name in self.pipelines:
+            if running_count + len(ready) >= self.max_parallel_steps:
+                break
+            if self.step_status[step_name] == 'pending' and all(self.step_status[dep] == 'done' for dep in deps[step_name]):
+                ready.append(step_name)
+        return ready
+
+    def _start_step(self, step_name):
+        self.step_status[step_name] = 'running'
+        self.reporter.step_start(step_name)
+
+    def _record_step(self, deps, step_name, result):
+        """Mark a finished step; when it failed, everything downstream of it is skipped."""
+        if isinstance(result, EarlyStopped):
+            # What's left is skipped by _ready_steps.
+            self.step_status[step_name] = 'stopped'
+        elif self._step_failed(result):
+            self.step_status[step_name] = 'failed'
+            for downstream in downstream_of(deps, step_name):
+                if self.step_status[downstream] == 'pending':
+                    self.step_status[downstream] = 'skipped'
+                    self.reporter.step_end(downstream, None, 'skipped')
+        else:
+            self.step_status[step_name] = 'done'
+        self.reporter.step_end(step_name, getattr(result, 'returncode', None), self.step_status[step_name])
+
+    def _run_pipeline_graph(self, additional_env):
+        """
+        Start every step whose dependencies have succeeded, up to max_parallel_steps at once.
+        When a step fails, everything downstream of it is skipped.
+        """
+        deps = resolve_dependencies(self.pipelines)
+        results = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_steps) as executor:
+            while True:
+                # Config order decides which ready step goes first.
+                for step_name in self._ready_steps(deps, len(running)):
+                    self._start_step(step_name)
+                    running[executor.submit(self._run_step, step_name, additional_env)] = step_name
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step_name = running.pop(future)
+                    try:
+                        results[step_name] = future.result()
+                    except Exception as e:
+                        results[step_name] = e
+                    self._record_step(deps, step_name, results[step_name])
+
+        return results
+
+    async def _run_pipeline_graph_async(self, additional_env, executor, remote_executor):
+        """Same scheduling as _run_pipeline_graph, with each running step as an asyncio task."""
+        deps = resolve_dependencies(self.pipelines)
+        results = {}
+        running = {}
+
+        try:
+            while True:
+                for step_name in self._ready_steps(deps, len(running)):
+                    self._start_step(step_name)
+                    running[asyncio.ensure_future(self._run_step_async(step_name, additional_env, executor, remote_executor))] = step_name
+
+                if not running:
+                    break
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    step_name = running.pop(task)
+                    try:
+                        results[step_name] = task.result()
+                    except Exception as e:
+                        results[step_name] = e
+                    self._record_step(deps, step_name, results[step_name])
+        finally:
+            # Cancellation: stop the steps still running (local scripts are killed).
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
         return results
 
     def _clean_workdir(self):
-        """Delete all files and subfolders in the workdir (local or remote)."""
-        if self.runner.ssh_client:
-            # Remote clean
-            self.runner.ssh_client.execute(f"rm -rf {self.workdir}/*")
-            self.runner.ssh_client.execute(f"rm -rf {self.workdir}/.* 2>/dev/null || true")  
-        else:
-            # Local clean
-            if self.workdir.exists():
-                for item in self.workdir.iterdir():
-                    if item.is_file():
-                        item.unlink()
-                    else:
-                        shutil.rmtree(item)
+        """
+        Empty the workdir (local or remote), keeping the retained paths. The contents are moved
+        to a trash dir and deleted in the background, so this returns almost immediately.
+        """
+        if self.data_store and not self.shared_from:
+            # The workdir's links go away with it: its blobs become collectable.
+            self.data_store.release(self.workdir)
+        self.cleaner.clean(self.workdir, self.runner.ssh_client)
 
     def close(self):
+        # A sweep leader's environment is in use until all its trials are done.
+        self.runner.release_environment()
         if self.clean_workdir_after_run:
             self._clean_workdir()
\ No newline at end of file
@@ -0,0 +1,28 @@
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+# Tests import the package from the source tree and the helpers next to them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class _MLflowStub(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mlflow_uri():
+    """A stand-in MLflow server that answers the supervisor's liveness check."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _MLflowStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
@@ -0,0 +1,228 @@
+"""
+A stand-in SSH server for tests: paramiko's server side, running each exec request through
+the local shell and serving SFTP from the local filesystem. Any username/password is accepted.
+"""
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def host_key() -> paramiko.RSAKey:
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+class _Session(paramiko.ServerInterface):
+    def __init__(self, server: "LocalSSHServer"):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind != "session":
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        with self.server.lock:
+            # Like sshd's MaxSessions: further channels on the connection are refused.
+            if self.server.open_channels >= self.server.max_sessions:
+                return paramiko.OPEN_FAILED_RESOURCE_SHORTAGE
+            self.server.open_channels += 1
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server._run, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+def _sftp_errors(func):
+    """Report OSErrors to the SFTP client as status codes."""
+    def wrapper(*args):
+        try:
+            return func(*args)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+    return wrapper
+
+
+@_sftp_errors
+def _chattr(path, attr):
+    if attr.st_atime is not None and attr.st_mtime is not None:
+        os.utime(path, (attr.st_atime, attr.st_mtime))
+    if attr.st_mode is not None:
+        os.chmod(path, attr.st_mode)
+    return paramiko.SFTP_OK
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    @_sftp_errors
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return _chattr(self.filename, attr)
+
+
+class _LocalSFTP(paramiko.SFTPServerInterface):
+    """Just enough of an SFTP server for uploads and downloads (put, get, stat, utime, mkdir)."""
+
+    @_sftp_errors
+    def open(self, path, flags, attr):
+        fd = os.open(path, flags | getattr(os, "O_BINARY", 0), attr.st_mode or 0o644)
+        mode = "ab" if flags & os.O_APPEND else "r+b" if flags & (os.O_WRONLY | os.O_RDWR) else "rb"
+        handle = _SFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    @_sftp_errors
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+    @_sftp_errors
+    def lstat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+
+    def chattr(self, path, attr):
+        return _chattr(path, attr)
+
+    @_sftp_errors
+    def mkdir(self, path, attr):
+        os.mkdir(path)
+        return paramiko.SFTP_OK
+
+    @_sftp_errors
+    def remove(self, path):
+        os.remove(path)
+        return paramiko.SFTP_OK
+
+    @_sftp_errors
+    def list_folder(self, path):
+        return [
+            paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name)
+            for name in os.listdir(path)
+        ]
+
+    def canonicalize(self, path):
+        return os.path.abspath(os.path.expanduser(path))
+
+
+class _SFTPServer(paramiko.SFTPServer):
+    def finish_subsystem(self):
+        super().finish_subsystem()
+        with self.server.server.lock:
+            self.server.server.open_channels -= 1
+
+
+class LocalSSHServer:
+    """Listens on 127.0.0.1 (a free port); ``stop()`` takes the host down, dropping its connections."""
+
+    def __init__(self, max_sessions: int = 10):
+        self.max_sessions = max_sessions
+        self.open_channels = 0
+        self.commands = []
+        self.lock = threading.Lock()
+        self._transports = []
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(16)
+        self.port = self._listener.getsockname()[1]
+        self._stopped = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def ssh_config(self) -> dict:
+        return {'hostname': '127.0.0.1', 'port': self.port, 'username': 'test', 'password': 'test', 'timeout': 5}
+
+    def _accept(self):
+        while not self._stopped:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            if self._stopped:
+                sock.close()
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(host_key())
+            transport.set_subsystem_handler("sftp", _SFTPServer, _LocalSFTP)
+            transport.start_server(server=_Session(self))
+            self._transports.append(transport)
+
+    def _run(self, channel, command):
+        with self.lock:
+            self.commands.append(command)
+        process = subprocess.Popen(
+            ["bash", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+        def feed():
+            try:
+                while True:
+                    data = channel.recv(32768)
+                    if not data:
+                        break
+                    process.stdin.write(data)
+                    process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        def drain(stream, send):
+            for chunk in iter(lambda: stream.read1(32768), b""):
+                try:
+                    send(chunk)
+                except OSError:
+                    # Like sshd after a hang-up: the command's next write fails (SIGPIPE).
+                    stream.close()
+                    return
+
+        threads = [
+            threading.Thread(target=feed, daemon=True),
+            threading.Thread(target=drain, args=(process.stdout, channel.sendall), daemon=True),
+            threading.Thread(target=drain, args=(process.stderr, channel.sendall_stderr), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        while process.poll() is None and not channel.closed:
+            threads[1].join(0.05)
+        with self.lock:
+            self.open_channels -= 1
+        if process.poll() is None:
+            # The client hung up. Without a pty sshd sends the command no signal: it keeps running.
+            process.wait()
+            return
+        for thread in threads[1:]:
+            thread.join()
+        try:
+            channel.send_exit_status(process.returncode if process.returncode >= 0 else 128 - process.returncode)
+            channel.close()
+        except OSError:
+            pass
+
+    def stop(self):
+        self._stopped = True
+        # close() alone doesn't wake a thread blocked in accept() on Linux; shutdown() does.
+        try:
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        for transport in self._transports:
+            transport.close()
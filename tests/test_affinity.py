@@ -0,0 +1,47 @@
+from flowkestra.affinity import CpuAllocator, build_cpu_allocator, parse_cpu_list, thread_env
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list("0-3,8, 10-11") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpu_list([3, 1, 1]) == [1, 3]
+    assert parse_cpu_list(None) == []
+    assert set(thread_env([0, 1]).values()) == {"2"}
+
+
+def test_even_layout_gives_disjoint_proportional_shares():
+    allocator = CpuAllocator(cores="0-7", cpu_slots=4)
+    a = allocator.allocate("a", cpus=2)
+    b = allocator.allocate("b", cpus=1)
+    c = allocator.allocate("c", cpus=1)
+    assert (a, b, c) == ([0, 1, 2, 3], [4, 5], [6, 7])
+    allocator.release("b")
+    assert allocator.allocate("d", cpus=1) == [4, 5]
+
+
+def test_full_host_shares_the_least_loaded_cores():
+    allocator = CpuAllocator(cores="0-3", cpu_slots=4)
+    allocator.allocate("a", cpus=2)
+    allocator.allocate("b", cpus=2)
+    assert allocator.allocate("c", cpus=1) == [0]
+    assert allocator.allocate("d", cpus=2) == [1, 2]
+
+
+def test_explicit_layout_pins_requested_cores():
+    allocator = CpuAllocator(layout="explicit", cores="0-7", cpu_slots=8)
+    assert allocator.allocate("a", cpus=2, cores="6-7") == [6, 7]
+    assert allocator.allocate("b", cpus=2) == [0, 1]
+
+
+def test_numa_layout_keeps_an_instance_on_one_node(monkeypatch):
+    monkeypatch.setattr("flowkestra.affinity.numa_nodes", lambda: [[0, 1, 2, 3], [4, 5, 6, 7]])
+    allocator = CpuAllocator(layout="numa", cores="0-7", cpu_slots=8)
+    assert allocator.allocate("a", cpus=3) == [0, 1, 2]
+    # Node 0 has a single core left: b's two go to node 1.
+    assert allocator.allocate("b", cpus=2) == [4, 5]
+    assert allocator.allocate("c", cpus=2) == [6, 7]
+
+
+def test_build_cpu_allocator_is_off_by_default():
+    assert build_cpu_allocator(None) is None
+    assert build_cpu_allocator({'layout': 'none'}) is None
+    assert build_cpu_allocator({'layout': 'even', 'cores': "0-1"}).cores == [0, 1]
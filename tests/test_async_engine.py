@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+from flowkestra.async_engine import AsyncEngine
+from flowkestra.utils import ssh_pool
+
+
+def _worker(hostname=None, port=22):
+    ssh_client = SimpleNamespace(config=SimpleNamespace(hostname=hostname, port=port, username="u")) if hostname else None
+    return SimpleNamespace(runner=SimpleNamespace(ssh_client=ssh_client))
+
+
+def test_blocking_remote_steps_get_a_pool_per_host():
+    engine = AsyncEngine(supervisor=None)
+    try:
+        assert engine._remote_executor(_worker()) is None
+        a = engine._remote_executor(_worker("a"))
+        assert engine._remote_executor(_worker("a")) is a
+        assert engine._remote_executor(_worker("b")) is not a
+        assert engine._remote_executor(_worker("a", port=2222)) is not a
+        # As many threads as steps may hold channels on the host.
+        assert a._max_workers == ssh_pool.max_channels_per_host - ssh_pool.control_channels
+    finally:
+        for executor in engine.remote_executors.values():
+            executor.shutdown()
@@ -0,0 +1,44 @@
+import pytest
+from pydantic import ValidationError
+
+from flowkestra.dag import downstream_of, find_cycle, resolve_dependencies
+from flowkestra.schema import InstanceConfig
+
+
+def _instance(pipelines):
+    return InstanceConfig(mode="local", workdir=".", target_workdir="/tmp/run", requirements="req.txt",
+                          pipelines=pipelines)
+
+
+def test_steps_without_depends_on_run_in_config_order():
+    deps = resolve_dependencies({'prep': {}, 'train': {}, 'eval': {}})
+    assert deps == {'prep': [], 'train': ['prep'], 'eval': ['train']}
+
+
+def test_declared_dependencies_are_taken_as_given():
+    pipelines = {'prep': {}, 'train_a': {'depends_on': ['prep']}, 'train_b': {'depends_on': ['prep']},
+                 'report': {'depends_on': ['train_a', 'train_b']}}
+    deps = resolve_dependencies(pipelines)
+    assert deps['prep'] == [] and deps['report'] == ['train_a', 'train_b']
+    assert find_cycle(deps) is None
+    assert sorted(downstream_of(deps, 'prep')) == ['report', 'train_a', 'train_b']
+    assert downstream_of(deps, 'train_a') == ['report']
+    assert downstream_of(deps, 'report') == []
+
+
+def test_find_cycle_returns_the_loop():
+    cycle = find_cycle({'a': [], 'b': ['a', 'd'], 'c': ['b'], 'd': ['c']})
+    assert cycle[0] == cycle[-1]
+    assert set(cycle) == {'b', 'c', 'd'}
+    assert find_cycle({'a': ['a']}) == ['a', 'a']
+
+
+def test_config_rejects_unknown_dependencies():
+    with pytest.raises(ValidationError, match="unknown step"):
+        _instance({'train': {'script': "train.py", 'depends_on': ['prep']}})
+
+
+def test_config_rejects_dependency_cycles():
+    with pytest.raises(ValidationError, match="dependency cycle"):
+        _instance({'a': {'script': "a.py", 'depends_on': ['b']}, 'b': {'script': "b.py", 'depends_on': ['a']}})
+    _instance({'a': {'script': "a.py"}, 'b': {'script': "b.py", 'depends_on': ['a']}})
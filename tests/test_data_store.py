@@ -0,0 +1,91 @@
+import shutil
+
+import pytest
+
+import flowkestra.data_store as data_store
+from flowkestra.data_store import BLOBS_DIR, DataStore, build_data_store
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture(params=["local", "remote-tar", "remote-sftp"])
+def store_factory(request, tmp_path):
+    server = client = None
+    if request.param != "local":
+        server = LocalSSHServer()
+        client = SSHClient(server.ssh_config)
+
+    def factory(**kwargs):
+        kwargs.setdefault('transfer', request.param.rsplit("-", 1)[-1] if client else "auto")
+        return DataStore(tmp_path / "store", ssh_client=client, min_size_bytes=1024, **kwargs)
+
+    factory.server = server
+    yield factory
+    if client:
+        client.close()
+        server.stop()
+
+
+@pytest.fixture
+def origin(tmp_path):
+    origin = tmp_path / "src"
+    (origin / "data").mkdir(parents=True)
+    (origin / "data" / "train.bin").write_bytes(b"t" * 4096)
+    (origin / "data" / "copy of train.bin").write_bytes(b"t" * 4096)
+    (origin / "data" / "val.bin").write_bytes(b"v" * 2048)
+    (origin / "main.py").write_text("print('small files are synced as usual')\n")
+    return origin
+
+
+def _blobs(tmp_path):
+    return sorted(p.name for p in (tmp_path / "store" / BLOBS_DIR).glob("*/*"))
+
+
+def test_large_files_are_selected_and_digests_reused(tmp_path, origin, monkeypatch):
+    store = DataStore(tmp_path / "store", min_size_bytes=1024)
+    entries = store.select(origin)
+    assert sorted(entries) == ["data/copy of train.bin", "data/train.bin", "data/val.bin"]
+    assert entries["data/train.bin"]['sha256'] == entries["data/copy of train.bin"]['sha256']
+
+    monkeypatch.setattr(data_store, "file_digest", lambda path: pytest.fail(f"{path} was hashed again"))
+    assert store.select(origin) == entries
+
+
+def test_a_shared_dataset_is_uploaded_once_and_linked(tmp_path, origin, store_factory):
+    store = store_factory()
+    entries = store.select(origin)
+    first = store.stage(origin, tmp_path / "run1", entries)
+    second = store.stage(origin, tmp_path / "run 2", entries)
+    assert (first['uploaded'], second['uploaded']) == (2, 0)
+    assert len(_blobs(tmp_path)) == 2
+
+    for workdir in (tmp_path / "run1", tmp_path / "run 2"):
+        train = workdir / "data" / "train.bin"
+        assert train.read_bytes() == b"t" * 4096
+        assert (workdir / "data" / "copy of train.bin").samefile(train)
+        assert not (workdir / "main.py").exists()
+
+
+def test_unreferenced_blobs_are_collected(tmp_path, origin, store_factory):
+    store = store_factory(max_size_gb=0)
+    entries = store.select(origin)
+    store.stage(origin, tmp_path / "run1", entries)
+    kept = {rel: entry for rel, entry in entries.items() if rel == "data/val.bin"}
+    store.stage(origin, tmp_path / "run2", kept)
+
+    store.release(tmp_path / "run1")
+    store.collect()
+    # Still linked from run1's workdir.
+    assert len(_blobs(tmp_path)) == 2
+
+    shutil.rmtree(tmp_path / "run1")
+    store.collect()
+    assert _blobs(tmp_path) == [kept["data/val.bin"]['sha256']]
+    assert (tmp_path / "run2" / "data" / "val.bin").read_bytes() == b"v" * 2048
+
+
+def test_disabled_store_is_not_built():
+    assert build_data_store(None) is None
+    assert build_data_store({'enabled': False, 'store_dir': "~/store"}) is None
+    store = build_data_store({'enabled': True, 'store_dir': "~/store", 'min_size_kb': 2}, sync_config={'transfer': "sftp"})
+    assert (store.min_size_bytes, store.transfer) == (2048, "sftp")
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from flowkestra.early_stopping import EarlyStopped
+from flowkestra.runner import Runner
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture
+def runner(tmp_path):
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    # The "host" is this machine, with the test interpreter as its venv.
+    (tmp_path / "venv" / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, tmp_path / "venv" / "bin" / "python")
+    runner = Runner(tmp_path, ssh_client=client, stop_grace=1, detached={'enabled': True, 'poll_interval': 0.2})
+    runner.remote_is_windows = False
+    yield runner
+    client.close()
+    server.stop()
+
+
+def _sleeper(tmp_path):
+    script = tmp_path / "sleep.py"
+    script.write_text("import time\nprint('started', flush=True)\ntime.sleep(60)\n")
+    return script
+
+
+def _job_dirs(tmp_path):
+    jobs = tmp_path / ".flowkestra-jobs"
+    return list(jobs.iterdir()) if jobs.exists() else []
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_detached_step_runs_to_completion(runner, tmp_path):
+    script = tmp_path / "hello.py"
+    script.write_text("print('hello')\n")
+    result = runner.run_script(script)
+    assert result.returncode == 0
+    _wait_for(lambda: not _job_dirs(tmp_path))
+
+
+def test_timed_out_job_is_untracked_and_reaped(runner, tmp_path):
+    result = runner.run_script(_sleeper(tmp_path), timeout=1)
+    assert isinstance(result, subprocess.TimeoutExpired)
+    assert runner._job_tracker()._jobs == {}
+    _wait_for(lambda: not _job_dirs(tmp_path))
+
+
+def test_stopped_job_is_untracked_and_reaped(runner, tmp_path):
+    stop = threading.Event()
+    threading.Timer(1, stop.set).start()
+    result = runner.run_script(_sleeper(tmp_path), stop=stop)
+    assert isinstance(result, EarlyStopped)
+    assert runner._job_tracker()._jobs == {}
+    _wait_for(lambda: not _job_dirs(tmp_path))
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from flowkestra.early_stopping import (
+    METRICS_FILE_PREFIX, EarlyStopped, EarlyStopper, metric_curves, metric_tail_for, parse_metric_lines
+)
+from flowkestra.runner import Runner
+
+
+def _curve(*values, start=1):
+    return [(start + i, v) for i, v in enumerate(values)]
+
+
+def test_median_rule_stops_a_trial_behind_its_siblings():
+    stopper = EarlyStopper("loss", min_iterations=2, min_peers=2)
+    curves = {
+        'good1': _curve(0.9, 0.5, 0.4),
+        'good2': _curve(0.8, 0.5, 0.3),
+        'bad': _curve(1.0, 0.95, 0.9),
+    }
+    decisions = stopper.decide(curves, ['good1', 'good2', 'bad'])
+    assert list(decisions) == ['bad']
+
+
+def test_median_rule_waits_for_enough_peers_and_iterations():
+    curves = {'a': _curve(0.5, 0.4), 'b': _curve(0.9, 0.9)}
+    assert EarlyStopper("loss", min_peers=2).decide(curves, ['b']) == {}
+    assert EarlyStopper("loss", min_iterations=5, min_peers=1).decide(curves, ['b']) == {}
+
+
+def test_max_mode_prefers_higher_values():
+    stopper = EarlyStopper("acc", mode="max", min_peers=2)
+    curves = {'a': _curve(0.8, 0.9), 'b': _curve(0.7, 0.85), 'c': _curve(0.1, 0.2)}
+    assert list(stopper.decide(curves, ['a', 'b', 'c'])) == ['c']
+
+
+def test_median_rule_skips_siblings_on_another_iteration_grid():
+    curves = {'a': [(1, 0.9), (2, 0.8)], 'b': [(10, 0.5), (20, 0.4)]}
+    assert EarlyStopper("loss", min_peers=1).decide(curves, ['a', 'b']) == {}
+
+
+def test_successive_halving_keeps_the_top_fraction_at_a_rung():
+    stopper = EarlyStopper("loss", rule="successive_halving", min_iterations=2, eta=2)
+    curves = {
+        'a': _curve(0.9, 0.3),
+        'b': _curve(0.9, 0.4),
+        'c': _curve(0.9, 0.8),
+        'd': _curve(0.9, 0.9),
+    }
+    assert sorted(stopper.decide(curves, list(curves))) == ['c', 'd']
+    # A promotion is never taken back, even if later siblings do better at the rung.
+    curves['e'] = _curve(0.1, 0.1)
+    curves['f'] = _curve(0.1, 0.1)
+    assert 'a' not in stopper.decide(curves, ['a'])
+
+
+def test_successive_halving_with_siblings_past_the_rung():
+    stopper = EarlyStopper("loss", rule="successive_halving", min_iterations=1, eta=2)
+    curves = {'a': [(1, 0.9), (2, 0.8)], 'b': [(10, 0.5), (20, 0.4)], 'c': [(1, 0.2), (2, 0.1)]}
+    # b has no value at a's rung (2), so a is ranked against c only.
+    assert list(stopper.decide(curves, ['a', 'b', 'c'])) == ['a']
+
+
+def test_parse_metric_lines_keeps_partial_lines_for_later():
+    data = b'{"name": "loss", "value": 0.5, "step": 1}\nnot json\n{"name": "loss", "value": NaN}\n{"name": "lo'
+    metrics, consumed = parse_metric_lines(data)
+    assert metrics == [{"name": "loss", "value": 0.5, "step": 1}]
+    assert data[consumed:] == b'{"name": "lo'
+
+
+def test_metric_curves_from_the_status_table():
+    table = {'a': {'metrics': {'loss': [[2, 0.4], [1, 0.5]]}}, 'b': {}}
+    assert metric_curves(table, 'loss') == {'a': [(1, 0.5), (2, 0.4)], 'b': []}
+
+
+# ---------- with stub scripts ----------
+@pytest.fixture
+def runner(tmp_path):
+    # A "venv" whose interpreter is the one running the tests.
+    (tmp_path / "venv" / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, tmp_path / "venv" / "bin" / "python")
+    return Runner(tmp_path, metric_interval=0.1, stop_grace=2)
+
+
+def _stub(tmp_path, iterations, delay):
+    script = tmp_path / "train.py"
+    script.write_text(textwrap.dedent(f"""
+        import json, os, time
+        for step in range({iterations}):
+            with open(os.environ["FLOWKESTRA_METRICS_FILE"], "a") as f:
+                f.write(json.dumps({{"name": "loss", "value": 1.0 / (step + 1), "step": step}}) + "\\n")
+            time.sleep({delay})
+    """))
+    return script
+
+
+def test_stub_script_reports_metrics(runner, tmp_path):
+    metrics = []
+    result = runner.run_script(_stub(tmp_path, 3, 0.05), on_metric=metrics.append)
+    assert result.returncode == 0
+    assert [m['step'] for m in metrics] == [0, 1, 2]
+
+
+def test_stub_script_is_stopped_early(runner, tmp_path):
+    metrics, stop = [], threading.Event()
+
+    def on_metric(metric):
+        metrics.append(metric)
+        if len(metrics) >= 2:
+            stop.set()
+
+    start = time.monotonic()
+    result = runner.run_script(_stub(tmp_path, 1000, 0.05), on_metric=on_metric, stop=stop)
+    assert isinstance(result, EarlyStopped)
+    assert time.monotonic() - start < 10
+
+
+def test_metrics_are_not_followed_when_the_script_cannot_start(runner, tmp_path):
+    (tmp_path / "venv" / "bin" / "python").unlink()
+    script = _stub(tmp_path, 1, 0)
+    tail = metric_tail_for(None, runner.metric_interval)
+    with pytest.raises(FileNotFoundError):
+        runner.run_script(script, on_metric=lambda metric: None)
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(runner.run_script_async(script, on_metric=lambda metric: None))
+    assert not tail._watches
+    assert not list(tmp_path.glob(f"{METRICS_FILE_PREFIX}*"))
@@ -0,0 +1,50 @@
+import json
+import time
+
+from flowkestra.events import RESOURCE_HISTORY, StatusChannel
+
+
+def _wait_drained(channel, expected):
+    # multiprocessing.Queue hands items over through a feeder thread.
+    deadline = time.monotonic() + 5
+    count = 0
+    while count < expected and time.monotonic() < deadline:
+        count += channel.drain()
+        time.sleep(0.01)
+    return count
+
+
+def test_events_are_folded_into_the_table(tmp_path):
+    channel = StatusChannel(events_file=tmp_path / "events.jsonl")
+    channel.register("w1", status="queued")
+    seen = []
+    channel.subscribe(lambda event, row: seen.append((event['kind'], row.get('phase'))))
+    reporter = channel.reporter("w1")
+    reporter.phase("running")
+    reporter.step_start("train")
+    reporter.step_end("train", 0, "done")
+    reporter.emit("placement", pool="p", host="a")
+    assert _wait_drained(channel, 4) == 4
+
+    row = channel.table["w1"]
+    assert row['phase'] == "running"
+    assert row['steps']["train"]['state'] == "done"
+    assert row['host'] == "a"
+    assert seen[0] == ("phase", "running")
+    channel.close()
+    lines = (tmp_path / "events.jsonl").read_text().splitlines()
+    assert [json.loads(line)['kind'] for line in lines] == ["phase", "step_start", "step_end", "placement"]
+
+
+def test_memory_stays_bounded_by_the_table():
+    channel = StatusChannel()
+    reporter = channel.reporter("w1")
+    for i in range(RESOURCE_HISTORY * 3):
+        reporter.emit("resources", cpu_percent=i)
+        reporter.log(f"line {i}")
+    _wait_drained(channel, RESOURCE_HISTORY * 6)
+    row = channel.table["w1"]
+    assert len(row['resource_history']) == RESOURCE_HISTORY
+    assert row['last_log'] == f"line {RESOURCE_HISTORY * 3 - 1}"
+    assert not hasattr(channel, "events")
+    channel.close()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+import pytest
+
+from flowkestra import fork_server
+from flowkestra.logs import StepLog
+from flowkestra.runner import Runner
+
+pytestmark = pytest.mark.skipif(not fork_server.supported(), reason="needs fork() and Unix sockets")
+
+
+@pytest.fixture
+def runtime_dir(monkeypatch):
+    # A private socket dir per test, so each test starts its own server. Short, unlike
+    # tmp_path: socket paths are limited to about 100 bytes.
+    path = tempfile.mkdtemp(prefix="fk-")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", path)
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def runner(tmp_path, runtime_dir):
+    (tmp_path / "venv" / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, tmp_path / "venv" / "bin" / "python")
+    return Runner(tmp_path, fork_server={'enabled': True, 'preload': ["decimal"], 'idle_timeout': 5})
+
+
+def _script(tmp_path, body):
+    script = tmp_path / "step.py"
+    script.write_text(textwrap.dedent(body))
+    return script
+
+
+def _run(runner, tmp_path, script, **kwargs):
+    log = StepLog(tmp_path / "logs" / f"{time.monotonic_ns()}.log")
+    result = runner.run_script(script, log=log, **kwargs)
+    log.close()
+    return result, log.tail()
+
+
+def test_steps_are_forked_from_a_preloaded_server(runner, tmp_path, runtime_dir):
+    script = _script(tmp_path, """
+        import os, sys
+        print("preloaded" if "decimal" in sys.modules else "fresh")
+        print(os.getcwd(), sys.argv[1:], os.environ["STEP_VALUE"])
+    """)
+    first, first_out = _run(runner, tmp_path, script, args=["a b"], additional_env={'STEP_VALUE': "1"})
+    second, second_out = _run(runner, tmp_path, script, args=["c"], additional_env={'STEP_VALUE': "2"})
+    assert first.returncode == second.returncode == 0
+    assert first_out[:2] == ["preloaded", f"{tmp_path} ['a b'] 1"]
+    assert second_out[:2] == ["preloaded", f"{tmp_path} ['c'] 2"]
+    sockets = [name for name in os.listdir(os.path.join(runtime_dir, "flowkestra")) if name.endswith(".sock")]
+    assert len(sockets) == 1
+
+
+def test_exit_codes_and_signals_reach_the_caller(runner, tmp_path):
+    failed, _ = _run(runner, tmp_path, _script(tmp_path, "import sys\nsys.exit(3)\n"))
+    assert isinstance(failed, subprocess.CalledProcessError) and failed.returncode == 3
+    raised, output = _run(runner, tmp_path, _script(tmp_path, "raise ValueError('boom')\n"))
+    assert raised.returncode == 1 and "[stderr] ValueError: boom" in output
+    killed, _ = _run(runner, tmp_path, _script(tmp_path, "import os, signal\nos.kill(os.getpid(), signal.SIGTERM)\n"))
+    assert killed.returncode == -15
+
+
+def test_timed_out_step_is_killed(runner, tmp_path):
+    pid_file = tmp_path / "step.pid"
+    script = _script(tmp_path, f"""
+        import os, time
+        open({str(pid_file)!r}, "w").write(str(os.getpid()))
+        time.sleep(60)
+    """)
+    result, _ = _run(runner, tmp_path, script, timeout=3)
+    assert isinstance(result, subprocess.TimeoutExpired)
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail("the forked step outlived its timeout")
+
+
+def test_too_long_socket_path_runs_the_step_without_a_server(runner, tmp_path, monkeypatch):
+    long_dir = tmp_path / ("d" * 100)
+    long_dir.mkdir(mode=0o700)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(long_dir))
+    start = time.monotonic()
+    result, output = _run(runner, tmp_path, _script(tmp_path, "import sys\nprint('decimal' in sys.modules)\n"))
+    assert result.returncode == 0 and output[-1] == "False"
+    assert time.monotonic() - start < 10
+
+
+def test_socket_dir_must_be_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    (tmp_path / "flowkestra").mkdir(mode=0o777)
+    os.chmod(tmp_path / "flowkestra", 0o777)
+    with pytest.raises(PermissionError):
+        fork_server.socket_dir()
+
+
+def test_thread_settings_get_their_own_server():
+    assert fork_server.socket_name("py", ["numpy"]) == fork_server.socket_name("py", ["numpy"])
+    assert fork_server.socket_name("py", ["numpy"]) != fork_server.socket_name("py", ["numpy"], {'OMP_NUM_THREADS': "2"})
@@ -0,0 +1,153 @@
+import os
+import sys
+from concurrent.futures import Future
+
+import pytest
+import yaml
+
+from flowkestra.host_pool import HostPool
+from flowkestra.supervisor import Supervisor
+from flowkestra.utils import SSHClient, ssh_pool
+from flowkestra.venv_cache import COMPLETE_MARKER, VenvCache
+from ssh_server import LocalSSHServer
+
+
+def _pool(*slots, **kwargs):
+    return HostPool("p", [{'name': f"h{i}", 'slots': n, 'ssh': {}} for i, n in enumerate(slots)], **kwargs)
+
+
+# ---------- placement ----------
+def test_placement_prefers_the_least_loaded_host():
+    pool = _pool(2, 2)
+    assert pool.place("a", 1, 0).name == "h0"
+    assert pool.place("b", 1, 0).name == "h1"
+    assert pool.place("c", 1, 0).name == "h0"
+    assert pool.place("d", 1, 0).name == "h1"
+    assert pool.place("e", 1, 0) is None
+    pool.release("b")
+    assert pool.place("e", 1, 0).name == "h1"
+
+
+def test_placement_prefers_hosts_holding_the_instance_cache():
+    pool = _pool(4, 4, affinity={'h1': {"venv:x", "code:y"}})
+    pool.place("busy", 3, 0)  # h0: the least loaded host would otherwise win
+    assert pool.place("a", 1, 0, keys=["venv:x"]).name == "h1"
+
+
+def test_placement_respects_memory():
+    pool = HostPool("p", [{'name': "small", 'slots': 8, 'memory_gb': 4, 'ssh': {}},
+                          {'name': "big", 'slots': 8, 'memory_gb': 64, 'ssh': {}}])
+    assert pool.place("a", 1, 3).name == "small"
+    assert pool.place("b", 1, 3).name == "big"
+
+
+def test_unreachable_host_is_skipped_then_dropped():
+    pool = _pool(1, 1, retry_interval=0, max_failures=2)
+    dead = pool.hosts[0]
+    pool.mark_unreachable(dead)
+    pool.mark_unreachable(dead)
+    assert pool.place("a", 1, 0).name == "h1"
+    assert not pool.exhausted
+    pool.mark_unreachable(pool.hosts[1])
+    pool.mark_unreachable(pool.hosts[1])
+    assert pool.exhausted
+
+
+# ---------- against stand-in SSH servers ----------
+@pytest.fixture
+def servers():
+    servers = [LocalSSHServer() for _ in range(3)]
+    yield servers
+    ssh_pool.close_all()
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch, servers):
+    """A code tree, and a venv cache already holding its environment (so no pip runs)."""
+    # Affinity, history and journal files go under ~/.cache.
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "req.txt").write_text("# nothing to install\n")
+    (src / "step.py").write_text("print('step ran')\n")
+
+    client = SSHClient(servers[0].ssh_config)
+    cache = VenvCache(tmp_path / "venvs", ssh_client=client)
+    venv = cache.cache_dir / cache.key_for(src / "req.txt")
+    client.close()
+    (venv / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, venv / "bin" / "python")
+    (venv / COMPLETE_MARKER).touch()
+    return tmp_path
+
+
+def _supervisor(project, mlflow_uri, hosts, instances=4, dry_run=False, retry_interval=60):
+    config = {
+        'mlflow_uri': mlflow_uri,
+        'experiment_name': "pool",
+        'visualize_progress': False,
+        'venv_cache': {'enabled': True, 'cache_dir': str(project / "venvs")},
+        'logs': {'dir': str(project / "logs")},
+        'host_pools': {'p': {'retry_interval': retry_interval, 'hosts': [
+            {'name': name, 'slots': 1, 'ssh': server.ssh_config} for name, server in hosts
+        ]}},
+        'instances': [
+            {'mode': "remote", 'pool': "p", 'workdir': str(project / "src"), 'target_workdir': str(project / f"run{i}"),
+             'requirements': "req.txt", 'pipelines': {'a': {'script': "step.py"}}}
+            for i in range(instances)
+        ],
+    }
+    path = project / "config.yml"
+    path.write_text(yaml.safe_dump(config))
+    return Supervisor(str(path), visualize_progress=False, dry_run=dry_run)
+
+
+def _step_runs(server):
+    return sum("step.py" in command for command in server.commands)
+
+
+def test_instances_are_spread_over_the_pool(project, mlflow_uri, servers):
+    supervisor = _supervisor(project, mlflow_uri, [("a", servers[0]), ("b", servers[1])])
+    supervisor.run_all()
+    rows = supervisor.status_channel.table.values()
+    assert [row.get('status') for row in rows] == ['completed'] * 4
+    # One slot per host: each takes two instances, one after the other.
+    assert (_step_runs(servers[0]), _step_runs(servers[1])) == (2, 2)
+    assert sorted(row.get('host') for row in rows) == ["a", "a", "b", "b"]
+
+
+def test_work_moves_off_an_unreachable_host(project, mlflow_uri, servers):
+    dead, *alive = servers
+    dead.stop()
+    supervisor = _supervisor(project, mlflow_uri, [("dead", dead), ("a", alive[0]), ("b", alive[1])], instances=3)
+    supervisor.run_all()
+    rows = supervisor.status_channel.table.values()
+    assert [row.get('status') for row in rows] == ['completed'] * 3
+    assert "dead" not in {row.get('host') for row in rows}
+    assert _step_runs(alive[0]) + _step_runs(alive[1]) == 3
+    assert supervisor.host_pools.pools['p'].hosts[0].failures == 1
+
+
+def test_ready_instances_move_when_their_host_goes_down(project, mlflow_uri, servers):
+    supervisor = _supervisor(project, mlflow_uri, [("a", servers[0]), ("b", servers[1])], instances=1, dry_run=True)
+    worker_id = next(iter(supervisor.instance_configs))
+    pools = supervisor.host_pools
+    submitted = []
+
+    def submit(wid):
+        submitted.append(pools.host_of(wid).name)
+        future = Future()
+        future.set_result(None)
+        return future
+
+    setups = {}
+    supervisor._dispatch_setups([worker_id], setups, submit)
+    assert submitted == ["a"]
+    # Set up on a, but a goes down before the instance starts: it is placed again, on b.
+    pools.mark_unreachable(pools.host_of(worker_id))
+    supervisor._dispatch_setups([worker_id], setups, submit)
+    assert worker_id not in setups and pools.host_of(worker_id) is None
+    supervisor._dispatch_setups([worker_id], setups, submit)
+    assert submitted == ["a", "b"]
@@ -0,0 +1,129 @@
+import shutil
+import uuid
+from pathlib import Path
+
+import pytest
+
+from flowkestra.sync import MANIFEST_NAME, IncrementalSync, build_source_manifest
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture
+def client():
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    yield client
+    client.close()
+    server.stop()
+
+
+class _Recorder:
+    def __init__(self, stdin, scripts):
+        self.stdin, self.scripts = stdin, scripts
+
+    def write(self, data):
+        self.scripts.append(data.decode(errors="replace") if isinstance(data, bytes) else data)
+        return self.stdin.write(data)
+
+
+def _sync(origin, workdir, **kwargs):
+    return IncrementalSync(origin, workdir, **kwargs).run()
+
+
+@pytest.mark.parametrize("remote", [False, True])
+def test_only_changed_files_are_transferred(tmp_path, client, remote):
+    origin, workdir = tmp_path / "origin", tmp_path / "work dir"
+    origin.mkdir()
+    names = ["a.py", "it's b.py", "sub/c d.py"]
+    for name in names:
+        (origin / name).parent.mkdir(parents=True, exist_ok=True)
+        (origin / name).write_text(name)
+    ssh_client = client if remote else None
+
+    assert _sync(origin, workdir, ssh_client=ssh_client)['files'] == 3
+    assert _sync(origin, workdir, ssh_client=ssh_client)['unchanged'] == 3
+
+    (origin / "a.py").write_text("changed")
+    (origin / "it's b.py").unlink()
+    (workdir / "output.log").write_text("not ours")
+    stats = _sync(origin, workdir, ssh_client=ssh_client)
+    assert (stats['files'], stats['deleted'], stats['unchanged']) == (1, 1, 1)
+    assert (workdir / "a.py").read_text() == "changed"
+    assert not (workdir / "it's b.py").exists()
+    assert (workdir / "output.log").exists()
+
+
+def test_copy_mode_does_not_share_inodes(tmp_path):
+    origin, workdir = tmp_path / "origin", tmp_path / "work"
+    origin.mkdir()
+    (origin / "a.py").write_text("a")
+    _sync(origin, workdir)
+    (workdir / "a.py").write_text("edited in the workdir")
+    assert (origin / "a.py").read_text() == "a"
+
+
+def test_remote_paths_under_home_are_expanded(tmp_path, client):
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    (origin / "a.py").write_text("a")
+    workdir = f"~/flowkestra-test-{uuid.uuid4().hex[:8]}"
+    try:
+        assert _sync(origin, workdir, ssh_client=client)['files'] == 1
+        assert (Path.home() / workdir[2:] / "a.py").read_text() == "a"
+    finally:
+        shutil.rmtree(Path.home() / workdir[2:], ignore_errors=True)
+
+
+@pytest.mark.parametrize("remote", [False, True])
+def test_only_synced_paths_are_looked_at(tmp_path, client, remote, monkeypatch):
+    origin, workdir = tmp_path / "origin", tmp_path / "work"
+    origin.mkdir()
+    (origin / "a.py").write_text("a")
+    ssh_client = client if remote else None
+    _sync(origin, workdir, ssh_client=ssh_client)
+    (workdir / "venv" / "lib").mkdir(parents=True)
+    (workdir / "venv" / "lib" / "big.so").write_text("retained")
+    # A step that rewrote a synced file gets it back.
+    (workdir / "a.py").write_text("edited by a step")
+
+    glob = Path.glob
+
+    def no_walk(path, pattern):
+        assert not path.is_relative_to(workdir), "the target workdir was walked"
+        return glob(path, pattern)
+
+    monkeypatch.setattr(Path, "glob", no_walk)
+    # Batches reach the host as scripts on stdin: record those.
+    scripts = []
+    pipe = client.pipe
+
+    def recording_pipe(command, writer):
+        def record(stdin):
+            writer(_Recorder(stdin, scripts))
+        return pipe(command, record)
+
+    monkeypatch.setattr(client, "pipe", recording_pipe)
+    stats = _sync(origin, workdir, ssh_client=ssh_client)
+    assert (stats['files'], stats['unchanged']) == (1, 0)
+    assert (workdir / "a.py").read_text() == "a"
+    if remote:
+        assert scripts and not any("find " in script or "walk" in script for script in scripts)
+
+
+def test_manifest_reuses_hashes_of_unchanged_files(tmp_path, monkeypatch):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("b = 1\n")
+    (tmp_path / "secret.env").write_text("TOKEN=x\n")
+    (tmp_path / MANIFEST_NAME).write_text("{}")
+    first = build_source_manifest(tmp_path, exclude={"secret.env"})
+    assert sorted(first) == ["b.py", "pkg/a.py"]
+
+    (tmp_path / "b.py").write_text("b = 22\n")
+    hashed = []
+    monkeypatch.setattr("flowkestra.sync.file_digest", lambda path: hashed.append(path.name) or "new")
+    second = build_source_manifest(tmp_path, previous=first, exclude={"secret.env"})
+    # Only the file whose size changed is read again.
+    assert hashed == ["b.py"]
+    assert second["pkg/a.py"] == first["pkg/a.py"] and second["b.py"]['sha256'] == "new"
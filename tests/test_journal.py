@@ -0,0 +1,94 @@
+import pytest
+import yaml
+
+from flowkestra.journal import JOURNAL_FILE, RunJournal, build_run_journal, run_dir_for
+from flowkestra.supervisor import Supervisor
+
+
+def test_records_fold_back_after_a_restart(tmp_path):
+    journal = RunJournal(tmp_path / JOURNAL_FILE)
+    journal.record('instance', "a", config_hash="h1")
+    journal.record('phase', "a", phase="running")
+    journal.record('setup', "a", venv_path="/venvs/x", host="local")
+    journal.record('step', "a", step="prep", state="done", exit_code=0)
+    journal.record('step', "a", step="train", state="failed", exit_code=3)
+    journal.record('instance', "b", config_hash="h2")
+    journal.record('end', "b", status="completed")
+    journal.close()
+    # Killed mid-write: the cut-short last line is ignored.
+    with open(tmp_path / JOURNAL_FILE, "a") as f:
+        f.write('{"ts": 1, "kind": "step", "inst')
+
+    resumed = RunJournal(tmp_path / JOURNAL_FILE, resume=True)
+    assert resumed.state == journal.state
+    row = resumed.instance("a", "h1")
+    assert row['phase'] == "running" and row['setup'] == {'venv_path': "/venvs/x", 'host': "local"}
+    assert row['steps'] == {'prep': {'state': "done", 'exit_code': 0}, 'train': {'state': "failed", 'exit_code': 3}}
+    assert resumed.instance("b", "h2")['status'] == "completed"
+    # A changed config never resumes the old work.
+    assert resumed.instance("a", "other") is None
+    resumed.close()
+
+
+def test_new_config_or_setup_drops_old_progress(tmp_path):
+    journal = RunJournal(tmp_path / JOURNAL_FILE)
+    journal.record('instance', "a", config_hash="h1")
+    journal.record('step', "a", step="prep", state="done", exit_code=0)
+    journal.record('setup', "a", venv_path="/venvs/y")
+    assert journal.state["a"]['steps'] == {}
+    journal.record('step', "a", step="prep", state="done", exit_code=0)
+    journal.record('instance', "a", config_hash="h2")
+    assert journal.state["a"] == {'steps': {}, 'config_hash': "h2"}
+    journal.close()
+
+
+def test_without_resume_the_journal_starts_over(tmp_path):
+    RunJournal(tmp_path / JOURNAL_FILE).record('instance', "a", config_hash="h1")
+    assert RunJournal(tmp_path / JOURNAL_FILE).state == {}
+    assert RunJournal(tmp_path / JOURNAL_FILE, resume=True).state == {}
+
+
+def test_build_run_journal(tmp_path):
+    assert build_run_journal({'enabled': False}, "run.yml", tmp_path) is None
+    with pytest.raises(ValueError, match="--resume"):
+        build_run_journal({'enabled': False}, "run.yml", tmp_path, resume=True)
+    journal = build_run_journal({}, "run.yml", tmp_path)
+    assert journal.path == run_dir_for("run.yml", tmp_path / "runs") / JOURNAL_FILE
+    journal.close()
+
+
+def _config(tmp_path, mlflow_uri, names):
+    config = {
+        'mlflow_uri': mlflow_uri,
+        'experiment_name': "journal",
+        'visualize_progress': False,
+        'logs': {'dir': str(tmp_path / "logs")},
+        'instances': [
+            {'name': name, 'mode': "local", 'workdir': str(tmp_path), 'target_workdir': str(tmp_path / name),
+             'requirements': "req.txt", 'pipelines': {'a': {'script': "step.py"}}}
+            for name in names
+        ],
+    }
+    path = tmp_path / "config.yml"
+    path.write_text(yaml.safe_dump(config))
+    return str(path)
+
+
+def test_resume_skips_instances_finished_before_the_restart(tmp_path, mlflow_uri, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    path = _config(tmp_path, mlflow_uri, ["done", "todo"])
+    first = Supervisor(path, visualize_progress=False)
+    keys = {first.instance_configs[wid]['name']: key for wid, key in first.instance_keys.items()}
+    first.journal.record('end', keys["done"], status="completed")
+    first.journal.record('end', keys["todo"], status="failed")
+    first.journal.close()
+
+    resumed = Supervisor(path, visualize_progress=False, resume=True)
+    assert resumed.resumed_finished == 1
+    assert [cfg['name'] for cfg in resumed.instance_configs.values()] == ["todo"]
+    resumed.journal.close()
+
+    # Without --resume everything runs again.
+    fresh = Supervisor(path, visualize_progress=False)
+    assert len(fresh.instance_configs) == 2
+    fresh.journal.close()
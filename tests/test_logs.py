@@ -0,0 +1,75 @@
+import os
+import sys
+
+from flowkestra.logs import MAX_PARTIAL_LINE, LogStore, StepLog, tail_file
+from flowkestra.runner import Runner
+
+
+def test_lines_are_split_across_chunks_and_stderr_is_marked(tmp_path):
+    lines = []
+    log = StepLog(tmp_path / "step.log", on_line=lines.append)
+    log.feed('stdout', b"hel")
+    log.feed('stderr', b"oops\n")
+    log.feed('stdout', b"lo\nworld")
+    assert log.tail() == ["[stderr] oops", "hello"]
+    log.close()
+    assert lines == ["[stderr] oops", "hello", "world"]
+    assert (tmp_path / "step.log").read_text().splitlines() == lines
+
+
+def test_memory_keeps_only_the_tail(tmp_path):
+    log = StepLog(tmp_path / "step.log", tail_lines=3)
+    log.feed('stdout', b"".join(b"line %d\n" % i for i in range(100)))
+    log.close()
+    assert log.tail() == ["line 97", "line 98", "line 99"]
+    assert log.tail(1) == ["line 99"]
+    assert len((tmp_path / "step.log").read_text().splitlines()) == 100
+
+
+def test_a_line_without_newlines_is_flushed_in_pieces(tmp_path):
+    log = StepLog(tmp_path / "step.log")
+    log.feed('stdout', b"x" * (MAX_PARTIAL_LINE + 1))
+    assert log.tail() == ["x" * (MAX_PARTIAL_LINE + 1)]
+    assert not log._partial['stdout']
+    log.close()
+
+
+def test_files_rotate_and_old_ones_are_dropped(tmp_path):
+    path = tmp_path / "step.log"
+    log = StepLog(path, max_bytes=100, backup_count=2)
+    for i in range(20):
+        log.feed('stdout', b"%02d %s\n" % (i, b"-" * 40))
+    log.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["step.log", "step.log.1", "step.log.2"]
+    assert all(p.stat().st_size <= 100 + 44 for p in tmp_path.iterdir())
+    assert tail_file(path, 1)[0].startswith("19 ")
+
+
+def test_tail_file_reads_across_blocks(tmp_path):
+    path = tmp_path / "big.log"
+    path.write_text("".join(f"line {i}\n" for i in range(1000)))
+    assert tail_file(path, 3, block_size=16) == ["line 997", "line 998", "line 999"]
+    assert tail_file(tmp_path / "missing.log") == []
+
+
+def test_store_names_logs_safely(tmp_path):
+    store = LogStore(tmp_path, "run 1/a")
+    log = store.open("train: step")
+    log.feed('stdout', b"done\n")
+    log.close()
+    assert store.path_for("train: step") == tmp_path / "run_1_a" / "train__step.log"
+    assert store.tail("train: step") == ["done"]
+
+
+def test_script_output_streams_to_the_log(tmp_path):
+    (tmp_path / "venv" / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, tmp_path / "venv" / "bin" / "python")
+    script = tmp_path / "noisy.py"
+    script.write_text("import sys\nfor i in range(500): print(i)\nprint('bad', file=sys.stderr)\n")
+    log = StepLog(tmp_path / "logs" / "noisy.log", tail_lines=5)
+    result = Runner(tmp_path).run_script(script, log=log)
+    log.close()
+    assert result.returncode == 0
+    assert "[stderr] bad" in log.tail()
+    assert len(log.tail()) == 5
+    assert len((tmp_path / "logs" / "noisy.log").read_text().splitlines()) == 501
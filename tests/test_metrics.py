@@ -0,0 +1,77 @@
+import json
+import queue
+
+import pytest
+
+from flowkestra.events import StatusReporter
+from flowkestra.metrics import PhaseTimer, build_report, percentile, write_json_report, write_prometheus_textfile
+
+
+def _events(events_queue):
+    events = []
+    while not events_queue.empty():
+        events.append(events_queue.get_nowait())
+    return events
+
+
+def test_phases_report_duration_outcome_and_extras():
+    events_queue = queue.Queue()
+    timer = PhaseTimer(StatusReporter("w1", events_queue))
+    with timer.phase("sync", files=3) as info:
+        info['bytes'] = 1024
+    with pytest.raises(RuntimeError):
+        with timer.phase("setup"):
+            raise RuntimeError("pip failed")
+    timer.record("remote_step", 2.5)
+
+    sync, setup, remote = _events(events_queue)
+    assert sync['kind'] == 'timing'
+    assert (sync['phase'], sync['ok'], sync['files'], sync['bytes']) == ("sync", True, 3, 1024)
+    assert sync['duration'] >= 0
+    assert (setup['phase'], setup['ok']) == ("setup", False)
+    assert (remote['phase'], remote['duration']) == ("remote_step", 2.5)
+
+
+def test_timer_without_reporter_is_a_no_op():
+    with PhaseTimer().phase("sync") as info:
+        info['bytes'] = 1
+
+
+def test_percentile_interpolates():
+    assert percentile([5.0], 95) == 5.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([4.0, 1.0, 3.0, 2.0], 100) == 4.0
+
+
+def _table():
+    return {
+        'w1': {'status': 'done', 'timings': [
+            {'phase': 'sync', 'duration': 1.0, 'ts': 101.0, 'ok': True, 'bytes': 10, 'files': 2},
+            {'phase': 'step', 'duration': 4.0, 'ts': 105.0, 'ok': True},
+        ]},
+        'w2': {'status': 'failed', 'timings': [{'phase': 'sync', 'duration': 3.0, 'ts': 203.0, 'ok': True}]},
+        'w3': {'status': 'queued'},
+    }
+
+
+def test_report_has_wall_clock_totals_and_phase_summary():
+    report = build_report(_table(), {'w1': "train-a"})
+    assert report['instances']['w1']['name'] == "train-a"
+    assert report['instances']['w1']['total_seconds'] == 5.0
+    assert report['instances']['w3'] == {'name': 'w3', 'status': 'queued', 'phases': [], 'total_seconds': 0.0}
+    sync = report['summary']['sync']
+    assert (sync['count'], sync['p50'], sync['max'], sync['total']) == (2, 2.0, 3.0, 4.0)
+    assert report['summary']['step']['count'] == 1
+
+
+def test_reports_are_exported(tmp_path):
+    report = build_report(_table(), {'w1': 'train "a"'})
+    json_path = write_json_report(report, tmp_path / "out" / "timings.json")
+    assert json.loads(json_path.read_text())['summary']['sync']['count'] == 2
+
+    prom = write_prometheus_textfile(report, tmp_path / "out" / "flowkestra.prom").read_text()
+    assert 'flowkestra_phase_duration_seconds{instance="train \\"a\\"",phase="sync"} 1.000000' in prom
+    assert 'flowkestra_phase_bytes{instance="train \\"a\\"",phase="sync"} 10' in prom
+    assert 'flowkestra_phase_files{instance="train \\"a\\"",phase="sync"} 2' in prom
+    assert 'flowkestra_phase_duration_quantile_seconds{phase="sync",quantile="0.95"}' in prom
+    assert not list((tmp_path / "out").glob("*.tmp"))
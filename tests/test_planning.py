@@ -0,0 +1,124 @@
+import pytest
+import yaml
+
+from flowkestra.planning import DurationHistory, admission_order, simulate_schedule
+from flowkestra.scheduler import ResourceScheduler
+from flowkestra.supervisor import Supervisor
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    for name in ("prep", "train", "eval"):
+        (tmp_path / f"{name}.py").write_text(f"# {name}\n")
+    return tmp_path
+
+
+def _cfg(workdir, lr="0.1", parallel=1, **deps):
+    pipelines = {name: {'script': f"{name}.py", 'args': [f"--lr={lr}"] if name == "train" else [],
+                        'depends_on': deps.get(name, [])}
+                 for name in ("prep", "train", "eval")}
+    return {'workdir': str(workdir), 'pipelines': pipelines, 'max_parallel_steps': parallel}
+
+
+def _record(history, cfg, host, **durations):
+    for name, key in history.step_keys(cfg).items():
+        history.record_step(key, name, host, durations[name])
+
+
+def test_step_estimate_falls_back_from_host_to_args_to_script(workdir):
+    history = DurationHistory(None)
+    cfg = _cfg(workdir)
+    _record(history, cfg, "h1", prep=1, train=10, eval=2)
+    _record(history, cfg, "h2", prep=3, train=30, eval=4)
+    keys = history.step_keys(cfg)
+    assert history.step_estimate(keys['train'], "train", "h1") == 10
+    assert history.step_estimate(keys['train'], "train", "h3") == 20
+    # A new sweep trial: same script, other args.
+    other = history.step_keys(_cfg(workdir, lr="0.5"))['train']
+    assert other != keys['train'] and history.step_estimate(other, "train", "h1") == 20
+
+
+def test_estimate_is_the_sum_or_the_critical_path(workdir):
+    history = DurationHistory(None)
+    _record(history, _cfg(workdir), "h", prep=1, train=10, eval=2)
+    assert history.estimate(_cfg(workdir), "h") == {'setup': 0.0, 'run': 13}
+    # train and eval both follow prep: the longest chain is prep -> train.
+    parallel = _cfg(workdir, parallel=3, train=["prep"], eval=["prep"])
+    assert history.estimate(parallel, "h") == {'setup': 0.0, 'run': 11}
+    (workdir / "eval.py").write_text("# changed\n")
+    assert DurationHistory(None).estimate(_cfg(workdir), "h") is None
+
+
+def test_record_run_learns_instance_durations_and_survives_a_reload(workdir, tmp_path):
+    history = DurationHistory(tmp_path / "durations.json")
+    cfg = _cfg(workdir)
+    timings = [{'phase': "sync", 'duration': 4.0, 'ts': 104.0},
+               {'phase': "step:prep", 'duration': 1.0, 'ts': 105.0, 'ok': True},
+               {'phase': "step:train", 'duration': 10.0, 'ts': 115.0, 'ok': True},
+               {'phase': "step:eval", 'duration': 2.0, 'ts': 117.0, 'ok': True}]
+    row = {'status': "completed", 'timings': timings,
+           'steps': {name: {'state': "done"} for name in ("prep", "train", "eval")}}
+    history.record_run({'w': cfg}, {'w': row}, {'w': "h"})
+    history.save()
+
+    reloaded = DurationHistory(tmp_path / "durations.json")
+    assert reloaded.estimate(cfg, "h") == {'setup': 4.0, 'run': 13.0}
+    assert reloaded.step_estimate(reloaded.step_keys(cfg)['train'], "train") == 10.0
+
+
+def test_resumed_or_cached_runs_are_not_learned(workdir):
+    history = DurationHistory(None)
+    cfg = _cfg(workdir)
+    timings = [{'phase': f"step:{name}", 'duration': 1.0, 'ts': 1.0, 'ok': True, 'cached': name == "prep"}
+               for name in ("prep", "train", "eval")]
+    row = {'status': "completed", 'timings': timings,
+           'steps': {name: {'state': "done"} for name in ("prep", "train", "eval")}}
+    history.record_run({'w': cfg}, {'w': row}, {'w': "h"}, skip=['w'])
+    assert history.data['instances'] == {}
+    assert history.step_estimate(history.step_keys(cfg)['prep'], "prep") is None
+
+
+def test_admission_order():
+    configs = {'a': {}, 'b': {}, 'c': {'priority': 1}, 'd': {}}
+    estimates = {'a': 10, 'b': 30, 'c': 5, 'd': None}
+    assert admission_order(configs, estimates, 'longest_first') == ['c', 'b', 'a', 'd']
+    assert admission_order(configs, estimates, 'shortest_first') == ['c', 'a', 'd', 'b']
+    assert admission_order(configs, estimates, 'config') == ['c', 'a', 'b', 'd']
+
+
+def test_simulated_schedule_respects_setups_and_capacity():
+    durations = {'a': {'setup': 1, 'run': 10}, 'b': {'setup': 1, 'run': 5}, 'c': {'setup': 2, 'run': 1}}
+    requests = {wid: {'cpus': 1, 'memory_gb': 0, 'local': True} for wid in durations}
+    schedule = simulate_schedule(['a', 'b', 'c'], durations, requests, ResourceScheduler(cpu_slots=2, memory_gb=None), 2)
+    assert schedule['a'] == {'setup_start': 0, 'start': 1, 'end': 11}
+    assert schedule['b'] == {'setup_start': 0, 'start': 1, 'end': 6}
+    # c is set up once a setup slot frees, then waits for a CPU.
+    assert schedule['c'] == {'setup_start': 1, 'start': 6, 'end': 7}
+
+
+def test_plan_predicts_from_history_without_running(workdir, tmp_path, capsys):
+    history_file = tmp_path / "durations.json"
+    history = DurationHistory(history_file)
+    _record(history, _cfg(workdir), "local", prep=60, train=600, eval=60)
+    history.save()
+    config = {
+        'mlflow_uri': "http://127.0.0.1:9",
+        'experiment_name': "plan",
+        'history': {'file': str(history_file)},
+        'scheduler': {'cpu_slots': 1, 'order': "longest_first"},
+        'instances': [
+            {'name': name, 'mode': "local", 'workdir': str(workdir), 'target_workdir': str(tmp_path / name),
+             'requirements': "req.txt", 'pipelines': _cfg(workdir, lr=lr)['pipelines']}
+            for name, lr in (("known", "0.1"), ("new-args", "0.2"))
+        ],
+    }
+    path = tmp_path / "config.yml"
+    path.write_text(yaml.safe_dump(config))
+
+    supervisor = Supervisor(str(path), visualize_progress=False, dry_run=True)
+    assert supervisor.journal is None
+    schedule = supervisor.plan()
+    assert sorted((times['start'], times['end']) for times in schedule.values()) == [(0, 720), (720, 1440)]
+    out = capsys.readouterr().out
+    assert "Predicted makespan: 0:24:00" in out and "no history" not in out
+    assert not (tmp_path / "known").exists()
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from flowkestra.logs import StepLog
+from flowkestra.runner import Runner
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+def _remote_runner(workdir):
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    # The "host" is this machine, with the test interpreter as its venv.
+    (workdir / "venv" / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, workdir / "venv" / "bin" / "python")
+    runner = Runner(workdir, ssh_client=client)
+    runner.remote_is_windows = False
+    return runner, server
+
+
+@pytest.fixture
+def remote_runner(tmp_path):
+    runner, server = _remote_runner(tmp_path)
+    yield runner
+    runner.ssh_client.close()
+    server.stop()
+
+
+def test_remote_command_quotes_workdir_args_and_env(tmp_path):
+    workdir = tmp_path / "it's a dir"
+    runner, server = _remote_runner(workdir)
+    script = workdir / "show.py"
+    script.write_text("import os, sys\nprint(os.getcwd()); print(sys.argv[1:]); print(os.environ['ODD'])\n")
+    odd = "a b' $(touch injected) \"c\""
+    log = StepLog(tmp_path / "logs" / "show.log")
+    try:
+        result = runner.run_script(script, args=["two words", "$HOME"], additional_env={'ODD': odd}, log=log, timeout=30)
+    finally:
+        log.close()
+        runner.ssh_client.close()
+        server.stop()
+    assert result.returncode == 0
+    assert log.tail() == [str(workdir), str(["two words", "$HOME"]), odd]
+    assert not (workdir / "injected").exists()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_timed_out_remote_step_is_killed(remote_runner, tmp_path):
+    script = tmp_path / "sleep.py"
+    script.write_text(f"import os, time\nopen({str(tmp_path / 'pid')!r}, 'w').write(str(os.getpid()))\ntime.sleep(60)\n")
+    result = remote_runner.run_script(script, timeout=2)
+    assert isinstance(result, subprocess.TimeoutExpired)
+    pid = int((tmp_path / "pid").read_text())
+    deadline = time.monotonic() + 10
+    while _alive(pid):
+        assert time.monotonic() < deadline, "the timed-out script is still running"
+        time.sleep(0.1)
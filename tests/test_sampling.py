@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+from flowkestra.sampling import aggregate, find_stragglers, parse_stat
+
+
+def _stat(pid, comm, ppid, ticks=(0, 0, 0, 0), threads=1, rss_pages=0):
+    utime, stime, cutime, cstime = ticks
+    return (f"{pid} ({comm}) S {ppid} {pid} {pid} 0 -1 4194304 100 0 0 0 "
+            f"{utime} {stime} {cutime} {cstime} 20 0 {threads} 0 1000 123456 {rss_pages} 18446744073709551615")
+
+
+def test_parse_stat_handles_odd_command_names():
+    pid, proc = parse_stat(_stat(42, "my) (odd prog", 7, ticks=(10, 5, 3, 2), threads=4, rss_pages=100), 4096)
+    assert pid == 42
+    assert proc == {'ppid': 7, 'cpu_ticks': 20, 'threads': 4, 'rss_bytes': 409600}
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc")
+def test_parse_stat_reads_this_process():
+    with open("/proc/self/stat") as f:
+        pid, proc = parse_stat(f.read(), os.sysconf("SC_PAGE_SIZE"))
+    assert pid == os.getpid()
+    assert proc['ppid'] == os.getppid() and proc['threads'] >= 1 and proc['rss_bytes'] > 0
+
+
+def test_aggregate_sums_each_process_tree():
+    procs = {
+        10: {'ppid': 1, 'cpu_ticks': 100, 'threads': 2, 'rss_bytes': 1000},
+        11: {'ppid': 10, 'cpu_ticks': 50, 'threads': 1, 'rss_bytes': 500},
+        12: {'ppid': 11, 'cpu_ticks': 50, 'threads': 1, 'rss_bytes': 500},
+        20: {'ppid': 1, 'cpu_ticks': 10, 'threads': 1, 'rss_bytes': 10},
+    }
+    io = {10: {'read_bytes': 5, 'write_bytes': 1}, 12: {'read_bytes': 5}}
+    samples = aggregate(procs, io, {'a': 10, 'b': 20, 'gone': 30}, clk_tck=100)
+    assert set(samples) == {'a', 'b'}
+    assert samples['a'] == {'cpu_seconds': 2.0, 'rss_bytes': 2000, 'read_bytes': 10, 'write_bytes': 1,
+                            'threads': 4, 'procs': 3}
+    assert samples['b']['procs'] == 1 and samples['b']['cpu_seconds'] == 0.1
+
+
+def _row(step, cpu, io=0.0, state='running', samples=6):
+    history = [{'step': step, 'cpu_percent': cpu, 'read_rate': io, 'write_rate': 0.0} for _ in range(samples)]
+    return {'resource_history': history, 'steps': {step: {'state': state}}}
+
+
+def test_stragglers_are_flagged_against_their_peers():
+    table = {'a': _row('train', 95), 'b': _row('train', 100), 'c': _row('train', 90),
+             'slow': _row('train', 20), 'io': _row('train', 5, io=1e8)}
+    flagged = find_stragglers(table)
+    assert set(flagged) == {'slow', 'io'}
+    assert flagged['slow']['peer_cpu_percent'] == 92.5 and not flagged['slow']['io_heavy']
+    assert flagged['io']['io_heavy']
+
+
+def test_stragglers_need_enough_running_peers():
+    assert find_stragglers({'a': _row('train', 100), 'slow': _row('train', 10)}) == {}
+    table = {'a': _row('train', 100), 'b': _row('train', 100), 'slow': _row('train', 10, state='done')}
+    assert find_stragglers(table) == {}
+    # Peers are grouped by step: an evaluation is not slow next to training runs.
+    table = {'a': _row('train', 100), 'b': _row('train', 100), 'c': _row('train', 100), 'eval': _row('eval', 10)}
+    assert find_stragglers(table) == {}
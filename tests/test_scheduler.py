@@ -0,0 +1,30 @@
+from flowkestra.scheduler import ResourceScheduler
+
+
+def test_admits_while_cpus_and_memory_fit():
+    scheduler = ResourceScheduler(cpu_slots=4, memory_gb=16)
+    assert scheduler.try_acquire(cpus=2, memory_gb=8)
+    assert scheduler.try_acquire(cpus=2, memory_gb=4)
+    assert not scheduler.try_acquire(cpus=1, memory_gb=0)
+    scheduler.release(cpus=2, memory_gb=8)
+    assert not scheduler.try_acquire(cpus=1, memory_gb=16)
+    assert scheduler.try_acquire(cpus=1, memory_gb=8)
+    assert scheduler.usage() == "cpu 3/4, mem 12/16GB, runs 2"
+
+
+def test_oversized_request_runs_alone():
+    scheduler = ResourceScheduler(cpu_slots=2, memory_gb=4)
+    assert scheduler.try_acquire(cpus=8, memory_gb=64)
+    assert not scheduler.try_acquire(cpus=0, memory_gb=0)
+    scheduler.release(cpus=8, memory_gb=64)
+    assert scheduler.used_cpus == 0 and scheduler.running == 0
+
+
+def test_remote_instances_only_count_against_max_runs():
+    scheduler = ResourceScheduler(cpu_slots=1, memory_gb=1, max_concurrent_runs=3)
+    assert scheduler.try_acquire(cpus=1, memory_gb=1)
+    assert scheduler.try_acquire(cpus=16, memory_gb=64, local=False)
+    assert scheduler.try_acquire(cpus=16, memory_gb=64, local=False)
+    assert not scheduler.try_acquire(cpus=0, memory_gb=0, local=False)
+    scheduler.release(cpus=16, memory_gb=64, local=False)
+    assert scheduler.used_cpus == 1 and scheduler.running == 2
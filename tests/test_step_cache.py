@@ -0,0 +1,122 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from flowkestra.step_cache import META_NAME, StepCache, extract_archive
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture(params=["local", "remote"])
+def ssh_client(request):
+    if request.param == "local":
+        yield None
+        return
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    yield client
+    client.close()
+    server.stop()
+
+
+def test_outputs_with_spaces_and_quotes_round_trip(tmp_path, ssh_client):
+    cache = StepCache(tmp_path / "cache")
+    workdir = tmp_path / "work"
+    (workdir / "out dir").mkdir(parents=True)
+    (workdir / "out dir" / "model's.bin").write_bytes(b"weights")
+    (workdir / "metrics.json").write_text("{}")
+    outputs = ["out dir", "metrics.json"]
+
+    assert cache.store("k", "train", outputs, workdir, ssh_client)
+    restored = tmp_path / "restored"
+    assert cache.restore("k", restored, ssh_client)
+    assert (restored / "out dir" / "model's.bin").read_bytes() == b"weights"
+    assert (restored / "metrics.json").read_text() == "{}"
+
+
+def test_missing_output_is_not_cached(tmp_path, ssh_client):
+    cache = StepCache(tmp_path / "cache")
+    (tmp_path / "work").mkdir()
+    assert not cache.store("k", "train", ["never written"], tmp_path / "work", ssh_client)
+    assert not cache.restore("k", tmp_path / "restored", ssh_client)
+
+
+def test_step_without_outputs_is_not_cached(tmp_path):
+    cache = StepCache(tmp_path / "cache")
+    (tmp_path / "work").mkdir()
+    assert not cache.store("k", "validate", [], tmp_path / "work")
+    assert not cache.restore("k", tmp_path / "restored")
+
+
+def _archive(*members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, linkname in members:
+            info = tarfile.TarInfo(name)
+            if linkname:
+                info.type, info.linkname = tarfile.SYMTYPE, linkname
+                archive.addfile(info)
+            else:
+                info.size = 2
+                archive.addfile(info, io.BytesIO(b"ok"))
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture(params=["filter", "fallback"])
+def extraction(request, monkeypatch):
+    if request.param == "fallback":
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    return request.param
+
+
+@pytest.mark.parametrize("members", [
+    [("../escaped.txt", None)],
+    [("link", "../../escaped.txt")],
+])
+def test_archive_members_cannot_escape_staging(tmp_path, extraction, members):
+    dest = tmp_path / "staging"
+    dest.mkdir()
+    with pytest.raises(tarfile.TarError):
+        with tarfile.open(fileobj=_archive(*members), mode="r|") as archive:
+            extract_archive(archive, dest)
+    assert not (tmp_path / "escaped.txt").exists()
+
+
+def test_absolute_members_stay_in_staging(tmp_path, extraction):
+    dest = tmp_path / "staging"
+    dest.mkdir()
+    outside = tmp_path / "absolute.txt"
+    try:
+        with tarfile.open(fileobj=_archive((str(outside), None)), mode="r|") as archive:
+            extract_archive(archive, dest)
+    except tarfile.TarError:
+        pass  # refused outright (without filters) rather than re-rooted (the 'data' filter)
+    assert not outside.exists()
+
+
+def test_safe_archive_is_extracted(tmp_path, extraction):
+    dest = tmp_path / "staging"
+    dest.mkdir()
+    with tarfile.open(fileobj=_archive(("out/model.bin", None), ("out/latest", "model.bin")), mode="r|") as archive:
+        extract_archive(archive, dest)
+    assert (dest / "out" / "latest").read_bytes() == b"ok"
+
+
+def test_concurrent_store_of_the_same_key_succeeds(tmp_path, monkeypatch):
+    cache = StepCache(tmp_path / "cache")
+    (tmp_path / "work").mkdir()
+    (tmp_path / "work" / "model.bin").write_bytes(b"weights")
+    replace = os.replace
+
+    def lose_the_race(src, dst):
+        # Another worker's store of the same key lands first.
+        os.makedirs(dst)
+        (tmp_path / "cache" / "k" / META_NAME).write_text("{}")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", lose_the_race)
+    assert cache.store("k", "train", ["model.bin"], tmp_path / "work")
+    assert not [p for p in (tmp_path / "cache").iterdir() if ".tmp-" in p.name]
@@ -0,0 +1,86 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from flowkestra.async_engine import AsyncEngine
+from flowkestra.supervisor import Supervisor
+
+SETUP_SECONDS = {'fast': 0.1, 'slow': 2.0}
+
+
+class _FakeWorker:
+    def __init__(self, name, started):
+        self.name = name
+        self.started = started
+        self.ssh_client = None
+        self.runner = SimpleNamespace(ssh_client=None)
+
+    def run(self):
+        self.started[self.name] = time.monotonic()
+
+    async def run_async(self, executor, remote_executor):
+        self.run()
+
+
+@pytest.fixture
+def supervisor(tmp_path, monkeypatch, mlflow_uri):
+    # Journal and history files go under ~/.cache.
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    config = {
+        'mlflow_uri': mlflow_uri,
+        'experiment_name': "overlap",
+        'visualize_progress': False,
+        'logs': {'dir': str(tmp_path / "logs")},
+        'scheduler': {'max_concurrent_setups': 3},
+        'instances': [
+            {'name': name, 'mode': "local", 'workdir': str(tmp_path), 'target_workdir': str(tmp_path / name),
+             'requirements': "req.txt", 'pipelines': {'a': {'script': "step.py"}}}
+            for name in ("slow", "fast", "broken")
+        ],
+    }
+    path = tmp_path / "config.yml"
+    path.write_text(yaml.safe_dump(config))
+    supervisor = Supervisor(str(path), visualize_progress=False)
+    supervisor._admission_interval = 0.05
+    supervisor.setups_done, supervisor.started = {}, {}
+
+    def setup_instance(worker_id):
+        name = supervisor._instance_name(worker_id)
+        if name == "broken":
+            raise RuntimeError("pip failed")
+        time.sleep(SETUP_SECONDS[name])
+        supervisor.workers[worker_id] = _FakeWorker(name, supervisor.started)
+        supervisor.setups_done[name] = time.monotonic()
+        return supervisor.workers[worker_id]
+
+    def start_unit(worker_id):
+        unit = threading.Thread(target=supervisor.workers[worker_id].run)
+        unit.start()
+        return unit
+
+    monkeypatch.setattr(supervisor, "_setup_instance", setup_instance)
+    monkeypatch.setattr(supervisor, "_start_unit", start_unit)
+    return supervisor
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_instances_start_as_soon_as_their_own_setup_is_done(supervisor, engine):
+    if engine == "asyncio":
+        AsyncEngine(supervisor).run()
+    else:
+        supervisor._run_admission_loop()
+
+    assert supervisor.started['fast'] < supervisor.setups_done['slow']
+    assert set(supervisor.started) == {"slow", "fast"}
+    # The last events may still be in the queue's feeder thread.
+    deadline = time.monotonic() + 5
+    table = supervisor.status_channel.snapshot()
+    while any(row['phase'] != 'done' for row in table.values()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+        table = supervisor.status_channel.snapshot()
+    statuses = {supervisor._instance_name(wid): row.get('status') for wid, row in table.items()}
+    assert statuses['broken'] == "setup failed: pip failed"
+    assert all(row['phase'] == 'done' for row in table.values())
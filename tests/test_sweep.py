@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from flowkestra.sweep import _sample, expand_matrix, expand_sweep
+
+
+def _sweep(matrix, args=("--lr={lr}", "--bs={bs}")):
+    return {
+        'name': "lr", 'mode': "local", 'workdir': ".", 'target_workdir': "/tmp/sweep", 'requirements': "req.txt",
+        'matrix': matrix, 'pipelines': {'train': {'script': "train.py", 'args': list(args)}},
+    }
+
+
+def test_grid_is_the_cartesian_product():
+    trials = expand_matrix({'mode': 'grid', 'parameters': {'lr': [0.1, 0.01], 'bs': [16, 32, 64]}})
+    assert len(trials) == 6
+    assert trials[0] == {'lr': 0.1, 'bs': 16} and trials[-1] == {'lr': 0.01, 'bs': 64}
+
+
+def test_grid_needs_lists():
+    with pytest.raises(ValueError, match="must be a list"):
+        expand_matrix({'mode': 'grid', 'parameters': {'lr': {'low': 0.1, 'high': 1}}})
+
+
+def test_list_mode_and_unknown_mode():
+    assert expand_matrix({'mode': 'list', 'trials': [{'lr': 1}, {'lr': 2}]}) == [{'lr': 1}, {'lr': 2}]
+    with pytest.raises(ValueError, match="Unknown sweep mode"):
+        expand_matrix({'mode': 'bayes'})
+
+
+def test_random_sampling_is_seeded_and_within_range():
+    matrix = {'mode': 'random', 'seed': 7, 'samples': 50, 'parameters': {
+        'lr': {'low': 1e-4, 'high': 1e-1, 'log': True},
+        'layers': {'low': 1, 'high': 4, 'integer': True},
+        'act': ['relu', 'gelu'],
+    }}
+    trials = expand_matrix(matrix)
+    assert trials == expand_matrix(matrix)
+    assert len(trials) == 50
+    assert all(1e-4 <= t['lr'] <= 1e-1 for t in trials)
+    assert {t['layers'] for t in trials} <= {1, 2, 3, 4} and all(isinstance(t['layers'], int) for t in trials)
+    assert {t['act'] for t in trials} == {'relu', 'gelu'}
+
+
+def test_log_sampling_spreads_over_decades():
+    rng = random.Random(0)
+    values = [_sample({'low': 1e-6, 'high': 1.0, 'log': True}, rng) for _ in range(1000)]
+    # Uniform in log space: about half the draws fall below 1e-3.
+    assert 0.4 < sum(v < 1e-3 for v in values) / len(values) < 0.6
+
+
+def test_expand_sweep_substitutes_args_and_gives_each_trial_a_scratch_dir():
+    instances = expand_sweep(_sweep({'mode': 'list', 'trials': [{'lr': 0.1, 'bs': 8}, {'lr': 0.2, 'bs': 16}]},
+                                    args=("--lr={lr}", "--bs={bs}", "--out={out}")))
+    assert [i['trial'] for i in instances] == ["lr-000", "lr-001"]
+    assert instances[1]['pipelines']['train']['args'] == ["--lr=0.2", "--bs=16", "--out={out}"]
+    assert instances[1]['scratch_dir'] == "/tmp/sweep/trials/lr-001"
+    assert instances[1]['target_workdir'] == "/tmp/sweep" and instances[1]['sweep'] == "lr"
+    assert 'matrix' not in instances[0] and instances[0]['params'] == {'lr': 0.1, 'bs': 8}
+
+
+def test_expand_sweep_rejects_unused_parameters():
+    with pytest.raises(ValueError, match="not used in any args"):
+        expand_sweep(_sweep({'mode': 'grid', 'parameters': {'lr': [1], 'bs': [2], 'wd': [0]}}))
@@ -0,0 +1,84 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+
+import pytest
+
+from flowkestra.sync import (
+    COMPRESS_MIN_BYTES, MANIFEST_NAME, STAT_MANIFEST_PY, choose_compression, sample_files, tar_stream, upload_tree
+)
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+def test_auto_sends_small_payloads_raw():
+    assert choose_compression(1000, "auto", b"a" * 1000) == "none"
+
+
+def test_auto_gzips_large_compressible_payloads():
+    assert choose_compression(COMPRESS_MIN_BYTES * 10, "auto", b"def f(x):\n    return x\n" * 4000) == "gzip"
+
+
+def test_auto_sends_incompressible_payloads_raw():
+    assert choose_compression(COMPRESS_MIN_BYTES * 10, "auto", os.urandom(64 * 1024)) == "none"
+    assert choose_compression(COMPRESS_MIN_BYTES * 10, "auto", None) == "none"
+
+
+def test_auto_never_picks_xz_but_explicit_choices_stand():
+    for size in (COMPRESS_MIN_BYTES, 32 * COMPRESS_MIN_BYTES, 1024 * COMPRESS_MIN_BYTES):
+        assert choose_compression(size, "auto", b"x" * 4096) != "xz"
+    assert choose_compression(10, "xz") == "xz"
+    assert choose_compression(10**10, "none", b"x" * 4096) == "none"
+
+
+def test_sample_files_reads_the_start_of_each_file(tmp_path):
+    (tmp_path / "a").write_bytes(b"a" * 100_000)
+    (tmp_path / "b").write_bytes(b"b" * 10)
+    sample = sample_files([tmp_path / "a", tmp_path / "missing", tmp_path / "b"])
+    assert sample == b"a" * 64 * 1024 + b"b" * 10
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "xz"])
+def test_tar_stream_round_trip(tmp_path, compression):
+    (tmp_path / "f.txt").write_text("hello\n" * 100)
+    buffer = io.BytesIO()
+    with tar_stream(buffer, compression) as archive:
+        archive.add(str(tmp_path / "f.txt"), arcname="f.txt")
+    with tarfile.open(fileobj=io.BytesIO(buffer.getvalue()), mode="r:*") as archive:
+        assert archive.extractfile("f.txt").read() == b"hello\n" * 100
+
+
+@pytest.mark.parametrize("transfer, compression", [("sftp", "auto"), ("tar", "none"), ("tar", "gzip")])
+def test_tar_and_sftp_uploads_give_the_same_tree(tmp_path, transfer, compression):
+    origin = tmp_path / "origin"
+    (origin / "pkg" / "odd dir").mkdir(parents=True)
+    (origin / "pkg" / "odd dir" / "it's.py").write_text("x = 1\n" * 1000)
+    (origin / "run.py").write_text("print('hi')\n")
+    os.utime(origin / "run.py", (1_600_000_000, 1_600_000_000))
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    try:
+        stats = upload_tree(client, origin, tmp_path / "target", transfer=transfer, compression=compression)
+    finally:
+        client.close()
+        server.stop()
+    assert stats['files'] == 2 and stats['transfer'].startswith(transfer)
+    assert (tmp_path / "target" / "pkg" / "odd dir" / "it's.py").read_text() == "x = 1\n" * 1000
+    assert (tmp_path / "target" / "run.py").stat().st_mtime == 1_600_000_000
+
+
+def test_remote_state_stats_only_manifest_paths(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "it's here.txt").write_text("x" * 5)
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "venv" / "big.so").write_text("not in the manifest")
+    os.symlink("sub/it's here.txt", tmp_path / "link")
+    manifest = {"sub/it's here.txt": {}, "link": {}, "deleted.py": {}}
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest))
+    out = subprocess.run([sys.executable, "-c", STAT_MANIFEST_PY], cwd=tmp_path, capture_output=True, text=True).stdout
+    path, size, mtime = out.strip().split("\t")
+    assert (path, size) == ("sub/it's here.txt", "5")
+    assert int(float(mtime)) == int((tmp_path / "sub" / "it's here.txt").stat().st_mtime)
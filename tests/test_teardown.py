@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+from flowkestra.teardown import STALE_TRASH_MINUTES, TRASH_DIR_NAME, WorkdirCleaner, build_workdir_cleaner
+from flowkestra.utils import SSHClient
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture(params=["local", "remote"])
+def ssh_client(request):
+    if request.param == "local":
+        yield None
+        return
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    yield client
+    client.close()
+    server.stop()
+
+
+def _workdir(tmp_path):
+    workdir = tmp_path / "run"
+    for rel in ("venv/bin/python", "data/raw/a.csv", "data/tmp/b", "out/model.pt", "it's odd.txt", ".hidden"):
+        (workdir / rel).parent.mkdir(parents=True, exist_ok=True)
+        (workdir / rel).write_text(rel)
+    return workdir
+
+
+def _tree(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, name), root)
+        for dirpath, dirs, files in os.walk(root) for name in files
+    )
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_only_retained_paths_survive(tmp_path, ssh_client, background):
+    workdir = _workdir(tmp_path)
+    cleaner = WorkdirCleaner(keep=["venv", "data/raw/"], background=background)
+    assert cleaner.clean(workdir, ssh_client) == 4
+    assert _tree(workdir) == ["data/raw/a.csv", "venv/bin/python"]
+    trash = tmp_path / TRASH_DIR_NAME
+    assert _wait_for(lambda: not any(trash.iterdir()))
+
+
+def test_missing_workdir_is_created(tmp_path, ssh_client):
+    workdir = tmp_path / "new" / "run"
+    assert WorkdirCleaner(keep=["venv"], background=False).clean(workdir, ssh_client, ensure_exists=True) == 0
+    assert workdir.is_dir()
+
+
+def test_stale_trash_of_a_crashed_run_is_reaped(tmp_path, ssh_client):
+    stale = tmp_path / TRASH_DIR_NAME / "run-crashed"
+    stale.mkdir(parents=True)
+    (stale / "left.bin").write_text("x")
+    old = time.time() - (STALE_TRASH_MINUTES + 5) * 60
+    os.utime(stale, (old, old))
+    WorkdirCleaner(background=False).clean(_workdir(tmp_path), ssh_client)
+    assert not stale.exists()
+
+
+def test_config_and_instance_keeps_are_merged():
+    cleaner = build_workdir_cleaner({'keep': ["venv"], 'background': False}, keep=["data/cache"])
+    assert cleaner.keep == {"venv", "data/cache"}
+    assert cleaner.ancestors == {"", "data"}
+    assert not cleaner.background
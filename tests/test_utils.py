@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from flowkestra.schema import SSHPoolConfig
+from flowkestra.utils import RemoteCommandError, SSHClient
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture
+def server():
+    server = LocalSSHServer()
+    yield server
+    server.stop()
+
+
+def _stream_in_background(client, command, **kwargs):
+    result = {'output': []}
+
+    def run():
+        result['code'] = client.execute_streaming(command, lambda stream, data: result['output'].append(data), **kwargs)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_run_batch_reports_each_command(server):
+    client = SSHClient(server.ssh_config)
+    results = client.run_batch(["echo one", "false", "echo never"])
+    assert [r.exit_code for r in results] == [0, 1, None]
+    assert results[0].stdout == "one"
+    client.close()
+
+
+def test_batch_runs_on_one_channel_and_isolates_commands(server):
+    client = SSHClient(server.ssh_config)
+    client.host_facts()
+    before = len(server.commands)
+    results = client.run_batch(["cd /", "pwd; echo err >&2", "exit 3", "echo still runs"], stop_on_error=False)
+    assert server.commands[before:] == ["sh -s"]
+    assert results[1].stdout != "/"
+    assert results[1].stderr == "err"
+    assert [r.exit_code for r in results] == [0, 0, 3, 0]
+    assert all(r.duration is not None and r.duration >= 0 for r in results)
+    with pytest.raises(RemoteCommandError, match="exit 3.*exit 3"):
+        results.raise_for_status()
+    client.close()
+
+
+def test_batch_falls_back_to_a_channel_per_command(server, monkeypatch):
+    client = SSHClient(server.ssh_config)
+    monkeypatch.setattr(client, "host_facts", lambda refresh=False: {'os': 'windows'})
+    before = len(server.commands)
+    results = client.run_batch(["echo one", "false", "echo never"])
+    assert server.commands[before:] == ["echo one", "false"]
+    assert [r.exit_code for r in results] == [0, 1, None]
+    assert results.failed.command == "false"
+    client.close()
+
+
+def test_control_commands_do_not_wait_behind_steps(server):
+    client = SSHClient(server.ssh_config, max_channels=4, control_channels=2)
+    steps = [_stream_in_background(client, "sleep 2") for _ in range(3)]
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    output, _ = client.execute("echo control")
+    assert output == "control"
+    assert time.monotonic() - start < 1.5
+
+    # Only two steps fit; the third reports that it is waiting for a channel.
+    waiting = steps[2][1]['output']
+    assert any(b"waiting for a free SSH channel" in chunk for chunk in waiting)
+    for thread, result in steps:
+        thread.join(10)
+        assert result['code'] == 0
+    client.close()
+
+
+def test_step_timeout_counts_from_start_not_from_queueing(server):
+    client = SSHClient(server.ssh_config, max_channels=2, control_channels=1)
+    first = _stream_in_background(client, "sleep 1.5")
+    time.sleep(0.3)
+    second = _stream_in_background(client, "sleep 0.2; echo done", timeout=1)
+    for thread, _ in (first, second):
+        thread.join(10)
+    assert second[1]['code'] == 0
+    assert b"done" in b"".join(second[1]['output'])
+    client.close()
+
+
+def test_streaming_timeout_hangs_up(server):
+    client = SSHClient(server.ssh_config)
+    start = time.monotonic()
+    assert client.execute_streaming("sleep 10", lambda stream, data: None, timeout=0.5) is None
+    assert time.monotonic() - start < 5
+    client.close()
+
+
+def test_pool_config_leaves_channels_for_steps():
+    assert SSHPoolConfig(max_channels_per_host=3, control_channels=2).control_channels == 2
+    with pytest.raises(ValidationError, match="control_channels"):
+        SSHPoolConfig(max_channels_per_host=2, control_channels=2)
+    with pytest.raises(ValidationError, match="control_channels"):
+        SSHPoolConfig(max_channels_per_host=1)
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import pytest
+
+from flowkestra.utils import SSHClient
+from flowkestra.venv_cache import LEASES_DIR, SIZE_MARKER, VenvCache, hold_lock, try_lock
+from ssh_server import LocalSSHServer
+
+
+@pytest.fixture(params=["local", "remote"])
+def ssh_client(request):
+    if request.param == "local":
+        yield None
+        return
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    yield client
+    client.close()
+    server.stop()
+
+
+def _cache(tmp_path, ssh_client=None, **kwargs):
+    cache = VenvCache(tmp_path / "cache", ssh_client=ssh_client, **kwargs)
+    cache._poll_interval = 0.1
+    return cache
+
+
+def _build(venv_path):
+    venv_path.mkdir(parents=True)
+
+
+def test_held_lock_is_not_taken_over_while_its_holder_lives(tmp_path):
+    lock_path = tmp_path / "build.lock"
+    with hold_lock(lock_path, lock_timeout=2):
+        for _ in range(7):
+            time.sleep(0.5)
+            assert not try_lock(lock_path, lock_timeout=2)
+    assert try_lock(lock_path, lock_timeout=2)
+
+
+def test_build_longer_than_lock_timeout_runs_once(tmp_path):
+    cache = _cache(tmp_path, lock_timeout=2)
+    builds, paths = [], []
+
+    def slow_build(venv_path):
+        builds.append(venv_path)
+        time.sleep(3.5)
+        _build(venv_path)
+
+    threads = [
+        threading.Thread(target=lambda: paths.append(cache.ensure(None, slow_build, key="k")))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert len(builds) == 1
+    assert paths == [tmp_path / "cache" / "k"] * 2
+
+
+def test_eviction_skips_leased_entries(tmp_path, ssh_client):
+    cache = _cache(tmp_path, ssh_client, max_entries=1)
+    leased = cache.ensure(None, _build, key="a", lease=True)
+    time.sleep(1.1)  # last-used times have one-second resolution remotely
+    cache.ensure(None, _build, key="b")
+    assert leased.exists()
+
+    cache.release(leased)
+    assert not any((leased / LEASES_DIR).iterdir())
+    time.sleep(1.1)
+    cache.ensure(None, _build, key="c")
+    assert not leased.exists()
+
+
+def test_abandoned_lease_expires(tmp_path):
+    cache = _cache(tmp_path, max_entries=1, lock_timeout=60)
+    leased = cache.ensure(None, _build, key="a", lease=True)
+    # As if the holder died an hour ago.
+    cache._leases.pop(leased)[1].stop()
+    for lease_path in (leased / LEASES_DIR).iterdir():
+        os.utime(lease_path, (time.time() - 3600,) * 2)
+    os.utime(leased / ".flowkestra-last-used", (time.time() - 3600,) * 2)
+    cache.ensure(None, _build, key="b")
+    assert not leased.exists()
+
+
+def _fill(venv_path, size=4096):
+    venv_path.mkdir(parents=True)
+    (venv_path / "lib.so").write_bytes(b"x" * size)
+
+
+def test_sizes_are_recorded_at_build_and_not_walked_again(tmp_path, ssh_client, monkeypatch):
+    cache = _cache(tmp_path, ssh_client, max_entries=4, max_size_gb=1)
+    venv = cache.ensure(None, _fill, key="a")
+    cache.ensure(None, _build, key="b")
+    assert int((venv / SIZE_MARKER).read_text()) >= 4096
+
+    def no_walk(*args, **kwargs):
+        raise AssertionError("venvs were walked")
+
+    monkeypatch.setattr(os, "walk", no_walk)
+    cache.ensure(None, _build, key="a")
+    cache.ensure(None, _build, key="b")
+
+
+def test_size_limit_uses_recorded_sizes(tmp_path, ssh_client):
+    cache = _cache(tmp_path, ssh_client, max_entries=None, max_size_gb=1)
+    old = cache.ensure(None, _build, key="a")
+    (old / SIZE_MARKER).write_text(str(2 * 1024 ** 3))
+    time.sleep(1.1)
+    cache.ensure(None, _build, key="b")
+    assert not old.exists()
+
+
+def test_entries_without_a_recorded_size_are_measured_once(tmp_path, ssh_client):
+    cache = _cache(tmp_path, ssh_client, max_entries=4, max_size_gb=1)
+    venv = cache.ensure(None, _fill, key="a")
+    (venv / SIZE_MARKER).unlink()
+    cache.evict()
+    assert int((venv / SIZE_MARKER).read_text()) >= 4096
@@ -0,0 +1,88 @@
+"""The wheelhouse resolves from find_links only (no_index), so these tests never touch the network."""
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from flowkestra.utils import SSHClient
+from flowkestra.wheelhouse import Wheelhouse
+from ssh_server import LocalSSHServer
+
+PIP = f"{sys.executable} -m pip"
+
+
+def _make_wheel(links_dir):
+    """A minimal pure-Python wheel, written by hand so no build backend has to be fetched."""
+    links_dir.mkdir()
+    dist_info = "tinypkg-0.1.dist-info"
+    files = {
+        "tinypkg/__init__.py": "VALUE = 42\n",
+        f"{dist_info}/METADATA": "Metadata-Version: 2.1\nName: tinypkg\nVersion: 0.1\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    with zipfile.ZipFile(links_dir / "tinypkg-0.1-py3-none-any.whl", "w") as wheel:
+        for name, content in files.items():
+            wheel.writestr(name, content)
+        wheel.writestr(f"{dist_info}/RECORD", "".join(f"{name},,\n" for name in files) + f"{dist_info}/RECORD,,\n")
+
+
+@pytest.fixture
+def requirements(tmp_path):
+    _make_wheel(tmp_path / "links")
+    path = tmp_path / "requirements.txt"
+    path.write_text("tinypkg==0.1\n")
+    return path
+
+
+def test_offline_build_and_install(tmp_path, requirements):
+    wheelhouse = Wheelhouse(tmp_path / "wheels", no_index=True, find_links=[str(tmp_path / "links")])
+    wheel_dir = wheelhouse.prepare(requirements)
+    assert [p.name for p in wheel_dir.glob("*.whl")] == ["tinypkg-0.1-py3-none-any.whl"]
+
+    subprocess.run(
+        [sys.executable, "-m", "pip", "install", "--quiet", "--no-index", "--find-links", str(wheel_dir),
+         "--target", str(tmp_path / "site"), "tinypkg"],
+        check=True
+    )
+    out = subprocess.run([sys.executable, "-c", "import tinypkg; print(tinypkg.VALUE)"],
+                         env={"PYTHONPATH": str(tmp_path / "site")}, capture_output=True, text=True).stdout
+    assert out.strip() == "42"
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="manylinux/musllinux only matter on Linux")
+def test_target_tag_names_the_libc():
+    assert Wheelhouse("unused").target_tag().split()[-1].startswith(("glibc-", "musl"))
+
+
+class _HostWheelhouse(Wheelhouse):
+    """The "host" is this machine: it gets another tag and its own wheelhouse, so it has to build."""
+
+    def __init__(self, host_dir, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.host_dir = host_dir
+
+    def _store(self, ssh_client=None):
+        store = super()._store(ssh_client)
+        if ssh_client:
+            store.cache_dir = self.host_dir
+        return store
+
+    def target_tag(self, ssh_client=None):
+        return super().target_tag() + (" host" if ssh_client else "")
+
+
+def test_host_build_gets_the_find_links(tmp_path, requirements):
+    server = LocalSSHServer()
+    client = SSHClient(server.ssh_config)
+    wheelhouse = _HostWheelhouse(tmp_path / "host-wheels", tmp_path / "wheels", no_index=True,
+                                 find_links=[str(tmp_path / "links")])
+    try:
+        wheel_dir = wheelhouse.prepare(requirements, ssh_client=client, pip=PIP, remote_requirements=requirements)
+    finally:
+        client.close()
+        server.stop()
+    assert wheel_dir.parent == tmp_path / "host-wheels"
+    assert [p.name for p in wheel_dir.glob("*.whl")] == ["tinypkg-0.1-py3-none-any.whl"]
+    build = next(command for command in server.commands if " wheel " in command)
+    assert "--no-index --find-links" in build and "/find-links/" in build